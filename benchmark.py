@@ -0,0 +1,557 @@
+"""
+手柄映射器性能基准
+
+不需要显示器、手柄或真实注入：使用合成的虚拟手柄和空输出后端，
+测量映射热路径的单次开销、1kHz 轮询下的持续吞吐、每周期内存分配、多手柄下的周期开销、宏的定时误差，
+以及冷启动时的导入耗时和从进程启动到第一个事件注入的耗时。
+
+    python benchmark.py                      运行全部基准，结果写入 benchmark_results.json
+    python benchmark.py -o new.json --quick  快速运行（迭代次数减少）
+    python benchmark.py --compare old.json   运行后与 old.json 比较，出现退化时返回非零
+    python benchmark.py --compare old.json new.json   只比较两份已有结果
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import controller_mapper as cm
+from fake_devices import FakeJoystickBackend
+
+RESULT_VERSION = 1
+DEFAULT_OUTPUT = "benchmark_results.json"
+DEFAULT_THRESHOLD = 0.15  # 比基准慢 15% 以上视为退化
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测代码的控制台输出（输出到空设备，不会在内存中累积）"""
+    with open(os.devnull, 'w', encoding='utf-8') as null, contextlib.redirect_stdout(null):
+        try:
+            yield
+        finally:
+            cm.log.flush()
+
+
+def create_engine(input_mode: str = "event", sink=None, rate_hz: int = 1000,
+                  controllers: int = 1) -> cm.MappingEngine:
+    """创建使用合成手柄和空输出后端的引擎（不启动线程）"""
+    backend = FakeJoystickBackend(controllers=controllers)
+    controller = cm.ControllerHandler(input_mode, backend=backend,
+                                      calibration_store=cm.CalibrationStore(None))
+    engine = cm.MappingEngine(controller=controller, rate_hz=rate_hz, sink=sink or cm.NullSink())
+    engine.mouse_motion.threaded = False
+    engine.set_mapping("A", {"action_type": cm.ACTION_MOUSE_LEFT})
+    engine.set_mapping("B", {"action_type": cm.ACTION_KEYBOARD, "keyboard_key": "a"})
+    engine.set_mapping("X", {"action_type": cm.ACTION_MOUSE_CLICK, "mouse_x": "100", "mouse_y": "200"})
+    engine.set_mapping("Y", {"action_type": cm.ACTION_MOUSE_RIGHT})
+    with quiet():
+        controller.initialize()
+        engine.check_controller_status()  # 登记全部手柄
+        engine.start_mapping()
+    return engine
+
+
+def measure(func, iterations: int, repeat: int = 5) -> float:
+    """多次重复执行，取最快一轮的单次耗时（微秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            func()
+        elapsed = (time.perf_counter_ns() - start) / iterations / 1000
+        best = min(best, elapsed)
+    return best
+
+
+def bench_hot_path(scale: float) -> dict:
+    """热路径单次开销"""
+    results = {}
+    with quiet():
+        engine = create_engine()
+        controller = engine.controller
+        n = max(int(20000 * scale), 100)
+
+        controller.poll()
+        results["get_button_states_us"] = measure(controller.get_button_states, n)
+        results["get_joystick_axes_us"] = measure(controller.get_joystick_axes, n)
+        results["poll_event_us"] = measure(controller.poll, n)
+        controller.set_input_mode("poll")
+        results["poll_sampled_us"] = measure(controller.poll, n)
+        controller.set_input_mode("event")
+
+        frame = controller.poll()
+        # LT 按下时摇杆才会移动鼠标
+        frame.buttons |= cm.BUTTON_BITS["LT"]
+        results["handle_joystick_mouse_us"] = measure(lambda: engine.handle_joystick_mouse(frame), n)
+
+        bit = cm.BUTTON_NAMES.index("B")
+        executor = engine.executor
+
+        def execute_and_flush():
+            engine.execute_action(bit)
+            executor.flush()
+
+        results["execute_action_us"] = measure(execute_and_flush, n)
+
+        motion = engine.mouse_motion
+        motion.set_multiplier(1.0)
+        motion.set_velocity(0.5, -0.3)
+        clock = [0.0]
+
+        def motion_iteration():
+            clock[0] += 0.001
+            motion.main_loop_iteration(clock[0])
+
+        results["main_loop_iteration_us"] = measure(motion_iteration, n)
+        executor.flush()
+        results["engine_tick_us"] = measure(engine.tick, n)
+        executor.flush()
+    return results
+
+
+def bench_multi_controller(scale: float) -> dict:
+    """多手柄：每个引擎周期的开销随手柄数的变化（应近似线性）"""
+    results = {}
+    n = max(int(5000 * scale), 100)
+    for mode in ("event", "poll"):
+        ticks = {}
+        for count in (1, 2, 4, 8):
+            with quiet():
+                engine = create_engine(mode, controllers=count)
+
+                def tick_and_flush():
+                    engine.tick()
+                    engine.executor.flush()
+
+                ticks[count] = measure(tick_and_flush, n)
+                engine.shutdown()
+            results[f"multi_{mode}_tick_{count}pads_us"] = ticks[count]
+        # 每增加一个手柄的边际开销；线性时与手柄数无关
+        results[f"multi_{mode}_us_per_extra_pad"] = (ticks[8] - ticks[1]) / 7
+    return results
+
+
+def bench_hotplug(scale: float) -> dict:
+    """手柄插拔：处理插入事件的那个周期的耗时，以及插入后第几个周期手柄开始参与映射"""
+    results = {}
+    rounds = max(int(50 * scale), 5)
+    for mode in ("event", "poll"):
+        attach_us = []
+        ready_ticks = []
+        with quiet():
+            engine = create_engine(mode)
+            backend = engine.controller.backend
+            for _ in range(20):
+                engine.tick()
+            for _ in range(rounds):
+                joystick = backend.plug()
+                start = time.perf_counter_ns()
+                engine.tick()
+                attach_us.append((time.perf_counter_ns() - start) / 1000)
+                ticks = 1
+                while joystick.instance_id not in engine._by_instance and ticks < 1000:
+                    engine.tick()
+                    ticks += 1
+                ready_ticks.append(ticks)
+                backend.unplug(joystick.instance_id)
+                engine.tick()
+                engine.executor.flush()
+            engine.shutdown()
+        attach_us.sort()
+        results[f"hotplug_{mode}_attach_tick_us"] = attach_us[len(attach_us) // 2]
+        results[f"hotplug_{mode}_attach_tick_max_us"] = attach_us[-1]
+        results[f"hotplug_{mode}_ticks_to_ready"] = max(ready_ticks)
+    return results
+
+
+def bench_profile_switch(scale: float) -> dict:
+    """映射方案：编译一个方案、增量更新一项、切换方案的耗时，以及设置了切换组合键时的周期开销"""
+    results = {}
+    n = max(int(20000 * scale), 100)
+    config = {
+        "version": cm.CONFIG_VERSION,
+        "buttons": {name: {"action": "keyboard", "key": "a"} for name in cm.BUTTON_NAMES},
+        "players": {"2": {"A": {"action": "mouse_left"}}},
+    }
+    with quiet():
+        engine = create_engine()
+        results["profile_load_us"] = measure(lambda: engine.load_profile("bench", config), max(n // 20, 10))
+        # 配置文件被修改时的增量更新：只有一项变化，其余动作对象复用
+        edits = [dict(config, buttons=dict(config["buttons"], A={"action": "keyboard", "key": key})) for key in "xy"]
+        counter = [0]
+
+        def reload_one():
+            counter[0] += 1
+            engine.reload_profile("bench", edits[counter[0] & 1])
+
+        results["profile_reload_one_change_us"] = measure(reload_one, max(n // 20, 10))
+        for index in range(4):
+            engine.load_profile(f"profile{index}", config)
+        names = [f"profile{index}" for index in range(4)]
+
+        def switch():
+            counter[0] += 1
+            engine.switch_profile(names[counter[0] & 3])
+
+        results["profile_switch_us"] = measure(switch, n)
+        engine.display_updates.clear()
+        engine.set_profile_chord(["Back", "RB"])
+
+        def tick_and_flush():
+            engine.tick()
+            engine.executor.flush()
+
+        results["engine_tick_with_chord_us"] = measure(tick_and_flush, n)
+        engine.shutdown()
+    return results
+
+
+class TimestampSink(cm.RecordingSink):
+    """记录后端，额外记录每次提交到达输出后端的时间 [(perf_counter, 该批第一个事件的下标), ...]"""
+
+    def __init__(self):
+        super().__init__()
+        self.arrivals = []
+
+    def _send(self, events):
+        self.arrivals.append((time.perf_counter(), len(self.events)))
+        super()._send(events)
+
+    def event_times(self) -> list:
+        """每个已记录事件到达输出后端的时间"""
+        times = []
+        for index, (at, first) in enumerate(self.arrivals):
+            end = self.arrivals[index + 1][1] if index + 1 < len(self.arrivals) else len(self.events)
+            times.extend([at] * (end - first))
+        return times
+
+
+def macro_lateness(sink: TimestampSink, planned: dict) -> list:
+    """按点击坐标 (宏编号, 0) 找到每次点击，返回实际到达时间与计划时间之差（微秒）
+
+    planned 为 {宏编号: 第k次点击的计划时间列表}。
+    """
+    seen = {}
+    lateness = []
+    for (op, x, y), at in zip(sink.events, sink.event_times()):
+        if op == cm.OUT_MOVE_TO:
+            k = seen.get(x, 0)
+            seen[x] = k + 1
+            lateness.append((at - planned[x][k]) * 1e6)
+    lateness.sort()
+    return lateness
+
+
+def bench_macros(scale: float) -> dict:
+    """宏：单个宏和上千个宏同时执行时，每次点击到达记录后端的时间相对计划时间的误差，以及开始/取消的开销"""
+    results = {}
+    count = max(int(2000 * scale), 100)
+    repeat = 3
+    with quiet():
+        sink = TimestampSink()
+        executor = cm.ActionExecutor(sink)
+        scheduler = cm.MacroScheduler(executor)
+        executor.start()
+        scheduler.start()
+
+        # 单个宏：每 2ms 点击一次，共 200 次
+        single = cm.ButtonMapping.from_dict({
+            "action": "macro", "steps": [{"click": [0, 0]}, {"wait": 2}], "repeat": 200,
+        }).compile(sink)
+        origin = time.perf_counter() + 0.01
+        scheduler.run(single, at=origin)
+        while scheduler.running:
+            time.sleep(0.01)
+        executor.flush()
+        lateness = macro_lateness(sink, {0: [origin + k * single.duration for k in range(200)]})
+        results["macro_single_lateness_p50_us"] = lateness[len(lateness) // 2]
+        results["macro_single_lateness_p99_us"] = lateness[int(len(lateness) * 0.99)]
+
+        # 上千个宏同时执行：按住 Shift、35ms 后点击、松开，重复 3 次，开始时间错开
+        macros = [cm.ButtonMapping.from_dict({
+            "action": "macro", "repeat": repeat,
+            "steps": [{"key_down": "shift"}, {"wait": 35}, {"click": [index, 0]},
+                      {"key_up": "shift"}, {"wait": 10}],
+        }).compile(sink) for index in range(count)]
+        # 先测量开始执行的开销和挂起时占用的内存（开始时间在很久之后，测完全部取消）
+        far = time.perf_counter() + 60.0
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for index, macro in enumerate(macros):
+            scheduler.run(macro, key=index, at=far)
+        results["macro_pending_bytes_per_run"] = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+        scheduler.cancel_all()
+        start = time.perf_counter_ns()
+        for index, macro in enumerate(macros):
+            scheduler.run(macro, key=index, at=far)
+        elapsed = time.perf_counter_ns() - start
+        results["macro_start_us"] = elapsed / count / 1000
+        scheduler.cancel_all()
+
+        # 开始时间留出登记全部宏所需的时间，避免第一批在登记完之前就已过期
+        sink.clear()
+        sink.arrivals.clear()
+        scheduler.reset_stats()
+        base = time.perf_counter() + 0.05 + elapsed / 1e9 * 2
+        for index, macro in enumerate(macros):
+            scheduler.run(macro, key=index, at=base + (index % 50) * 0.001)
+        while scheduler.running:
+            time.sleep(0.01)
+        executor.flush()
+        lateness = macro_lateness(sink, {
+            index: [base + (index % 50) * 0.001 + k * macro.duration + 0.035 for k in range(repeat)]
+            for index, macro in enumerate(macros)})
+        results["macro_concurrent_lateness_p50_us"] = lateness[len(lateness) // 2]
+        results["macro_concurrent_lateness_p99_us"] = lateness[int(len(lateness) * 0.99)]
+        results["macro_concurrent_lateness_max_us"] = lateness[-1]
+
+        # 取消：开始后立即取消（宏还没有注入任何输入）
+        def start_and_cancel():
+            scheduler.run(single, at=time.perf_counter() + 1.0)
+            scheduler.cancel(single)
+
+        results["macro_start_cancel_us"] = measure(start_and_cancel, max(int(5000 * scale), 100))
+        scheduler.stop()
+        executor.stop()
+    return results
+
+
+def bench_allocations(scale: float) -> dict:
+    """每个引擎周期的内存分配（净增块数和瞬时峰值）"""
+    with quiet():
+        engine = create_engine()
+        ticks = max(int(5000 * scale), 100)
+        # 预热，让缓存和惰性创建的对象先就位
+        for _ in range(200):
+            engine.tick()
+            engine.executor.flush()
+
+        blocks_before = sys.getallocatedblocks()
+        for _ in range(ticks):
+            engine.tick()
+            engine.executor.flush()
+        blocks_after = sys.getallocatedblocks()
+
+        tracemalloc.start()
+        peak_total = 0
+        for _ in range(min(ticks, 1000)):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            engine.tick()
+            engine.executor.flush()
+            peak_total += tracemalloc.get_traced_memory()[1] - current
+        tracemalloc.stop()
+
+    return {
+        "net_blocks_per_tick": (blocks_after - blocks_before) / ticks,
+        "peak_bytes_per_tick": peak_total / min(ticks, 1000),
+    }
+
+
+def bench_throughput(seconds: float) -> dict:
+    """1kHz 轮询下的持续吞吐：真实线程、真实调度器，只有输入和输出是合成的"""
+    with quiet():
+        engine = create_engine(rate_hz=1000)
+        engine.mouse_motion.threaded = True
+        cpu_start = time.process_time()
+        engine.start()
+        engine.post_command("start")
+        time.sleep(seconds)
+        stats = engine.timing_stats()["engine"]
+        engine.shutdown()
+        cpu = time.process_time() - cpu_start
+    ticks = max(stats["ticks"], 1)
+    return {
+        "throughput_1khz_achieved_hz": stats["achieved_hz"],
+        "throughput_1khz_missed_ratio": stats["missed"] / ticks,
+        "throughput_1khz_jitter_p99_ms": stats["jitter_p99_ms"],
+        "throughput_1khz_cpu_us_per_tick": cpu / ticks * 1e6,
+    }
+
+
+# 冷启动时不应被导入的重量级模块（只有选用对应后端时才加载）
+HEAVY_MODULES = ("pygame", "pyautogui", "mouse", "ctypes", "win32con", "numpy", "tkinter")
+
+# 在新进程中测量：导入耗时、导入时加载的重量级模块数、从进程启动到第一个事件注入的耗时
+COLD_START_CODE = """
+import time
+start = time.perf_counter()
+import controller_mapper
+imported = time.perf_counter()
+import json, sys
+heavy = [name for name in {heavy!r} if name in sys.modules]
+import benchmark
+print(json.dumps(benchmark.cold_start(start, imported, len(heavy))))
+"""
+
+
+class FirstEventSink(cm.NullSink):
+    """空输出后端，记录第一个事件到达输出后端的时间"""
+
+    def __init__(self):
+        super().__init__()
+        self.first_event = threading.Event()
+        self.first_event_at = None
+
+    def _mark(self):
+        if self.first_event_at is None:
+            self.first_event_at = time.perf_counter()
+            self.first_event.set()
+
+    def send(self, events):
+        self._mark()
+        super().send(events)
+
+    def emit(self, op, a=0, b=0):
+        self._mark()
+        super().emit(op, a, b)
+
+
+def cold_start(start: float, imported: float, heavy_modules: int) -> dict:
+    """按正常启动流程启动引擎（真实线程、自动启动映射），等待第一个注入事件"""
+    sink = FirstEventSink()
+    with quiet():
+        controller = cm.ControllerHandler("event", backend=FakeJoystickBackend(press_every=1),
+                                          calibration_store=cm.CalibrationStore(None))
+        engine = cm.MappingEngine(controller=controller, sink=sink)
+        engine.set_mapping("A", {"action_type": cm.ACTION_MOUSE_LEFT})
+        engine.start()
+        engine.post_command("auto_start")
+        sink.first_event.wait(5.0)
+        engine.shutdown()
+    results = {
+        "import_ms": (imported - start) * 1000,
+        "import_heavy_modules": heavy_modules,
+    }
+    if sink.first_event_at is not None:
+        results["first_event_ms"] = (sink.first_event_at - start) * 1000
+    return results
+
+
+def bench_startup() -> dict:
+    """启动时间：导入模块、首个事件注入（新进程中取三次最快值）、创建引擎"""
+    code = COLD_START_CODE.format(heavy=HEAVY_MODULES)
+    results = {}
+    for _ in range(3):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ))
+        if output.returncode != 0:
+            continue
+        for name, value in json.loads(output.stdout.strip().splitlines()[-1]).items():
+            results[name] = min(value, results.get(name, value))
+    start = time.perf_counter()
+    with quiet():
+        create_engine().shutdown()
+    results["engine_create_ms"] = (time.perf_counter() - start) * 1000
+    return results
+
+
+# 越大越好的指标（其余指标都是越小越好）
+HIGHER_IS_BETTER = {"throughput_1khz_achieved_hz"}
+
+
+def run_all(quick: bool = False, only=None) -> dict:
+    """运行全部基准，返回可写入 JSON 的结果"""
+    scale = 0.1 if quick else 1.0
+    suites = {
+        "hot_path": lambda: bench_hot_path(scale),
+        "allocations": lambda: bench_allocations(scale),
+        "multi_controller": lambda: bench_multi_controller(scale),
+        "hotplug": lambda: bench_hotplug(scale),
+        "profile_switch": lambda: bench_profile_switch(scale),
+        "macros": lambda: bench_macros(scale),
+        "throughput": lambda: bench_throughput(1.0 if quick else 5.0),
+        "startup": bench_startup,
+    }
+    metrics = {}
+    for name, suite in suites.items():
+        if only and name not in only:
+            continue
+        print(f"运行基准: {name}")
+        metrics.update(suite())
+    return {
+        "version": RESULT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "controller_mapper": cm.__version__,
+        "metrics": metrics,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """比较两份结果，返回退化的指标列表 [(名称, 基准值, 当前值, 变化比例), ...]"""
+    regressions = []
+    print(f"{'指标':<36}{'基准':>14}{'当前':>14}{'变化':>10}")
+    for name, current_value in sorted(current["metrics"].items()):
+        base_value = baseline["metrics"].get(name)
+        if base_value is None:
+            print(f"{name:<36}{'-':>14}{current_value:>14.3f}{'新增':>10}")
+            continue
+        if base_value == 0:
+            change = 0.0 if current_value == 0 else math.inf
+        else:
+            change = (current_value - base_value) / abs(base_value)
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = "  退化" if worse > threshold else ""
+        print(f"{name:<36}{base_value:>14.3f}{current_value:>14.3f}{change:>+10.1%}{flag}")
+        if flag:
+            regressions.append((name, base_value, current_value, change))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="手柄映射器性能基准")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="结果输出文件（JSON）")
+    parser.add_argument("--quick", action="store_true", help="减少迭代次数快速运行")
+    parser.add_argument("--only", nargs="+", choices=("hot_path", "allocations", "multi_controller", "hotplug", "profile_switch", "macros", "throughput", "startup"),
+                        help="只运行指定的基准")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT",
+                        help="与基准结果比较；给出两个文件时只比较不运行")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="判定退化的相对变化阈值（默认 0.15）")
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare 最多接受两个文件")
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+    else:
+        current = run_all(args.quick, args.only)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if not args.compare:
+        for name, value in sorted(current["metrics"].items()):
+            print(f"{name:<36}{value:>14.3f}")
+        return 0
+
+    with open(args.compare[0], 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）")
+        return 1
+    print("未发现性能退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,118 +1,626 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import pygame
-import pyautogui
-import mouse
+import importlib
 import json
+import csv
+import enum
+import mmap
 import os
+import struct
+import sys
 import time
 import threading
 from typing import Dict, Any, Optional
 
 __version__ = "1.1.0"
 
-# 优化PyAutoGUI的性能（保留用于其他功能）
-pyautogui.MINIMUM_DURATION = 0
-pyautogui.MINIMUM_SLEEP = 0
-pyautogui.PAUSE = 0
 
-# 导入Windows API相关模块
-import ctypes
-from ctypes import wintypes
-import win32con
+class _LazyModule:
+    """延迟导入的模块代理 - 第一次访问属性时才导入，只有实际选用的后端才会加载对应模块
+
+    访问过的属性缓存在代理上，之后的读取与直接访问模块属性一样快。
+    """
+
+    def __init__(self, name: str, on_import=None):
+        self._name = name
+        self._on_import = on_import
+        self._module = None
+
+    def _load(self):
+        """导入并返回真实模块（导入失败时抛出原异常，下次访问会重试）"""
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            if self._on_import is not None:
+                self._on_import(module)
+            self._module = module
+        return module
+
+    def _available(self) -> bool:
+        """模块能否导入"""
+        try:
+            self._load()
+            return True
+        except Exception:
+            return False
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+
+def _configure_pyautogui(module):
+    """优化PyAutoGUI的性能（去掉每次调用后的默认停顿）"""
+    module.MINIMUM_DURATION = 0
+    module.MINIMUM_SLEEP = 0
+    module.PAUSE = 0
+
+
+# 重量级依赖都按需导入：pygame 在手柄初始化时、pyautogui / mouse 在选用对应输出后端时、
+# numpy 在校准时、tkinter 在创建界面时才加载
+pygame = _LazyModule("pygame")
+pyautogui = _LazyModule("pyautogui", _configure_pyautogui)
+mouse = _LazyModule("mouse")
+np = _LazyModule("numpy")
+tk = _LazyModule("tkinter")
+ttk = _LazyModule("tkinter.ttk")
+tkfont = _LazyModule("tkinter.font")
+messagebox = _LazyModule("tkinter.messagebox")
+filedialog = _LazyModule("tkinter.filedialog")
+
 import math
 
 # python-ds4项目的鼠标移动实现
-from collections import defaultdict
+from collections import deque
+from array import array
+import atexit
+import heapq
+import itertools
+
+
+LOG_DEBUG, LOG_INFO, LOG_WARNING, LOG_ERROR = 10, 20, 30, 40
+LOG_LEVELS = {"debug": LOG_DEBUG, "info": LOG_INFO, "warning": LOG_WARNING, "error": LOG_ERROR}
+_LOG_LEVEL_NAMES = {value: name.upper() for name, value in LOG_LEVELS.items()}
+
+
+class AsyncLogger:
+    """
+    异步结构化日志
+    调用线程只做级别判断和按消息限流，然后把 (时间, 级别, 线程, 模板, 参数) 追加到环形缓冲区；
+    格式化和写出都在后台线程中进行，控制台输出慢不会拖慢轮询循环。
+    热路径上先判断 debug_enabled 再调用 debug()，未启用时不格式化、也不创建参数元组。
+    """
+
+    CAPACITY = 4096        # 环形缓冲区容量，写满后丢弃最旧的记录
+    FLUSH_INTERVAL = 0.05  # 后台线程写出间隔（秒）
+    RATE_LIMIT = 20        # 同一条消息在一个限流窗口内最多记录的条数
+    RATE_WINDOW = 1.0      # 限流窗口（秒）
+
+    def __init__(self, level: int = LOG_INFO, stream=None, json_format: bool = False,
+                 capacity: int = CAPACITY):
+        # deque 的 append/popleft 是原子操作，多个线程写、后台线程读都无需加锁
+        self._buffer = deque(maxlen=capacity)
+        self._rates = {}  # 消息模板 -> [窗口起点, 窗口内条数, 被抑制条数]
+        self._stream = stream
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self.json_format = json_format
+        self.dropped = 0
+        self.set_level(level)
+
+    def set_level(self, level):
+        """设置最低记录级别（数值或 debug / info / warning / error）"""
+        if isinstance(level, str):
+            if level.lower() not in LOG_LEVELS:
+                raise ValueError(f"不支持的日志级别: {level}，可选 {tuple(LOG_LEVELS)}")
+            level = LOG_LEVELS[level.lower()]
+        self.level = level
+        self.debug_enabled = level <= LOG_DEBUG
+
+    def set_stream(self, stream):
+        """设置输出流（None 表示标准输出）"""
+        self._stream = stream
+
+    def log(self, level: int, template: str, *args):
+        """记录一条消息（模板按 % 格式化，在后台线程中进行）"""
+        if level < self.level:
+            return
+        now = time.time()
+        state = self._rates.get(template)
+        if state is None or now - state[0] >= self.RATE_WINDOW:
+            suppressed = state[2] if state is not None else 0
+            self._rates[template] = [now, 1, 0]
+        elif state[1] < self.RATE_LIMIT:
+            state[1] += 1
+            suppressed = 0
+        else:
+            state[2] += 1
+            return
+
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append((now, level, threading.current_thread().name, template, args, suppressed))
+        if self._thread is None:
+            self._start()
+
+    def debug(self, template: str, *args):
+        self.log(LOG_DEBUG, template, *args)
+
+    def info(self, template: str, *args):
+        self.log(LOG_INFO, template, *args)
+
+    def warning(self, template: str, *args):
+        self.log(LOG_WARNING, template, *args)
+
+    def error(self, template: str, *args):
+        self.log(LOG_ERROR, template, *args)
+
+    def _start(self):
+        """第一次记录时启动后台写出线程"""
+        with self._write_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="AsyncLogger", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        """写出缓冲区中的全部记录"""
+        with self._write_lock:
+            buffer = self._buffer
+            lines = []
+            while buffer:
+                lines.append(self._format(buffer.popleft()))
+            if self.dropped:
+                lines.append(self._format((time.time(), LOG_WARNING, "AsyncLogger",
+                                           "日志缓冲区已满，丢弃 %d 条记录", (self.dropped,), 0)))
+                self.dropped = 0
+            stream = self._stream or sys.stdout
+            if not lines or stream is None:  # 无控制台的窗口程序中 sys.stdout 为 None
+                return
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _format(self, record) -> str:
+        """把一条记录格式化为文本行或 JSON 行"""
+        timestamp, level, thread, template, args, suppressed = record
+        try:
+            message = template % args if args else template
+        except (TypeError, ValueError):
+            message = f"{template} {args!r}"
+        if suppressed:
+            message += f"（已抑制 {suppressed} 条相同消息）"
+        if self.json_format:
+            return json.dumps({"time": round(timestamp, 6), "level": _LOG_LEVEL_NAMES.get(level, str(level)),
+                               "thread": thread, "event": template, "message": message,
+                               "suppressed": suppressed}, ensure_ascii=False)
+        clock = time.strftime("%H:%M:%S", time.localtime(timestamp))
+        return f"{clock}.{int(timestamp % 1 * 1000):03d} {_LOG_LEVEL_NAMES.get(level, level):<7} {message}"
+
+
+# 全局日志（默认只记录 INFO 及以上级别）
+log = AsyncLogger()
+
+
+class PeriodicScheduler:
+    """
+    基于绝对截止时间的周期调度器
+    先用 sleep 睡到截止时间前的一小段，再忙等到截止时间，避免系统睡眠误差和周期漂移；
+    忙等时间不超过周期的 10%，高频率下也不会占满一个核心；
+    同时记录错过的截止时间、周期抖动分位数和实际频率，便于按机器调整频率
+    """
+
+    SPIN_WINDOW = 0.0005   # 截止时间前最后 0.5ms 改为忙等
+    SPIN_FRACTION = 0.1    # 忙等时间占周期的上限
+    HISTORY_SIZE = 2048    # 保留最近的周期样本数
+
+    def __init__(self, rate_hz: float, spin_window: Optional[float] = None):
+        self.spin_window = self.SPIN_WINDOW if spin_window is None else spin_window
+        self._periods = deque(maxlen=self.HISTORY_SIZE)
+        self.set_rate(rate_hz)
+        self.reset()
+
+    def set_rate(self, rate_hz: float):
+        """修改调度频率，从下一个周期开始生效"""
+        if rate_hz <= 0:
+            raise ValueError(f"无效的调度频率: {rate_hz}")
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self._spin = min(self.spin_window, self.period * self.SPIN_FRACTION)
+
+    def reset(self):
+        """以当前时间为起点重新开始调度，并清空统计"""
+        self._deadline = time.perf_counter()
+        self._last_wake = None
+        self._periods.clear()
+        self.ticks = 0
+        self.missed = 0
+        self._started_at = self._deadline
+
+    def resync(self):
+        """以当前时间为起点继续调度（保留统计），用于暂停一段时间后恢复"""
+        self._deadline = time.perf_counter()
+        self._last_wake = None
+
+    def wait(self) -> bool:
+        """等待到下一个截止时间，返回 False 表示该截止时间已经错过"""
+        self._deadline += self.period
+        now = time.perf_counter()
+        on_time = now < self._deadline
+        if on_time:
+            remaining = self._deadline - now
+            if remaining > self._spin:
+                time.sleep(remaining - self._spin)
+            while time.perf_counter() < self._deadline:
+                pass
+            now = time.perf_counter()
+        else:
+            self.missed += 1
+            # 落后超过一个周期时重新对齐，避免连续补帧
+            if now - self._deadline > self.period:
+                self._deadline = now
+
+        if self._last_wake is not None:
+            self._periods.append(now - self._last_wake)
+        self._last_wake = now
+        self.ticks += 1
+        return on_time
+
+    def stats(self) -> Dict[str, float]:
+        """返回调度统计（抖动单位为毫秒，为实际周期与目标周期之差的绝对值）"""
+        periods = sorted(self._periods)
+        jitter = sorted(abs(p - self.period) * 1000 for p in periods)
+
+        def percentile(values, q):
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(q * len(values)))]
+
+        mean_period = sum(periods) / len(periods) if periods else 0.0
+        return {
+            "rate_hz": self.rate_hz,
+            "achieved_hz": 1.0 / mean_period if mean_period else 0.0,
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "jitter_p50_ms": percentile(jitter, 0.50),
+            "jitter_p90_ms": percentile(jitter, 0.90),
+            "jitter_p99_ms": percentile(jitter, 0.99),
+            "jitter_max_ms": jitter[-1] if jitter else 0.0,
+        }
+
+class StickCurve:
+    """
+    摇杆响应曲线
+    死区（径向/按轴）、外死区、曲线形状和速度在配置时预计算为查找表，
+    运行时每个采样只需一次插值查表；加速度为推到高位后随保持时间逐渐增加的额外倍率
+    """
+
+    CURVES = ("linear", "expo", "power", "piecewise")
+    DEADZONE_MODES = ("radial", "axial")
+    LUT_SIZE = 257
+
+    def __init__(self, speed: float = 0.15, deadzone: float = 0.008, deadzone_mode: str = "radial",
+                 outer_deadzone: float = 1.0, curve: str = "linear", exponent: float = 2.0,
+                 expo: float = 0.5, points: Optional[list] = None, accel: float = 0.0,
+                 accel_threshold: float = 0.9, accel_time: float = 0.5):
+        if curve not in self.CURVES:
+            raise ValueError(f"不支持的曲线类型: {curve}，可选 {self.CURVES}")
+        if deadzone_mode not in self.DEADZONE_MODES:
+            raise ValueError(f"不支持的死区模式: {deadzone_mode}，可选 {self.DEADZONE_MODES}")
+        if not 0 <= deadzone < outer_deadzone <= 1:
+            raise ValueError(f"死区范围无效: 内死区 {deadzone}，外死区 {outer_deadzone}")
+        if speed < 0 or exponent <= 0 or not 0 <= expo <= 1 or accel < 0 or accel_time <= 0:
+            raise ValueError("曲线参数超出范围")
+
+        self.speed = float(speed)
+        self.deadzone = float(deadzone)
+        self.deadzone_mode = deadzone_mode
+        self.outer_deadzone = float(outer_deadzone)
+        self.curve = curve
+        self.exponent = float(exponent)
+        self.expo = float(expo)
+        self.points = self._normalize_points(points) if curve == "piecewise" else None
+        self.accel = float(accel)
+        self.accel_threshold = float(accel_threshold)
+        self.accel_time = float(accel_time)
+
+        # 原始偏移量(0~1) -> 速度 的查找表
+        last = self.LUT_SIZE - 1
+        self.lut = array('d', (self._shape(i / last) * self.speed for i in range(self.LUT_SIZE)))
+        # 达到加速阈值的查表值
+        self._accel_level = self.accel_threshold * self.speed
+
+    @staticmethod
+    def _normalize_points(points) -> list:
+        """校验自定义曲线控制点，补齐 (0,0) 和 (1,1) 端点"""
+        if not points:
+            raise ValueError("分段曲线需要至少一个控制点")
+        result = sorted((float(x), float(y)) for x, y in points)
+        for x, y in result:
+            if not (0 <= x <= 1 and 0 <= y <= 1):
+                raise ValueError(f"曲线控制点超出范围: ({x}, {y})")
+        if result[0][0] > 0:
+            result.insert(0, (0.0, 0.0))
+        if result[-1][0] < 1:
+            result.append((1.0, 1.0))
+        return result
+
+    def _shape(self, r: float) -> float:
+        """原始偏移量 -> 归一化输出（0~1），仅在生成查找表时调用"""
+        if r <= self.deadzone:
+            return 0.0
+        t = min((r - self.deadzone) / (self.outer_deadzone - self.deadzone), 1.0)
+        if self.curve == "power":
+            return t ** self.exponent
+        if self.curve == "expo":
+            return (1 - self.expo) * t + self.expo * t ** 3
+        if self.curve == "piecewise":
+            for (x0, y0), (x1, y1) in zip(self.points, self.points[1:]):
+                if t <= x1:
+                    return y0 if x1 == x0 else y0 + (y1 - y0) * (t - x0) / (x1 - x0)
+            return self.points[-1][1]
+        return t
+
+    def lookup(self, r: float) -> float:
+        """查表得到偏移量对应的速度（线性插值）"""
+        if r >= 1.0:
+            return self.lut[-1]
+        pos = r * (self.LUT_SIZE - 1)
+        index = int(pos)
+        low = self.lut[index]
+        return low + (self.lut[index + 1] - low) * (pos - index)
+
+    def is_active(self, x_axis: float, y_axis: float) -> bool:
+        """摇杆是否超出死区"""
+        if self.deadzone_mode == "radial":
+            return x_axis * x_axis + y_axis * y_axis > self.deadzone * self.deadzone
+        return abs(x_axis) > self.deadzone or abs(y_axis) > self.deadzone
+
+    def apply(self, x_axis: float, y_axis: float):
+        """将摇杆轴值映射为速度向量，返回 (vx, vy, 是否达到加速阈值)"""
+        if self.deadzone_mode == "radial":
+            magnitude = math.hypot(x_axis, y_axis)
+            if magnitude <= self.deadzone:
+                return 0.0, 0.0, False
+            value = self.lookup(magnitude)
+            scale = value / magnitude
+            return x_axis * scale, y_axis * scale, value >= self._accel_level
+        vx = math.copysign(self.lookup(abs(x_axis)), x_axis)
+        vy = math.copysign(self.lookup(abs(y_axis)), y_axis)
+        return vx, vy, max(abs(vx), abs(vy)) >= self._accel_level
+
+    def accel_gain(self, held: float) -> float:
+        """根据在加速阈值以上保持的时间计算额外倍率"""
+        if not self.accel:
+            return 1.0
+        return 1.0 + self.accel * min(held / self.accel_time, 1.0)
+
+    @classmethod
+    def from_dict(cls, profile: Dict[str, Any]) -> "StickCurve":
+        """从配置字典创建曲线，未知字段或参数无效时抛出 ValueError"""
+        try:
+            return cls(**profile)
+        except TypeError as e:
+            raise ValueError(f"曲线配置无效: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可保存到配置文件的字典"""
+        profile = {
+            "speed": self.speed, "deadzone": self.deadzone, "deadzone_mode": self.deadzone_mode,
+            "outer_deadzone": self.outer_deadzone, "curve": self.curve,
+            "accel": self.accel, "accel_threshold": self.accel_threshold, "accel_time": self.accel_time,
+        }
+        if self.curve == "power":
+            profile["exponent"] = self.exponent
+        elif self.curve == "expo":
+            profile["expo"] = self.expo
+        elif self.curve == "piecewise":
+            profile["points"] = [list(point) for point in self.points]
+        return profile
+
+
+# 默认的左右摇杆曲线（沿用python-ds4的速度：左摇杆精细控制，右摇杆快速移动）
+DEFAULT_STICK_CURVES = {
+    "left": {"speed": 0.04},
+    "right": {"speed": 0.15},
+}
+
 
 class MouseMotion:
     """
     基于python-ds4项目的鼠标移动实现
-    使用mouse库进行鼠标控制，更加稳定可靠
+    移动和滚轮都提交给动作执行器，由输出后端异步注入
+
+    移动量按实际经过的时间 dt 计算（像素/秒），不足一像素的部分累积到
+    下一次，因此无论循环以 60Hz 还是 1000Hz 运行、唤醒是否延迟，光标速度都一致。
     """
 
-    def __init__(self, state: dict):
-        self.state: dict = state
-        
-        # python-ds4的参数设置
-        self.left_axis_speed = 0.04   # 左摇杆速度（精细控制）
-        self.right_axis_speed = 0.15  # 右摇杆速度（快速移动）
-        self.axis_thr = 0.008         # 死区阈值
+    # python-ds4 以 60Hz 每次移动 轴值*速度*100 像素，换算为每秒像素数时保持相同手感
+    PIXELS_PER_SPEED_UNIT = 100 * 60
+    WHEEL_STEPS_PER_SECOND = 60  # 滚轮模式每秒滚动格数（与原60Hz每次一格一致）
+    MAX_DT = 0.1  # 单次最大时间步长，避免暂停/卡顿后光标跳跃
+    DEFAULT_RATE = 60  # 与python-ds4一致的更新频率
+
+    def __init__(self, executor, rate_hz: float = DEFAULT_RATE, threaded: bool = True):
+        self.executor = executor
+        self.scheduler = PeriodicScheduler(rate_hz)
+        # threaded 为 False 时不启动线程，由调用方按虚拟时钟调用 main_loop_iteration（回放使用）
+        self.threaded = threaded
         
-        # 轴值存储
-        self.axis = defaultdict(lambda: 0)
+        # 每个摇杆的响应曲线（包含速度、死区和加速度）
+        self.curves = {stick: StickCurve(**profile) for stick, profile in DEFAULT_STICK_CURVES.items()}
+        self.stick = "right"
         
-        # 当前轴值（兼容接口）
+        # 当前轴值（兼容接口，写入方使用）
         self.x_axis = 0.0
         self.y_axis = 0.0
+        self.multiplier = 1.0
         
         # 滚轮相关
         self.scroll_mode = False
         self.wheel_direction = 0
         
-        # 启动移动线程
-        threading.Thread(target=self.run, daemon=True).start()
+        # 双缓冲参数：写入方修改上面的字段后整体发布一个不可变元组，
+        # 移动线程每个周期只读取一次引用，不会看到半更新的参数
+        self._params_lock = threading.Lock()
+        self._params = (0.0, 0.0, self.multiplier, 0, self.curves[self.stick])
+        
+        # 时间步长、亚像素余量和加速保持时间
+        self._last_time = None
+        self._remainder_x = 0.0
+        self._remainder_y = 0.0
+        self._wheel_remainder = 0.0
+        self._accel_held = 0.0
+        
+        # 常驻移动线程：未启动或摇杆静止时在条件变量上休眠，不产生空转唤醒
+        self._condition = threading.Condition()
+        self._active = False
+        self._alive = True
+        self._thread = None
+    
+    def _is_moving(self, params) -> bool:
+        """参数是否会产生移动（摇杆超出死区且倍率不为零）"""
+        x_axis, y_axis, multiplier, _, curve = params
+        return multiplier != 0 and curve.is_active(x_axis, y_axis)
     
-    def main_loop_iteration(self):
-        """python-ds4的主循环逻辑"""
-        # 应用死区
-        x_val = self.x_axis if abs(self.x_axis) > self.axis_thr else 0
-        y_val = self.y_axis if abs(self.y_axis) > self.axis_thr else 0
+    def main_loop_iteration(self, now: Optional[float] = None):
+        """python-ds4的主循环逻辑（now 为单调时钟时间，默认取当前时间）"""
+        if now is None:
+            now = time.perf_counter()
+        dt = 0.0 if self._last_time is None else min(now - self._last_time, self.MAX_DT)
+        self._last_time = now
+        x_axis, y_axis, multiplier, wheel_direction, curve = self._params
+        
+        # 通过响应曲线查表得到速度（像素/秒）
+        vx, vy, accelerating = curve.apply(x_axis, y_axis)
+        self._accel_held = self._accel_held + dt if accelerating else 0.0
+        gain = multiplier * self.PIXELS_PER_SPEED_UNIT * curve.accel_gain(self._accel_held)
+        axis0 = vx * gain
+        axis1 = vy * gain
+        
+        if axis0 == 0 and axis1 == 0:
+            # 摇杆回中时清空余量，下次推动从零开始累积
+            self._remainder_x = self._remainder_y = self._wheel_remainder = 0.0
+            return
         
-        # 计算移动量（使用右摇杆速度）
-        axis0 = x_val * self.right_axis_speed
-        axis1 = y_val * self.right_axis_speed
+        if wheel_direction != 0:
+            # 滚轮模式
+            self._wheel_remainder += wheel_direction * self.WHEEL_STEPS_PER_SECOND * dt
+            steps = int(self._wheel_remainder)
+            if steps:
+                self._wheel_remainder -= steps
+                self.executor.submit(WheelAction(steps))
+            return
         
-        if abs(axis0) > 0 or abs(axis1) > 0:
-            if self.scroll_mode and self.wheel_direction != 0:
-                # 滚轮模式
-                mouse.wheel(self.wheel_direction)
-            else:
-                # 鼠标移动模式
-                mouse.move(axis0 * 100, axis1 * 100, absolute=False)
+        # 鼠标移动模式：累积亚像素余量，只提交整数像素（相邻的移动会在执行器队列中合并）
+        self._remainder_x += axis0 * dt
+        self._remainder_y += axis1 * dt
+        move_x = int(self._remainder_x)
+        move_y = int(self._remainder_y)
+        if move_x or move_y:
+            self._remainder_x -= move_x
+            self._remainder_y -= move_y
+            self.executor.move(move_x, move_y)
 
     def run(self):
         """主运行循环"""
-        while self.state['alive']:
-            if self.state.get('sleep', False):
-                time.sleep(0.1)
-                continue
+        while True:
+            with self._condition:
+                if not (self._active and self._is_moving(self._params)):
+                    # 停止或摇杆静止时休眠，直到 start() 或摇杆开始移动时被唤醒
+                    self._remainder_x = self._remainder_y = self._wheel_remainder = 0.0
+                    self._accel_held = 0.0
+                    while self._alive and not (self._active and self._is_moving(self._params)):
+                        self._condition.wait()
+                    self._last_time = None
+                    self.scheduler.reset()
+                if not self._alive:
+                    return
                 
             # 执行鼠标控制逻辑
             self.main_loop_iteration()
             
-            # 60Hz更新频率（与python-ds4一致）
-            time.sleep(1/60)
+            # 按绝对截止时间等待下一周期
+            self.scheduler.wait()
     
-    # 兼容接口
     def start(self):
-        """启动鼠标移动线程（自动启动）"""
-        print("鼠标移动线程已启动（python-ds4版本）")
+        """开始鼠标移动（首次调用时启动常驻线程）"""
+        with self._condition:
+            self._active = True
+            if self._thread is None and self.threaded:
+                self._thread = threading.Thread(target=self.run, name="MouseMotion", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        log.debug("鼠标移动线程已启动（python-ds4版本）")
     
     def stop(self):
-        """停止鼠标移动线程"""
-        self.state['alive'] = False
-        print("鼠标移动线程已停止")
+        """停止鼠标移动，线程休眠等待下次启动"""
+        with self._condition:
+            self._active = False
+        self.set_velocity(0, 0)
+        log.debug("鼠标移动线程已停止")
+    
+    def shutdown(self, timeout: float = 1.0):
+        """结束常驻线程"""
+        with self._condition:
+            self._active = False
+            self._alive = False
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+    
+    def _publish_params(self):
+        """发布一份新的参数快照，摇杆从静止变为移动时唤醒移动线程"""
+        with self._params_lock:
+            was_moving = self._is_moving(self._params)
+            self._params = (self.x_axis, self.y_axis, self.multiplier, self.wheel_direction,
+                            self.curves[self.stick])
+            wake = not was_moving and self._is_moving(self._params)
+        if wake:
+            with self._condition:
+                self._condition.notify()
     
     def set_velocity(self, x_axis: float, y_axis: float):
         """设置轴值"""
         self.x_axis = x_axis
         self.y_axis = y_axis
+        self._publish_params()
         
     def set_multiplier(self, multiplier: float):
-        """设置速度倍率（调整右摇杆速度）"""
-        self.right_axis_speed = 0.15 * multiplier
+        """设置速度倍率（作用于当前摇杆曲线的速度）"""
+        self.multiplier = multiplier
+        self._publish_params()
+    
+    def set_stick(self, stick: str):
+        """选择使用哪个摇杆的曲线（left / right）"""
+        self.stick = stick
+        self._publish_params()
+    
+    def set_curve(self, stick: str, curve: StickCurve):
+        """替换某个摇杆的响应曲线（曲线在调用方预先计算好）"""
+        self.curves = dict(self.curves, **{stick: curve})
+        self._publish_params()
         
     def set_wheel_direction(self, direction: int):
         """设置滚轮方向"""
         self.wheel_direction = direction
         self.scroll_mode = direction != 0
+        self._publish_params()
 
 class StyleManager:
     """样式管理器 - 统一管理界面样式"""
     
-    def __init__(self, style: ttk.Style):
+    def __init__(self, style: "ttk.Style"):
         self.style = style
+        self._font_families = None
         
     def apply_modern_theme(self):
         """应用macOS风格主题"""
@@ -120,8 +628,9 @@ class StyleManager:
         self.style.theme_use('default')
         
         # 全局字体设置 - 隶书风格
-        default_font = ('隶书', 12) if self._font_exists('隶书') else ('LiSu', 12) if self._font_exists('LiSu') else ('Microsoft YaHei UI', 12)
-        title_font = ('隶书', 22, 'bold') if self._font_exists('隶书') else ('LiSu', 22, 'bold') if self._font_exists('LiSu') else ('Microsoft YaHei UI', 22, 'bold')
+        font_family = self._pick_font('隶书', 'LiSu', 'Microsoft YaHei UI')
+        default_font = (font_family, 12)
+        title_font = (font_family, 22, 'bold')
         
         # 现代化柔和配色方案
         colors = {
@@ -158,12 +667,20 @@ class StyleManager:
         self._configure_labelframes()
     
     def _font_exists(self, font_name):
-        """检查字体是否存在"""
-        try:
-            import tkinter.font as tkFont
-            return font_name in tkFont.families()
-        except:
-            return False
+        """检查字体是否存在（系统字体列表只枚举一次）"""
+        if self._font_families is None:
+            try:
+                self._font_families = frozenset(tkfont.families())
+            except Exception:
+                self._font_families = frozenset()
+        return font_name in self._font_families
+
+    def _pick_font(self, *candidates):
+        """返回第一个已安装的字体，都不存在时使用最后一个"""
+        for name in candidates[:-1]:
+            if self._font_exists(name):
+                return name
+        return candidates[-1]
     
     def _configure_frames(self):
         """配置框架样式"""
@@ -359,23 +876,139 @@ class StyleManager:
                                 ('pressed', '#E9ECEF')],
                       bordercolor=[('active', self.colors['focus'])])
 
+
+def write_json_atomic(filename: str, data) -> None:
+    """写入临时文件、fsync 后改名覆盖目标文件（同一目录内改名是原子操作），失败时抛出原异常"""
+    import tempfile
+
+    path = os.path.abspath(filename)
+    directory = os.path.dirname(path)
+    tmp = None
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp, path)
+        tmp = None
+        if hasattr(os, "O_DIRECTORY"):
+            # 同步目录项，保证改名本身也已落盘
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    finally:
+        if tmp is not None:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+
 class ConfigManager:
-    """配置管理器 - 处理配置文件的保存和加载"""
+    """配置管理器 - 处理配置文件的保存和加载
+
+    读取时旧版本的配置自动升级，保存时总是写为当前版本（CONFIG_VERSION）。
+    写入都先写同目录下的临时文件、fsync 后再原子地改名覆盖，写到一半崩溃也不会损坏原文件。
+    save_config_async 把配置快照交给后台写入线程，同一文件 SAVE_DEBOUNCE 秒内的多次保存
+    合并为一次；程序退出时会写完所有待保存的配置。
+    """
+    
+    SAVE_DEBOUNCE = 0.5  # 合并连续保存的时间窗口（秒）
     
     def __init__(self, default_filename: str = "xbox_config.json"):
         self.default_filename = default_filename
+        # 待写入的配置 {文件名: (写入时间点, 配置快照, 回调列表)}
+        self._pending = {}
+        self._writing = 0  # 正在写入的文件数
+        self._condition = threading.Condition()
+        self._writer = None
         
     def save_config(self, config: Dict[str, Any], filename: str = None) -> bool:
-        """保存配置到文件"""
-        try:
-            if filename is None:
-                filename = self.default_filename
+        """保存配置到文件（同步写入，同一文件尚未写入的后台保存被取代）"""
+        if filename is None:
+            filename = self.default_filename
+        with self._condition:
+            job = self._pending.pop(filename, None)
+        ok = self._write(filename, migrate_config(config))
+        for callback in (job[2] if job else ()):
+            callback(ok, filename)
+        return ok
+    
+    def save_config_async(self, config: Dict[str, Any], filename: str = None, callback=None,
+                          delay: Optional[float] = None):
+        """在后台保存配置，立即返回
+
+        调用时即复制配置快照，之后修改 config 不影响写入的内容；delay 秒内（默认
+        SAVE_DEBOUNCE）对同一文件的再次保存会替换快照并重新计时。写入完成后在写入线程中
+        调用 callback(是否成功, 文件名)。
+        """
+        if filename is None:
+            filename = self.default_filename
+        snapshot = migrate_config(json.loads(json.dumps(config)))
+        due = time.monotonic() + (self.SAVE_DEBOUNCE if delay is None else delay)
+        with self._condition:
+            callbacks = self._pending[filename][2] if filename in self._pending else []
+            if callback is not None:
+                callbacks.append(callback)
+            self._pending[filename] = (due, snapshot, callbacks)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name="ConfigWriter", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+            self._condition.notify()
+    
+    def flush(self, timeout: float = 5.0) -> bool:
+        """立即写入所有待保存的配置并等待完成，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            for filename, (due, snapshot, callbacks) in self._pending.items():
+                self._pending[filename] = (0.0, snapshot, callbacks)
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+    
+    def _run_writer(self):
+        """后台写入线程：等到各文件的写入时间点后依次写入"""
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    due = [filename for filename, job in self._pending.items() if job[0] <= now]
+                    if due:
+                        break
+                    timeout = min((job[0] for job in self._pending.values()), default=now + 3600) - now
+                    self._condition.wait(timeout)
+                jobs = [(filename, self._pending.pop(filename)) for filename in due]
+                self._writing += len(jobs)
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
+            for filename, (_, snapshot, callbacks) in jobs:
+                ok = self._write(filename, snapshot)
+                for callback in callbacks:
+                    try:
+                        callback(ok, filename)
+                    except Exception as e:
+                        log.error("保存回调失败: %s", e)
+            
+            with self._condition:
+                self._writing -= len(jobs)
+                self._condition.notify_all()
+    
+    def _write(self, filename: str, config: Dict[str, Any]) -> bool:
+        """原子地写入配置文件"""
+        try:
+            write_json_atomic(filename, config)
             return True
         except Exception as e:
-            print(f"保存配置失败: {e}")
+            log.error("保存配置失败: %s", e)
             return False
     
     def load_config(self, filename: str = None) -> Dict[str, Any]:
@@ -387,19 +1020,485 @@ class ConfigManager:
             if not os.path.exists(filename):
                 return {}
             
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.read_config(filename)
         except Exception as e:
-            print(f"加载配置失败: {e}")
+            log.error("加载配置失败: %s", e)
             return {}
     
+    def read_config(self, filename: str = None) -> Dict[str, Any]:
+        """读取配置文件并升级到当前版本，文件无法读取或格式错误时抛出 OSError / ValueError"""
+        filename = filename or self.default_filename
+        with open(filename, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("配置文件的顶层必须是对象")
+        version = config.get("version", 1)
+        config = migrate_config(config)
+        if version != CONFIG_VERSION:
+            log.info("配置文件 %s 为版本%s格式，已自动升级（保存时写为版本%d）",
+                     os.path.basename(filename), version, CONFIG_VERSION)
+        
+        def check_mappings(mappings, what):
+            if not isinstance(mappings, dict) or not all(isinstance(v, dict) for v in mappings.values()):
+                raise ValueError(f"{what} 必须是 {{按键: 映射}}")
+        
+        check_mappings(config.get("buttons", {}), "buttons")
+        players = config.get("players", {})
+        if not isinstance(players, dict):
+            raise ValueError("players 必须是 {玩家编号: {按键: 映射}}")
+        for mappings in players.values():
+            check_mappings(mappings, "玩家映射")
+        if not isinstance(config.get("stick_curves", {}), dict):
+            raise ValueError("stick_curves 必须是对象")
+        switch = config.get("profile_switch", [])
+        if not isinstance(switch, list) or not all(isinstance(b, str) for b in switch):
+            raise ValueError("profile_switch 必须是按键列表")
+        return config
+    
     def get_config_files(self) -> list:
         """获取当前目录下的所有配置文件"""
         try:
-            files = [f for f in os.listdir('.') if f.endswith('.json')]
+            files = [f for f in os.listdir('.')
+                     if f.endswith('.json') and f != CalibrationStore.DEFAULT_FILENAME]
             return files
         except:
             return []
+    
+    def get_config_files_async(self, callback):
+        """在后台线程中扫描配置文件，完成后在该线程中调用 callback(文件列表)"""
+        threading.Thread(target=lambda: callback(self.get_config_files()),
+                         name="ConfigScan", daemon=True).start()
+
+class ConfigWatcher:
+    """配置文件监视器 - 文件被修改后在后台线程中回调，短时间内的多次写入只回调一次
+
+    Linux 上用 inotify 监视文件所在的目录（很多工具先写临时文件再改名覆盖），
+    inotify 不可用时退回到定期比较文件的修改时间和大小。
+    """
+
+    DEBOUNCE = 0.3  # 最后一次写入后等待的时间（秒）
+    POLL_INTERVAL = 0.5  # 退回轮询时的检查间隔（秒）
+
+    # inotify 常量（linux/inotify.h）
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, callback, debounce: float = DEBOUNCE, use_inotify: bool = True):
+        self.callback = callback
+        self.debounce = debounce
+        self._files = {}  # 绝对路径 -> 上次回调时的文件状态 (mtime_ns, size)
+        self._seen = {}  # 轮询方式下上次检查到的文件状态
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._inotify_fd = None
+        self._libc = None
+        self._watches = {}  # inotify 监视编号 -> 目录
+        if use_inotify:
+            self._init_inotify()
+
+    @property
+    def backend(self) -> str:
+        """当前使用的监视方式（inotify / poll）"""
+        return "inotify" if self._inotify_fd is not None else "poll"
+
+    def _init_inotify(self):
+        """加载 libc 中的 inotify 接口，不可用时保持轮询方式"""
+        if not sys.platform.startswith("linux"):
+            return
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError) as e:
+            log.debug("inotify 不可用: %s", e)
+            return
+        if fd < 0:
+            log.debug("inotify 初始化失败: errno %d", ctypes.get_errno())
+            return
+        self._libc = libc
+        self._inotify_fd = fd
+
+    @staticmethod
+    def _stat(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def add(self, filename: str):
+        """开始监视一个文件（文件可以暂时不存在）"""
+        path = os.path.abspath(filename)
+        with self._lock:
+            if path in self._files:
+                return
+            self._files[path] = self._seen[path] = self._stat(path)
+        directory = os.path.dirname(path)
+        if self._inotify_fd is not None and directory not in self._watches.values():
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+            wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(directory), mask)
+            if wd >= 0:
+                self._watches[wd] = directory
+            else:
+                log.warning("无法监视目录 %s，改为定期检查", directory)
+                self._close_inotify()
+
+    def remove(self, filename: str):
+        """停止监视一个文件"""
+        with self._lock:
+            self._files.pop(os.path.abspath(filename), None)
+            self._seen.pop(os.path.abspath(filename), None)
+
+    def start(self):
+        """启动监视线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """停止监视线程"""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._close_inotify()
+
+    def _close_inotify(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            self._watches.clear()
+
+    def _run(self):
+        """监视线程主循环：记录每个文件最后一次变化的时间，静默 debounce 秒后回调"""
+        pending = {}  # 路径 -> 回调时间点
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            timeout = min([deadline - now for deadline in pending.values()] + [self.POLL_INTERVAL])
+            for path in self._wait(max(timeout, 0.0)):
+                pending[path] = time.monotonic() + self.debounce
+
+            now = time.monotonic()
+            for path in [path for path, deadline in pending.items() if deadline <= now]:
+                del pending[path]
+                state = self._stat(path)
+                with self._lock:
+                    if path not in self._files or self._files[path] == state:
+                        continue
+                    self._files[path] = state
+                if state is None:
+                    continue  # 文件被删除：保持原有映射，重新出现时再加载
+                try:
+                    self.callback(path)
+                except Exception as e:
+                    log.error("配置文件重新加载失败: %s", e)
+
+    def _wait(self, timeout: float) -> list:
+        """等待文件变化，返回可能发生变化的文件路径"""
+        if self._inotify_fd is None:
+            if self._stop_event.wait(timeout):
+                return []
+            changed = []
+            with self._lock:
+                for path, seen in self._seen.items():
+                    state = self._stat(path)
+                    if state != seen:
+                        self._seen[path] = state
+                        changed.append(path)
+            return changed
+
+        import select
+        try:
+            readable, _, _ = select.select([self._inotify_fd], [], [], timeout)
+            if not readable:
+                return []
+            data = os.read(self._inotify_fd, 65536)
+        except (OSError, ValueError):
+            return []  # 正在停止（描述符已关闭）
+        changed = []
+        offset = 0
+        header = self._EVENT_HEADER
+        while offset + header.size <= len(data):
+            wd, mask, cookie, length = header.unpack_from(data, offset)
+            name = data[offset + header.size:offset + header.size + length].rstrip(b"\x00")
+            offset += header.size + length
+            directory = self._watches.get(wd)
+            if directory is not None and name:
+                path = os.path.join(directory, os.fsdecode(name))
+                if path in self._files:
+                    changed.append(path)
+        return changed
+
+
+# 按键位定义：所有按键、扳机和方向键共用一个整数位掩码
+BUTTON_NAMES = ("A", "B", "X", "Y", "LB", "RB", "Back", "Start", "LS", "RS",
+                "LT", "RT", "DPadUp", "DPadDown", "DPadLeft", "DPadRight")
+BUTTON_BITS = {name: 1 << index for index, name in enumerate(BUTTON_NAMES)}
+DPAD_MASK = (BUTTON_BITS["DPadUp"] | BUTTON_BITS["DPadDown"] |
+             BUTTON_BITS["DPadLeft"] | BUTTON_BITS["DPadRight"])
+
+
+def iter_bits(mask: int):
+    """按从低到高的顺序遍历位掩码中被置位的位编号"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class ControllerFrame:
+    """手柄单周期快照 - 每个周期只采集一次，所有使用方都读取同一帧"""
+
+    __slots__ = ("timestamp", "buttons", "pressed", "released", "axes", "transitions")
+
+    # axes 数组下标
+    LEFT_X, LEFT_Y, RIGHT_X, RIGHT_Y, LT, RT = range(6)
+
+    def __init__(self):
+        self.timestamp = 0.0
+        self.buttons = 0   # 当前按下的按键位掩码
+        self.pressed = 0   # 本周期按下的按键位掩码
+        self.released = 0  # 本周期松开的按键位掩码
+        self.axes = array('d', bytes(6 * 8))
+        # 事件模式下本周期内按顺序发生的状态变化 [(时间戳, 位编号, 是否按下), ...]
+        self.transitions = []
+
+    def is_down(self, name: str) -> bool:
+        """按键当前是否处于按下状态"""
+        return bool(self.buttons & BUTTON_BITS[name])
+
+    def stick(self, name: str) -> tuple:
+        """获取摇杆轴值（left / right）"""
+        if name == "left":
+            return self.axes[self.LEFT_X], self.axes[self.LEFT_Y]
+        return self.axes[self.RIGHT_X], self.axes[self.RIGHT_Y]
+
+
+class CalibrationError(Exception):
+    """手柄校准失败（采样不足或缺少 numpy）"""
+
+
+class AxisCalibration:
+    """
+    单个设备的轴校准结果
+    每个轴一个仿射变换 (原始值 - offset) * scale，变换后绝对值不超过噪声门限的视为0；
+    轴顺序与 ControllerFrame.axes 一致，扳机换算为 0~1 的行程
+    """
+
+    STICK_SLOTS = (ControllerFrame.LEFT_X, ControllerFrame.LEFT_Y,
+                   ControllerFrame.RIGHT_X, ControllerFrame.RIGHT_Y)
+    NOISE_MARGIN = 4.0           # 噪声门限 = 静止时噪声标准差 * 倍数
+    MIN_RANGE = 0.3              # 采样到的行程小于该值时使用默认满量程
+    DEFAULT_TRIGGER_THRESHOLD = 0.08  # 扳机触发行程（噪声较大时自动提高）
+    DRIFT_WINDOW = 0.1           # 只在摇杆接近中心时跟踪漂移
+    DRIFT_SETTLE_TIME = 0.5      # 摇杆需在噪声范围内保持静止的时间（秒），缓慢推动不会被当作漂移
+    DRIFT_TOLERANCE = 0.01       # 判断静止时允许的最小原始值波动
+    DRIFT_LIMIT = 0.05           # 零点相对校准中心的最大修正量（校准后行程）
+    DRIFT_TIME_CONSTANT = 30.0   # 漂移估计的时间常数（秒）
+
+    def __init__(self, offset, scale, noise=None, minimum=None, maximum=None,
+                 trigger_threshold: float = DEFAULT_TRIGGER_THRESHOLD):
+        count = len(ControllerFrame().axes)
+        self.offset = array('d', offset)
+        self.scale = array('d', scale)
+        self.noise = array('d', noise if noise is not None else [0.0] * count)
+        self.minimum = array('d', minimum if minimum is not None else [-1.0] * count)
+        self.maximum = array('d', maximum if maximum is not None else [1.0] * count)
+        if not all(len(values) == count for values in
+                   (self.offset, self.scale, self.noise, self.minimum, self.maximum)):
+            raise CalibrationError("校准数据的轴数量不匹配")
+        self.gate = array('d', (abs(n * k) * self.NOISE_MARGIN for n, k in zip(self.noise, self.scale)))
+        self.trigger_threshold = trigger_threshold
+        self.trigger_thresholds = [max(trigger_threshold, self.gate[slot])
+                                   for slot in (ControllerFrame.LT, ControllerFrame.RT)]
+        # 漂移跟踪：校准时的零点、静止判断的参考值和已静止的时间
+        self.center = array('d', self.offset)
+        self._drift_anchor = array('d', self.offset)
+        self._drift_still = array('d', bytes(count * 8))
+        self._drift_tolerance = array('d', (max(n * self.NOISE_MARGIN, self.DRIFT_TOLERANCE)
+                                            for n in self.noise))
+
+    @classmethod
+    def default(cls, trigger_baseline: Dict[str, float]) -> "AxisCalibration":
+        """未校准设备的默认值：摇杆不变换，扳机以连接时的静止值为零点"""
+        lt = trigger_baseline.get("lt", -1.0)
+        rt = trigger_baseline.get("rt", -1.0)
+        return cls(offset=(0.0, 0.0, 0.0, 0.0, lt, rt),
+                   scale=(1.0, 1.0, 1.0, 1.0, 0.5, 0.5))
+
+    @classmethod
+    def from_samples(cls, rest, motion) -> "AxisCalibration":
+        """根据静止采样和转动采样计算校准（每行一个采样，列顺序同 ControllerFrame.axes）"""
+        if not np._available():
+            raise CalibrationError("手柄校准需要安装 numpy")
+        if len(rest) < 10:
+            raise CalibrationError("静止采样不足，请保持手柄连接后重试")
+
+        rest = np.asarray(rest, dtype=np.float64)
+        samples = np.vstack((rest, np.asarray(motion, dtype=np.float64).reshape(-1, rest.shape[1])))
+        center = np.median(rest, axis=0)
+        noise = rest.std(axis=0)
+        minimum = samples.min(axis=0)
+        maximum = samples.max(axis=0)
+
+        scale = np.ones_like(center)
+        # 摇杆：取两侧较短的行程，保证两个方向都能推到 1
+        span = np.minimum(center - minimum, maximum - center)[:4]
+        scale[:4] = np.where(span >= cls.MIN_RANGE, 1.0 / np.maximum(span, cls.MIN_RANGE), 1.0)
+        # 扳机：静止值到最大值换算为 0~1
+        span = (maximum - center)[4:]
+        full = 1.0 - center[4:]
+        fallback = np.where(full >= cls.MIN_RANGE, 1.0 / np.maximum(full, cls.MIN_RANGE), 1.0)
+        scale[4:] = np.where(span >= cls.MIN_RANGE, 1.0 / np.maximum(span, cls.MIN_RANGE), fallback)
+        return cls(center.tolist(), scale.tolist(), noise.tolist(), minimum.tolist(), maximum.tolist())
+
+    def track_drift(self, raw_axes, dt: float):
+        """摇杆在中心附近持续静止时用指数滑动平均缓慢修正零点，消除缓慢漂移造成的光标移动
+
+        读数在噪声范围内保持 DRIFT_SETTLE_TIME 以上才更新，缓慢的有意推动会不断重置计时；
+        零点相对校准中心的修正量不超过 DRIFT_LIMIT。
+        """
+        alpha = min(dt / self.DRIFT_TIME_CONSTANT, 1.0)
+        offset = self.offset
+        scale = self.scale
+        anchor = self._drift_anchor
+        still = self._drift_still
+        for slot in self.STICK_SLOTS:
+            raw = raw_axes[slot]
+            if abs(raw - anchor[slot]) > self._drift_tolerance[slot]:
+                anchor[slot] = raw
+                still[slot] = 0.0
+                continue
+            still[slot] += dt
+            if still[slot] < self.DRIFT_SETTLE_TIME:
+                continue
+            error = raw - offset[slot]
+            if abs(error * scale[slot]) < self.DRIFT_WINDOW:
+                limit = self.DRIFT_LIMIT / abs(scale[slot])
+                center = self.center[slot]
+                offset[slot] = min(max(offset[slot] + alpha * error, center - limit), center + limit)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AxisCalibration":
+        """从保存的字典恢复"""
+        try:
+            return cls(data["offset"], data["scale"], data.get("noise"), data.get("minimum"),
+                       data.get("maximum"), data.get("trigger_threshold", cls.DEFAULT_TRIGGER_THRESHOLD))
+        except (KeyError, TypeError, ValueError) as e:
+            raise CalibrationError(f"校准数据无效: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为可保存的字典"""
+        return {
+            "offset": list(self.offset), "scale": list(self.scale), "noise": list(self.noise),
+            "minimum": list(self.minimum), "maximum": list(self.maximum),
+            "trigger_threshold": self.trigger_threshold,
+        }
+
+
+class CalibrationStore:
+    """校准数据存储 - 按设备GUID保存到JSON文件（filename 为 None 时不读写文件）"""
+
+    DEFAULT_FILENAME = "controller_calibration.json"
+
+    def __init__(self, filename: Optional[str] = DEFAULT_FILENAME):
+        self.filename = filename
+
+    def _read(self) -> Dict[str, Any]:
+        if self.filename is None:
+            return {}
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.error("读取校准数据失败: %s", e)
+            return {}
+
+    def load(self, guid: str) -> Optional[AxisCalibration]:
+        """读取设备的校准数据，没有或无效时返回 None"""
+        data = self._read().get(guid)
+        if not data:
+            return None
+        try:
+            return AxisCalibration.from_dict(data)
+        except CalibrationError as e:
+            log.warning("设备 %s 的%s", guid, e)
+            return None
+
+    def save(self, guid: str, calibration: AxisCalibration) -> bool:
+        """保存设备的校准数据"""
+        if self.filename is None:
+            return True
+        data = self._read()
+        data[guid] = calibration.to_dict()
+        try:
+            write_json_atomic(self.filename, data)
+            return True
+        except Exception as e:
+            log.error("保存校准数据失败: %s", e)
+            return False
+
+
+class JoystickBackend:
+    """手柄输入后端 - 默认通过 pygame/SDL 访问手柄，回放时替换为虚拟手柄"""
+
+    name = "pygame"
+
+    def init(self):
+        """初始化输入子系统"""
+        pygame.init()
+        pygame.joystick.init()
+
+    def reinit(self):
+        """重新初始化手柄子系统（重新枚举设备）"""
+        pygame.joystick.quit()
+        pygame.joystick.init()
+
+    def count(self) -> int:
+        """已连接的手柄数量"""
+        return pygame.joystick.get_count()
+
+    def open(self, index: int):
+        """打开并初始化指定编号的手柄"""
+        joystick = pygame.joystick.Joystick(index)
+        joystick.init()
+        return joystick
+
+    def pump(self):
+        """刷新手柄状态（轮询模式使用）"""
+        pygame.event.pump()
+
+    def get_events(self) -> list:
+        """从SDL事件队列中取出所有手柄事件，包括插拔事件（保持原始顺序）
+
+        其余事件直接丢弃：SDL队列容量有限，积压满后新的插拔事件也会被丢掉。
+        """
+        events = pygame.event.get((pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP,
+                                   pygame.JOYAXISMOTION, pygame.JOYHATMOTION,
+                                   pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED))
+        pygame.event.clear(pump=False)
+        return events
+
+    def get_device_events(self) -> list:
+        """刷新手柄状态并只取出插拔事件（轮询模式使用），按键/轴等事件直接丢弃以免积压"""
+        events = pygame.event.get((pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED))
+        pygame.event.clear(pump=False)
+        return events
+
+    def now(self) -> float:
+        """输入时间戳使用的单调时钟（秒）"""
+        return time.perf_counter()
+
 
 class ControllerHandler:
     """手柄处理器 - 管理手柄连接和输入检测"""
@@ -412,190 +1511,3441 @@ class ControllerHandler:
         4: (0, 1, None, 2, 3, None), # 只有摇杆轴
     }
 
-    def __init__(self):
+    # 按键编号 -> 按键名称（XInput/SDL 顺序）
+    BUTTON_MAP = {0: "A", 1: "B", 2: "X", 3: "Y", 4: "LB", 5: "RB",
+                  6: "Back", 7: "Start", 8: "LS", 9: "RS"}
+
+    # 输入模式：poll 每周期轮询当前状态；event 按顺序消费SDL手柄事件，不会丢失短按
+    INPUT_MODES = ("poll", "event")
+
+    def __init__(self, input_mode: str = "poll", event_source=None,
+                 calibration_store: Optional[CalibrationStore] = None,
+                 backend: Optional[JoystickBackend] = None):
+        if input_mode not in self.INPUT_MODES:
+            raise ValueError(f"不支持的输入模式: {input_mode}")
+        self.backend = backend or JoystickBackend()
         self.joystick = None
         self.is_connected = False
-        self.button_states = {}
+        self.input_mode = input_mode
+        self.guid = None
+        self.instance_id = None  # SDL实例编号（同一设备拔插后会变化）
+        self.player = 0          # 玩家槽位（由引擎分配）
+        # 由引擎统一取出事件时为 True：事件按实例编号分发到 pending_events，
+        # reset_frame 不再自行清空共用的事件队列
+        self.shared_queue = False
+        self.pending_events = []
         self._axis_layout = None  # 检测到的轴布局
         self._trigger_baseline = {}  # 扳机键静止基准值
+        # 轴校准：优先使用按GUID保存的校准数据，否则以连接时的扳机静止值为零点
+        self.calibration_store = calibration_store or CalibrationStore()
+        self.calibration = AxisCalibration.default({})
+        self.calibrated = False
+        # 事件来源：返回手柄事件列表的可调用对象，默认从输入后端的事件队列中取出
+        self._event_source = event_source or self.backend.get_events
+        # 输入录制（None 表示未录制）
+        self.recorder = None
+
+        # 连接时缓存的设备信息，避免每周期重复查询SDL
+        self._num_buttons = 0
+        self._num_hats = 0
+        self._button_bits = ()   # [(SDL按键编号, 位掩码), ...]
+        self._axis_slots = {}    # SDL轴编号 -> ControllerFrame.axes 下标
+        self._axis_indices = ()  # ControllerFrame.axes 下标 -> SDL轴编号（-1 表示不存在）
+        self._trigger_thresholds = [2.0, 2.0]  # LT/RT 校准后行程的触发阈值
+        self.raw_axes = array('d', bytes(6 * 8))  # 未校准的原始轴值
+
+        # 双缓冲帧：poll() 交替写入，上一帧用于计算边沿
+        self._frames = (ControllerFrame(), ControllerFrame())
+        self._frame_index = 0
+        self.frame = self._frames[0]
 
     def initialize(self) -> bool:
         """初始化手柄"""
         try:
-            pygame.init()
-            pygame.joystick.init()
+            self.backend.init()
 
-            if pygame.joystick.get_count() == 0:
+            if self.backend.count() == 0:
                 return False
 
-            self.joystick = pygame.joystick.Joystick(0)
-            self.joystick.init()
+            return self.attach(self.backend.open(0))
+        except Exception as e:
+            log.error("手柄初始化失败: %s", e)
+            return False
+
+    def attach(self, joystick, load_calibration: bool = True) -> bool:
+        """接管一个已打开的手柄：检测轴布局、重新采样扳机基准并重置帧
+
+        load_calibration 为 False 时先使用基于扳机基准的默认校准，由调用方在后台
+        读取保存的校准数据后再通过 set_calibration 应用（避免读文件阻塞轮询）。
+        """
+        try:
+            self.joystick = joystick
+            self.instance_id = joystick.get_instance_id()
             self.is_connected = True
 
             # 自动检测轴布局
             self._detect_axis_layout()
+            if load_calibration:
+                calibration = self.calibration_store.load(self.guid)
+                if calibration is not None:
+                    self.set_calibration(calibration)
+                    log.info("已加载手柄校准数据: %s", self.guid)
+
+            # 以当前实际状态作为起点，避免连接时误触发
+            self.reset_frame()
+
+            log.info("玩家%d 手柄已连接: %s", self.player + 1, joystick.get_name())
+            return self.is_connected
+        except Exception as e:
+            log.error("手柄初始化失败: %s", e)
+            self.is_connected = False
+            return False
+
+    def detach(self):
+        """设备已移除，释放手柄并停止录制"""
+        self.stop_recording()
+        self.is_connected = False
+        self.joystick = None
+        self.instance_id = None
+        self.pending_events.clear()
+
+    def _detect_axis_layout(self):
+        """自动检测手柄轴布局"""
+        if not self.joystick:
+            return
+
+        num_axes = self.joystick.get_numaxes()
+        name = self.joystick.get_name().lower()
+
+        # 先按轴数匹配预设
+        if num_axes in self.AXIS_LAYOUTS:
+            layout = self.AXIS_LAYOUTS[num_axes]
+        else:
+            # 轴数不在预设中，用通用方案：前两个是左摇杆，后面的按位置推断
+            if num_axes >= 6:
+                layout = (0, 1, 2, 3, 4, 5)
+            elif num_axes >= 4:
+                layout = (0, 1, None, 2, 3, None)
+            else:
+                layout = (0, 1, None, None, None, None)
+
+        self._axis_layout = {
+            "left_x": layout[0],
+            "left_y": layout[1],
+            "lt": layout[2],
+            "right_x": layout[3],
+            "right_y": layout[4],
+            "rt": layout[5],
+        }
+
+        # 采样静止状态基准值（用于扳机键零点校准）
+        self.backend.pump()
+        self._trigger_baseline = {}
+        for key in ("lt", "rt"):
+            idx = self._axis_layout.get(key)
+            if idx is not None and idx < num_axes:
+                self._trigger_baseline[key] = self.joystick.get_axis(idx)
+
+        log.info("轴布局检测: 共%d轴, 布局=%s", num_axes, self._axis_layout)
+        if self._trigger_baseline:
+            log.info("扳机基准值: %s", dict(self._trigger_baseline))
+
+        # 在读取到保存的校准数据之前，以本次连接时的扳机静止值为零点
+        self.guid = self.joystick.get_guid() if hasattr(self.joystick, "get_guid") else self.joystick.get_name()
+        self.calibrated = False
+        self.calibration = AxisCalibration.default(self._trigger_baseline)
+
+    def set_calibration(self, calibration: AxisCalibration):
+        """应用新的校准数据（在引擎线程中调用）"""
+        self.calibration = calibration
+        self.calibrated = True
+        self._trigger_thresholds[:] = calibration.trigger_thresholds
+
+    def _cache_device_info(self):
+        """缓存按键数量、轴编号和扳机阈值"""
+        num_axes = self.joystick.get_numaxes()
+        self._num_buttons = self.joystick.get_numbuttons()
+        self._num_hats = self.joystick.get_numhats()
+        self._button_bits = tuple((index, BUTTON_BITS[name])
+                                  for index, name in self.BUTTON_MAP.items()
+                                  if index < self._num_buttons)
+
+        layout = self._axis_layout or {}
+        indices = []
+        for key in ("left_x", "left_y", "right_x", "right_y", "lt", "rt"):
+            idx = layout.get(key)
+            indices.append(idx if idx is not None and idx < num_axes else -1)
+        self._axis_indices = tuple(indices)
+        self._axis_slots = {idx: slot for slot, idx in enumerate(indices) if idx >= 0}
+
+        self._trigger_thresholds[:] = self.calibration.trigger_thresholds
+
+    @staticmethod
+    def _hat_bits(value) -> int:
+        """将方向键 (x, y) 转换为位掩码"""
+        x, y = value
+        bits = 0
+        if y > 0:
+            bits |= BUTTON_BITS["DPadUp"]
+        elif y < 0:
+            bits |= BUTTON_BITS["DPadDown"]
+        if x < 0:
+            bits |= BUTTON_BITS["DPadLeft"]
+        elif x > 0:
+            bits |= BUTTON_BITS["DPadRight"]
+        return bits
+
+    def _calibrated(self, slot: int, raw: float) -> float:
+        """对单个轴应用校准变换和噪声门限"""
+        calibration = self.calibration
+        value = (raw - calibration.offset[slot]) * calibration.scale[slot]
+        return 0.0 if -calibration.gate[slot] <= value <= calibration.gate[slot] else value
+
+    def _trigger_bits(self, axes) -> int:
+        """根据扳机轴值计算 LT/RT 位"""
+        thresholds = self._trigger_thresholds
+        bits = 0
+        if self._axis_indices[ControllerFrame.LT] >= 0 and axes[ControllerFrame.LT] > thresholds[0]:
+            bits |= BUTTON_BITS["LT"]
+        if self._axis_indices[ControllerFrame.RT] >= 0 and axes[ControllerFrame.RT] > thresholds[1]:
+            bits |= BUTTON_BITS["RT"]
+        return bits
+
+    def _sample(self, frame: ControllerFrame) -> int:
+        """直接读取SDL当前状态写入帧，返回按键位掩码"""
+        joystick = self.joystick
+        axes = frame.axes
+        raw_axes = self.raw_axes
+        for slot, idx in enumerate(self._axis_indices):
+            if idx >= 0:
+                raw = raw_axes[slot] = joystick.get_axis(idx)
+                axes[slot] = self._calibrated(slot, raw)
+            else:
+                axes[slot] = 0.0
+
+        buttons = 0
+        for index, bit in self._button_bits:
+            if joystick.get_button(index):
+                buttons |= bit
+        if self._num_hats:
+            buttons |= self._hat_bits(joystick.get_hat(0))
+        if self.recorder is not None:
+            self.recorder.capture(frame.timestamp, joystick)
+        return buttons | self._trigger_bits(axes)
+
+    def reset_frame(self):
+        """丢弃积压事件，用当前实际状态重置帧（不产生边沿）"""
+        for frame in self._frames:
+            frame.buttons = frame.pressed = frame.released = 0
+            frame.transitions.clear()
+            for slot in range(len(frame.axes)):
+                frame.axes[slot] = 0.0
+        for slot in range(len(self.raw_axes)):
+            self.raw_axes[slot] = 0.0
+
+        if not self.is_connected or not self.joystick:
+            return
+
+        try:
+            self._cache_device_info()
+            # 丢弃连接前积压的旧事件（共用队列时由引擎丢弃）
+            if not self.shared_queue:
+                self._event_source()
+            frame = self.frame
+            frame.timestamp = self.backend.now()
+            frame.buttons = self._sample(frame)
+        except Exception as e:
+            log.error("读取手柄状态失败: %s", e)
+            self.is_connected = False
+
+    def set_input_mode(self, input_mode: str):
+        """切换输入模式（poll / event）"""
+        if input_mode not in self.INPUT_MODES:
+            raise ValueError(f"不支持的输入模式: {input_mode}")
+        self.input_mode = input_mode
+        self.reset_frame()
+
+    def poll(self, events=None) -> Optional[ControllerFrame]:
+        """采集本周期的手柄快照，每个周期只调用一次
+
+        轮询模式下通过与上一帧按位异或得到边沿；事件模式下按顺序应用
+        SDL事件，同一周期内的按下和松开都会记录在 transitions 中，
+        因此无论周期多长都不会丢失短按。返回的帧在下一次 poll() 之后
+        仍然有效，再下一次会被复用。手柄失效时返回 None。
+
+        events 为 None 时自行取出事件（轮询模式下自行刷新SDL状态）；多手柄时
+        由引擎每周期统一取出一次，传入分发给本设备的事件（轮询模式下表示已刷新）。
+        """
+        if not self.is_connected or not self.joystick:
+            return None
+
+        previous = self.frame
+        self._frame_index ^= 1
+        frame = self._frames[self._frame_index]
+
+        try:
+            if self.input_mode == "event":
+                if events is None:
+                    events = self._event_source()
+                if not self.joystick.get_init():
+                    self.is_connected = False
+                    return None
+                frame.timestamp = self.backend.now()
+                if self.recorder is not None:
+                    self.recorder.write_events(frame.timestamp, events, self.joystick.get_instance_id())
+                self._apply_events(events, previous, frame)
+            else:
+                if events is None:
+                    self.backend.pump()
+                if not self.joystick.get_init():
+                    self.is_connected = False
+                    return None
+                frame.timestamp = self.backend.now()
+                buttons = self._sample(frame)
+                changed = buttons ^ previous.buttons
+                frame.buttons = buttons
+                frame.pressed = changed & buttons
+                frame.released = changed & previous.buttons
+                frame.transitions.clear()
+        except Exception as e:
+            log.error("获取手柄状态失败: %s", e)
+            self.is_connected = False
+            return None
+
+        # 已校准的设备跟踪摇杆零点的缓慢漂移，并用更新后的零点重新计算摇杆轴值
+        # （未校准时没有噪声和中心数据，无法区分漂移和有意的推动）
+        if self.calibrated and previous.timestamp:
+            self.calibration.track_drift(self.raw_axes, frame.timestamp - previous.timestamp)
+            for slot in AxisCalibration.STICK_SLOTS:
+                if self._axis_indices[slot] >= 0:
+                    frame.axes[slot] = self._calibrated(slot, self.raw_axes[slot])
+
+        self.frame = frame
+        return frame
+
+    def _apply_events(self, events, previous: ControllerFrame, frame: ControllerFrame):
+        """按顺序将SDL事件应用到帧上"""
+        # 事件自带时间戳（回放、脚本化事件源）时按事件的时间记录，
+        # pygame 事件不带可用的时间戳，以取出时刻为准；顺序与SDL队列一致
+        dequeued = frame.timestamp
+        instance_id = self.joystick.get_instance_id()
+        axes = frame.axes
+        axes[:] = previous.axes
+        buttons = previous.buttons
+        pressed = released = 0
+        transitions = frame.transitions
+        transitions.clear()
+
+        for event in events:
+            if getattr(event, "instance_id", instance_id) != instance_id:
+                continue
+
+            event_type = event.type
+            if event_type == pygame.JOYAXISMOTION:
+                slot = self._axis_slots.get(event.axis)
+                if slot is None:
+                    continue
+                self.raw_axes[slot] = event.value
+                axes[slot] = self._calibrated(slot, event.value)
+                if slot < ControllerFrame.LT:
+                    continue
+                new_buttons = (buttons & ~(BUTTON_BITS["LT"] | BUTTON_BITS["RT"])) | self._trigger_bits(axes)
+            elif event_type == pygame.JOYHATMOTION:
+                if event.hat != 0:
+                    continue
+                new_buttons = (buttons & ~DPAD_MASK) | self._hat_bits(event.value)
+            elif event_type == pygame.JOYBUTTONDOWN or event_type == pygame.JOYBUTTONUP:
+                name = self.BUTTON_MAP.get(event.button)
+                if name is None:
+                    continue
+                if event_type == pygame.JOYBUTTONDOWN:
+                    new_buttons = buttons | BUTTON_BITS[name]
+                else:
+                    new_buttons = buttons & ~BUTTON_BITS[name]
+            else:
+                continue  # 插拔等其他事件由引擎处理
+
+            changed = new_buttons ^ buttons
+            if not changed:
+                continue
+            timestamp = getattr(event, "timestamp", dequeued)
+            for bit in iter_bits(changed):
+                is_down = bool(new_buttons >> bit & 1)
+                transitions.append((timestamp, bit, is_down))
+            pressed |= changed & new_buttons
+            released |= changed & buttons
+            buttons = new_buttons
+
+        frame.buttons = buttons
+        frame.pressed = pressed
+        frame.released = released
+
+    def get_button_states(self) -> Dict[str, bool]:
+        """获取最近一帧的按键状态（不会重新查询SDL）"""
+        if not self.is_connected or not self.joystick:
+            return {}
+        buttons = self.frame.buttons
+        return {name: bool(buttons & bit) for name, bit in BUTTON_BITS.items()}
+
+    def get_joystick_axes(self) -> Dict[str, tuple]:
+        """获取最近一帧的摇杆轴状态（不会重新查询SDL）"""
+        if not self.is_connected or not self.joystick:
+            return {}
+        return {
+            "left": self.frame.stick("left"),
+            "right": self.frame.stick("right")
+        }
+
+    def reconnect(self) -> bool:
+        """重新连接手柄"""
+        self.is_connected = False
+        return self.initialize()
+
+    @property
+    def name(self) -> Optional[str]:
+        """已连接手柄的名称"""
+        return self.joystick.get_name() if self.is_connected and self.joystick else None
+
+    def start_recording(self, filename: str):
+        """开始将原始输入录制到文件（先写入当前完整状态）"""
+        if not self.is_connected or not self.joystick:
+            raise RuntimeError("手柄未连接，无法录制")
+        self.stop_recording()
+        recorder = InputRecorder(filename, self.joystick, self.guid or "")
+        recorder.capture(self.backend.now(), self.joystick)
+        self.recorder = recorder
+
+    def stop_recording(self):
+        """停止录制并关闭文件"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+class InputRecorder:
+    """
+    原始输入录制器 - 将手柄的轴、按键、方向键变化写入定长记录的二进制文件
+    文件头之后每条记录16字节，可以直接内存映射，长时间录制也不会占用内存
+    """
+
+    MAGIC = b"CMREC\x00\x00\x01"
+    HEADER = struct.Struct("<8sHHHd64s64s")  # 魔数、轴数、按键数、方向键数、开始时间、名称、GUID
+    RECORD = struct.Struct("<dBBbbf")        # 相对时间、类型、编号、方向键x、方向键y、轴值
+
+    # 记录类型
+    AXIS = 0
+    BUTTON_DOWN = 1
+    BUTTON_UP = 2
+    HAT = 3
+
+    def __init__(self, filename: str, joystick, guid: str = ""):
+        self._file = open(filename, 'wb')
+        self._start = None
+        self._axes = {}
+        self._buttons = {}
+        self._hats = {}
+        self.count = 0
+        self._file.write(self.HEADER.pack(
+            self.MAGIC, joystick.get_numaxes(), joystick.get_numbuttons(), joystick.get_numhats(),
+            time.time(), joystick.get_name().encode('utf-8')[:64], guid.encode('utf-8')[:64]))
+
+    def _write(self, timestamp: float, kind: int, index: int, hat=(0, 0), value: float = 0.0):
+        if self._start is None:
+            self._start = timestamp
+        self._file.write(self.RECORD.pack(timestamp - self._start, kind, index, hat[0], hat[1], value))
+        self.count += 1
+
+    def axis(self, timestamp: float, index: int, value: float):
+        if self._axes.get(index) != value:
+            self._axes[index] = value
+            self._write(timestamp, self.AXIS, index, value=value)
+
+    def button(self, timestamp: float, index: int, down: bool):
+        down = bool(down)
+        if self._buttons.get(index, False) != down:
+            self._buttons[index] = down
+            self._write(timestamp, self.BUTTON_DOWN if down else self.BUTTON_UP, index)
+
+    def hat(self, timestamp: float, index: int, value):
+        value = tuple(value)
+        if self._hats.get(index, (0, 0)) != value:
+            self._hats[index] = value
+            self._write(timestamp, self.HAT, index, hat=value)
+
+    def capture(self, timestamp: float, joystick):
+        """读取手柄完整状态，只写入发生变化的部分（轮询模式和录制开始时使用）"""
+        for index in range(joystick.get_numaxes()):
+            self.axis(timestamp, index, joystick.get_axis(index))
+        for index in range(joystick.get_numbuttons()):
+            self.button(timestamp, index, joystick.get_button(index))
+        for index in range(joystick.get_numhats()):
+            self.hat(timestamp, index, joystick.get_hat(index))
+
+    def write_events(self, timestamp: float, events, instance_id: int):
+        """按顺序写入本周期取出的SDL事件（事件不带时间戳时以 timestamp 为准）"""
+        dequeued = timestamp
+        for event in events:
+            if getattr(event, "instance_id", instance_id) != instance_id:
+                continue
+            timestamp = getattr(event, "timestamp", dequeued)
+            if event.type == pygame.JOYAXISMOTION:
+                self.axis(timestamp, event.axis, event.value)
+            elif event.type == pygame.JOYHATMOTION:
+                self.hat(timestamp, event.hat, event.value)
+            elif event.type == pygame.JOYBUTTONDOWN:
+                self.button(timestamp, event.button, True)
+            elif event.type == pygame.JOYBUTTONUP:
+                self.button(timestamp, event.button, False)
+
+    def close(self):
+        self._file.close()
+
+
+class InputRecording:
+    """内存映射方式读取输入录制文件，按下标随机访问记录"""
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < InputRecorder.HEADER.size:
+                raise ValueError(f"不是有效的输入录制文件: {filename}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.num_axes, self.num_buttons, self.num_hats, self.started_at,
+         name, guid) = InputRecorder.HEADER.unpack_from(self._mmap, 0)
+        if magic != InputRecorder.MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是有效的输入录制文件: {filename}")
+        self.name = name.rstrip(b"\x00").decode('utf-8', 'replace')
+        self.guid = guid.rstrip(b"\x00").decode('utf-8', 'replace')
+        self._count = (size - InputRecorder.HEADER.size) // InputRecorder.RECORD.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> tuple:
+        """返回 (相对时间, 类型, 编号, (方向键x, 方向键y), 轴值)"""
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        t, kind, idx, hx, hy, value = InputRecorder.RECORD.unpack_from(
+            self._mmap, InputRecorder.HEADER.size + index * InputRecorder.RECORD.size)
+        return t, kind, idx, (hx, hy), value
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    @property
+    def duration(self) -> float:
+        return self[self._count - 1][0] if self._count else 0.0
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class VirtualClock:
+    """虚拟时钟 - 回放时代替 perf_counter，由调用方推进"""
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def __call__(self) -> float:
+        return self.time
+
+    def advance(self, seconds: float):
+        self.time += seconds
+
+
+class _ReplayEvent:
+    """回放产生的手柄事件（字段与 pygame 手柄事件一致，另带录制时的时间戳）"""
+
+    __slots__ = ("type", "instance_id", "timestamp", "axis", "button", "hat", "value")
+
+    def __init__(self, event_type: int, instance_id: int, timestamp: float, **fields):
+        self.type = event_type
+        self.instance_id = instance_id
+        self.timestamp = timestamp
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+class VirtualJoystick:
+    """虚拟手柄 - 提供与 pygame.joystick.Joystick 相同的查询接口，状态由回放后端更新"""
+
+    def __init__(self, recording: InputRecording, instance_id: int = 0):
+        self.recording = recording
+        self.instance_id = instance_id
+        self.axes = [0.0] * recording.num_axes
+        self.buttons = [False] * recording.num_buttons
+        self.hats = [(0, 0)] * recording.num_hats
+        self._init = False
+
+    def init(self):
+        self._init = True
+
+    def quit(self):
+        self._init = False
+
+    def get_init(self) -> bool:
+        return self._init
+
+    def get_name(self) -> str:
+        return self.recording.name
+
+    def get_guid(self) -> str:
+        return self.recording.guid
+
+    def get_instance_id(self) -> int:
+        return self.instance_id
+
+    def get_numaxes(self) -> int:
+        return len(self.axes)
+
+    def get_numbuttons(self) -> int:
+        return len(self.buttons)
+
+    def get_numhats(self) -> int:
+        return len(self.hats)
+
+    def get_axis(self, index: int) -> float:
+        return self.axes[index]
+
+    def get_button(self, index: int) -> bool:
+        return self.buttons[index]
+
+    def get_hat(self, index: int) -> tuple:
+        return self.hats[index]
+
+
+class ReplayBackend(JoystickBackend):
+    """
+    回放输入后端 - 把录制文件当作一个虚拟手柄
+    clock 为 None 时按真实时间（原始节奏）回放；传入 VirtualClock 时由调用方推进时间，
+    回放结果只取决于录制内容和推进步长，可以重复得到相同的输出
+    """
+
+    name = "replay"
+
+    def __init__(self, recording: InputRecording, clock=None):
+        self.recording = recording
+        self.clock = clock or time.perf_counter
+        self.joystick = VirtualJoystick(recording)
+        self._start = None
+        self._cursor = 0
+        self._pending = []
+
+    def init(self):
+        if self._start is None:
+            self._start = self.clock()
+
+    def reinit(self):
+        pass
+
+    def count(self) -> int:
+        return 1
+
+    def open(self, index: int):
+        self.joystick.init()
+        return self.joystick
+
+    @property
+    def finished(self) -> bool:
+        """录制是否已全部回放"""
+        return self._cursor >= len(self.recording)
+
+    def _advance(self):
+        """应用当前时间之前的全部记录，更新虚拟手柄状态并生成事件"""
+        if self._start is None:
+            self.init()
+        elapsed = self.clock() - self._start
+        recording = self.recording
+        joystick = self.joystick
+        instance_id = joystick.instance_id
+        pending = self._pending
+        while self._cursor < len(recording):
+            t, kind, index, hat, value = recording[self._cursor]
+            if t > elapsed:
+                break
+            self._cursor += 1
+            timestamp = self._start + t
+            if kind == InputRecorder.AXIS:
+                joystick.axes[index] = value
+                pending.append(_ReplayEvent(pygame.JOYAXISMOTION, instance_id, timestamp,
+                                            axis=index, value=value))
+            elif kind == InputRecorder.HAT:
+                joystick.hats[index] = hat
+                pending.append(_ReplayEvent(pygame.JOYHATMOTION, instance_id, timestamp,
+                                            hat=index, value=hat))
+            else:
+                down = kind == InputRecorder.BUTTON_DOWN
+                joystick.buttons[index] = down
+                pending.append(_ReplayEvent(pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP,
+                                            instance_id, timestamp, button=index))
+
+    def pump(self):
+        self._advance()
+        self._pending.clear()
+
+    def get_events(self) -> list:
+        self._advance()
+        events, self._pending = self._pending, []
+        return events
+
+    def get_device_events(self) -> list:
+        self.pump()
+        return []
+
+    def now(self) -> float:
+        return self.clock()
+
+
+# 动作类型的界面名称（也是版本1配置文件中的取值）
+ACTION_NONE = "无动作"
+ACTION_MOUSE_CLICK = "鼠标点击"
+ACTION_MOUSE_LEFT = "鼠标左键"
+ACTION_MOUSE_RIGHT = "鼠标右键"
+ACTION_KEYBOARD = "键盘按键"
+ACTION_MACRO = "宏"
+
+
+class ActionType(enum.Enum):
+    """动作类型（值为版本2配置文件中的取值）"""
+
+    NONE = "none"
+    MOUSE_LEFT = "mouse_left"
+    MOUSE_RIGHT = "mouse_right"
+    MOUSE_CLICK = "mouse_click"
+    KEYBOARD = "keyboard"
+    MACRO = "macro"
+
+    @property
+    def label(self) -> str:
+        """界面显示的名称"""
+        return ACTION_LABELS[self]
+
+    @classmethod
+    def parse(cls, value) -> "ActionType":
+        """由配置取值或界面名称得到动作类型，未知时抛出 MappingError"""
+        if isinstance(value, cls):
+            return value
+        if not value:
+            return cls.NONE
+        action = _ACTIONS_BY_NAME.get(value)
+        if action is None:
+            raise MappingError(f"未知的动作类型: {value}")
+        return action
+
+
+ACTION_LABELS = {
+    ActionType.NONE: ACTION_NONE,
+    ActionType.MOUSE_LEFT: ACTION_MOUSE_LEFT,
+    ActionType.MOUSE_RIGHT: ACTION_MOUSE_RIGHT,
+    ActionType.MOUSE_CLICK: ACTION_MOUSE_CLICK,
+    ActionType.KEYBOARD: ACTION_KEYBOARD,
+    ActionType.MACRO: ACTION_MACRO,
+}
+_ACTIONS_BY_NAME = {**{action.value: action for action in ActionType},
+                    **{label: action for action, label in ACTION_LABELS.items()}}
+
+# 输出事件类型，事件格式为 (类型, 参数1, 参数2)
+OUT_MOVE = 0      # 相对移动 (dx, dy)
+OUT_MOVE_TO = 1   # 绝对定位 (x, y)
+OUT_BUTTON = 2    # 鼠标按键 ("left"/"right"/"middle", 是否按下)
+OUT_KEY = 3       # 键盘按键 (键码, 是否按下)
+OUT_WHEEL = 4     # 滚轮 (格数, 0)
+OUTPUT_EVENT_NAMES = ("move", "move_to", "button", "key", "wheel")
+
+
+class MappingError(ValueError):
+    """映射配置无效"""
+
+
+class OutputError(RuntimeError):
+    """输出后端不可用或注入失败"""
+
+
+class PartialSendError(OutputError):
+    """批量注入中途失败：前 delivered 个事件已经注入，第 delivered 个事件失败"""
+
+    def __init__(self, delivered: int, error: Exception):
+        super().__init__(f"第{delivered + 1}个事件注入失败: {error}")
+        self.delivered = delivered
+
+
+def normalize_key_name(name: str) -> str:
+    """与 pyautogui 一致：多字符按键名不区分大小写"""
+    name = name.strip()
+    return name if len(name) == 1 else name.lower()
+
+
+class OutputSink:
+    """输出后端基类 - 所有鼠标/键盘注入都通过输出后端完成
+
+    子类实现 _move / _move_to / _button / _key / _wheel，基类负责按事件类型
+    统计注入次数和耗时，便于比较不同后端的单次注入开销。
+    send() 批量注入一个周期内的全部事件，支持的后端会重写 _send 以一次
+    系统调用提交，使组合键原子地到达目标程序；批量注入同样按事件类型计数，
+    耗时按批内事件数平均分摊。
+    atomic 为 True 的后端一个批次要么全部注入、要么全部失败；其余后端中途失败时
+    抛出 PartialSendError，说明失败前已经注入了多少个事件。
+    """
+
+    name = "base"
+    atomic = False
+
+    def __init__(self):
+        self._handlers = (self._move, self._move_to, self._button, self._key, self._wheel)
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空注入耗时统计"""
+        self._counts = [0] * len(OUTPUT_EVENT_NAMES)
+        self._total_ns = [0] * len(OUTPUT_EVENT_NAMES)
+        self._max_ns = [0] * len(OUTPUT_EVENT_NAMES)
+        self._batches = 0
+        self._batch_events = 0
+        self._batch_total_ns = 0
+        self._batch_max_ns = 0
+
+    def send(self, events):
+        """批量注入事件列表 [(类型, 参数1, 参数2), ...]"""
+        if not events:
+            return
+        start = time.perf_counter_ns()
+        self._send(events)
+        elapsed = time.perf_counter_ns() - start
+        self._batches += 1
+        self._batch_events += len(events)
+        self._batch_total_ns += elapsed
+        if elapsed > self._batch_max_ns:
+            self._batch_max_ns = elapsed
+        share = elapsed // len(events)
+        counts = self._counts
+        total_ns = self._total_ns
+        max_ns = self._max_ns
+        for event in events:
+            op = event[0]
+            counts[op] += 1
+            total_ns[op] += share
+            if share > max_ns[op]:
+                max_ns[op] = share
+
+    def _send(self, events):
+        """默认逐个注入，原生后端重写为一次提交"""
+        handlers = self._handlers
+        for index, (op, a, b) in enumerate(events):
+            try:
+                handlers[op](a, b)
+            except Exception as e:
+                raise PartialSendError(index, e) from e
+
+    def emit(self, op: int, a=0, b=0):
+        """注入一个输出事件"""
+        start = time.perf_counter_ns()
+        self._handlers[op](a, b)
+        elapsed = time.perf_counter_ns() - start
+        self._counts[op] += 1
+        self._total_ns[op] += elapsed
+        if elapsed > self._max_ns[op]:
+            self._max_ns[op] = elapsed
+
+    def move(self, dx, dy):
+        self.emit(OUT_MOVE, dx, dy)
+
+    def move_to(self, x: int, y: int):
+        self.emit(OUT_MOVE_TO, x, y)
+
+    def button(self, button: str, down: bool):
+        self.emit(OUT_BUTTON, button, down)
+
+    def key(self, keycode: int, down: bool):
+        self.emit(OUT_KEY, keycode, down)
+
+    def wheel(self, delta: int):
+        self.emit(OUT_WHEEL, delta, 0)
+
+    def resolve_key(self, name: str) -> int:
+        """将按键名称解析为本后端的键码，无法识别时抛出 MappingError"""
+        raise NotImplementedError
+
+    def position(self) -> Optional[tuple]:
+        """获取当前鼠标位置（后端无法读取时返回 None）"""
+        return None
+
+    def supports_move_to(self) -> bool:
+        """是否支持绝对定位（坐标点击），不支持时编译坐标点击会抛出 MappingError"""
+        return True
+
+    def require_move_to(self):
+        """编译需要绝对定位的动作前检查，不支持时抛出 MappingError"""
+        if not self.supports_move_to():
+            raise MappingError(f"输出后端 {self.name} 不支持坐标点击（未提供屏幕尺寸）")
+
+    def close(self):
+        """释放后端资源"""
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """按事件类型统计注入次数和耗时（微秒）"""
+        result = {}
+        for op, event_name in enumerate(OUTPUT_EVENT_NAMES):
+            count = self._counts[op]
+            if count:
+                result[event_name] = {
+                    "count": count,
+                    "avg_us": self._total_ns[op] / count / 1000,
+                    "max_us": self._max_ns[op] / 1000,
+                }
+        if self._batches:
+            result["batch"] = {
+                "count": self._batches,
+                "events": self._batch_events,
+                "avg_us": self._batch_total_ns / self._batches / 1000,
+                "max_us": self._batch_max_ns / 1000,
+                "avg_event_us": self._batch_total_ns / self._batch_events / 1000,
+            }
+        return result
+
+    def _move(self, dx, dy):
+        raise NotImplementedError
+
+    def _move_to(self, x, y):
+        raise NotImplementedError
+
+    def _button(self, button, down):
+        raise NotImplementedError
+
+    def _key(self, keycode, down):
+        raise NotImplementedError
+
+    def _wheel(self, delta, unused=0):
+        raise NotImplementedError
+
+
+_SENDINPUT_TYPES = None
+
+
+def _sendinput_types() -> tuple:
+    """按需定义 Windows SendInput 使用的 ctypes 结构，返回 (INPUT, MOUSEINPUT, KEYBDINPUT)"""
+    global _SENDINPUT_TYPES
+    if _SENDINPUT_TYPES is None:
+        import ctypes
+        from ctypes import wintypes
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [("dx", wintypes.LONG), ("dy", wintypes.LONG), ("mouseData", wintypes.DWORD),
+                        ("dwFlags", wintypes.DWORD), ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [("wVk", wintypes.WORD), ("wScan", wintypes.WORD), ("dwFlags", wintypes.DWORD),
+                        ("time", wintypes.DWORD), ("dwExtraInfo", ctypes.c_size_t)]
+
+        class HARDWAREINPUT(ctypes.Structure):
+            _fields_ = [("uMsg", wintypes.DWORD), ("wParamL", wintypes.WORD), ("wParamH", wintypes.WORD)]
+
+        class INPUTUNION(ctypes.Union):
+            _fields_ = [("mi", MOUSEINPUT), ("ki", KEYBDINPUT), ("hi", HARDWAREINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [("type", wintypes.DWORD), ("union", INPUTUNION)]
+
+        _SENDINPUT_TYPES = (INPUT, MOUSEINPUT, KEYBDINPUT)
+    return _SENDINPUT_TYPES
+
+
+class PyAutoGUISink(OutputSink):
+    """pyautogui / mouse 输出后端（通用回退方案）
+
+    Windows 下直接构造 INPUT 数组调用 SendInput，一个批次只需一次系统调用；
+    其他平台逐个调用 pyautogui / mouse。
+    """
+
+    name = "pyautogui"
+
+    # winuser.h
+    INPUT_MOUSE = 0
+    INPUT_KEYBOARD = 1
+    WHEEL_DELTA = 120
+    VK_SHIFT, VK_CONTROL, VK_MENU = 0x10, 0x11, 0x12
+    MOUSEEVENTF_MOVE = 0x0001
+    MOUSEEVENTF_ABSOLUTE = 0x8000
+    MOUSEEVENTF_WHEEL = 0x0800
+    KEYEVENTF_KEYUP = 0x0002
+    BUTTON_FLAGS = {"left": (0x0002, 0x0004), "right": (0x0008, 0x0010), "middle": (0x0020, 0x0040)}
+
+    def __init__(self):
+        super().__init__()
+        self._user32 = None
+        if sys.platform == "win32":
+            import ctypes
+            self._user32 = ctypes.windll.user32
+            self._input_type, self._mouse_input_type, self._keybd_input_type = _sendinput_types()
+            self._input_size = ctypes.sizeof(self._input_type)
+            self.atomic = True  # 整批先转换为 INPUT 数组，再一次 SendInput 提交
+        # VkKeyScan 高字节中的修饰键标志 -> 虚拟键码
+        self._vk_modifiers = ((1, self.VK_SHIFT), (2, self.VK_CONTROL), (4, self.VK_MENU))
+        self._key_names = {}  # 键码 -> 按键名称（非Windows平台需要按名称注入）
+
+    def resolve_key(self, name: str) -> int:
+        key = normalize_key_name(name)
+        try:
+            platform_module = getattr(pyautogui, "platformModule", None)
+        except Exception as e:  # 无显示环境下 pyautogui 无法导入
+            raise MappingError(f"pyautogui 不可用: {e}")
+        keyboard_mapping = getattr(platform_module, "keyboardMapping", None) or {}
+        keycode = keyboard_mapping.get(key)
+        if keycode is None:
+            raise MappingError(f"无法识别的按键: {name}")
+        self._key_names[keycode] = key
+        return keycode
+
+    def position(self) -> Optional[tuple]:
+        return tuple(pyautogui.position())
+
+    def _send(self, events):
+        if self._user32 is None:
+            super()._send(events)
+            return
+
+        inputs = []
+        for op, a, b in events:
+            self._append_inputs(inputs, op, a, b)
+        if inputs:
+            array_type = self._input_type * len(inputs)
+            self._user32.SendInput(len(inputs), array_type(*inputs), self._input_size)
+
+    def _append_inputs(self, inputs: list, op: int, a, b):
+        """将一个输出事件转换为 INPUT 结构追加到列表"""
+        if op == OUT_KEY:
+            modifiers, vk = divmod(a, 0x100)
+            if b:
+                for flag, modifier_vk in self._vk_modifiers:
+                    if modifiers & flag:
+                        inputs.append(self._key_input(modifier_vk, 0))
+                inputs.append(self._key_input(vk, 0))
+            else:
+                inputs.append(self._key_input(vk, self.KEYEVENTF_KEYUP))
+                for flag, modifier_vk in reversed(self._vk_modifiers):
+                    if modifiers & flag:
+                        inputs.append(self._key_input(modifier_vk, self.KEYEVENTF_KEYUP))
+        elif op == OUT_MOVE:
+            inputs.append(self._mouse_input(self.MOUSEEVENTF_MOVE, int(round(a)), int(round(b))))
+        elif op == OUT_MOVE_TO:
+            # 绝对坐标需归一化到 0~65535
+            width = self._user32.GetSystemMetrics(0)
+            height = self._user32.GetSystemMetrics(1)
+            inputs.append(self._mouse_input(self.MOUSEEVENTF_MOVE | self.MOUSEEVENTF_ABSOLUTE,
+                                            a * 65535 // max(width - 1, 1),
+                                            b * 65535 // max(height - 1, 1)))
+        elif op == OUT_BUTTON:
+            down_flag, up_flag = self.BUTTON_FLAGS[a]
+            inputs.append(self._mouse_input(down_flag if b else up_flag))
+        elif op == OUT_WHEEL:
+            inputs.append(self._mouse_input(self.MOUSEEVENTF_WHEEL, data=int(a) * self.WHEEL_DELTA))
+
+    def _mouse_input(self, flags: int, dx: int = 0, dy: int = 0, data: int = 0):
+        item = self._input_type(type=self.INPUT_MOUSE)
+        item.union.mi = self._mouse_input_type(dx, dy, data & 0xFFFFFFFF, flags, 0, 0)
+        return item
+
+    def _key_input(self, vk: int, flags: int):
+        item = self._input_type(type=self.INPUT_KEYBOARD)
+        item.union.ki = self._keybd_input_type(vk, 0, flags, 0, 0)
+        return item
+
+    def _move(self, dx, dy):
+        if self._user32 is not None:
+            self._send(((OUT_MOVE, dx, dy),))
+        else:
+            mouse.move(dx, dy, absolute=False)
+
+    def _move_to(self, x, y):
+        if self._user32 is not None:
+            self._send(((OUT_MOVE_TO, x, y),))
+        else:
+            pyautogui.moveTo(x, y)
+
+    def _button(self, button, down):
+        if self._user32 is not None:
+            self._send(((OUT_BUTTON, button, down),))
+        elif down:
+            pyautogui.mouseDown(button=button)
+        else:
+            pyautogui.mouseUp(button=button)
+
+    def _key(self, keycode, down):
+        if self._user32 is not None:
+            self._send(((OUT_KEY, keycode, down),))
+        elif down:
+            pyautogui.keyDown(self._key_names[keycode])
+        else:
+            pyautogui.keyUp(self._key_names[keycode])
+
+    def _wheel(self, delta, unused=0):
+        if self._user32 is not None:
+            self._send(((OUT_WHEEL, delta, 0),))
+        else:
+            mouse.wheel(delta)
+
+
+# Linux input-event-codes.h 中的键码（按 pyautogui 的按键命名）
+LINUX_KEY_CODES = {
+    "esc": 1, "escape": 1, "1": 2, "2": 3, "3": 4, "4": 5, "5": 6, "6": 7, "7": 8,
+    "8": 9, "9": 10, "0": 11, "-": 12, "=": 13, "backspace": 14, "\b": 14, "tab": 15,
+    "\t": 15, "q": 16, "w": 17, "e": 18, "r": 19, "t": 20, "y": 21, "u": 22, "i": 23,
+    "o": 24, "p": 25, "[": 26, "]": 27, "enter": 28, "return": 28, "\n": 28,
+    "ctrl": 29, "ctrlleft": 29, "a": 30, "s": 31, "d": 32, "f": 33, "g": 34, "h": 35,
+    "j": 36, "k": 37, "l": 38, ";": 39, "'": 40, "`": 41, "shift": 42, "shiftleft": 42,
+    "\\": 43, "z": 44, "x": 45, "c": 46, "v": 47, "b": 48, "n": 49, "m": 50, ",": 51,
+    ".": 52, "/": 53, "shiftright": 54, "multiply": 55, "alt": 56, "altleft": 56,
+    " ": 57, "space": 57, "capslock": 58, "f1": 59, "f2": 60, "f3": 61, "f4": 62,
+    "f5": 63, "f6": 64, "f7": 65, "f8": 66, "f9": 67, "f10": 68, "numlock": 69,
+    "scrolllock": 70, "num7": 71, "num8": 72, "num9": 73, "subtract": 74, "num4": 75,
+    "num5": 76, "num6": 77, "add": 78, "num1": 79, "num2": 80, "num3": 81, "num0": 82,
+    "decimal": 83, "f11": 87, "f12": 88, "divide": 98, "ctrlright": 97,
+    "printscreen": 99, "prtsc": 99, "altright": 100, "home": 102, "up": 103,
+    "pageup": 104, "pgup": 104, "left": 105, "right": 106, "end": 107, "down": 108,
+    "pagedown": 109, "pgdn": 109, "insert": 110, "delete": 111, "del": 111,
+    "volumemute": 113, "volumedown": 114, "volumeup": 115, "pause": 119,
+    "win": 125, "winleft": 125, "winright": 126, "apps": 127,
+    "nexttrack": 163, "playpause": 164, "prevtrack": 165, "stop": 166,
+    "f13": 183, "f14": 184, "f15": 185, "f16": 186, "f17": 187, "f18": 188,
+    "f19": 189, "f20": 190, "f21": 191, "f22": 192, "f23": 193, "f24": 194,
+}
+# 需要按住 Shift 才能输入的字符 -> 基础按键
+LINUX_SHIFTED_KEYS = dict(zip('!@#$%^&*()_+{}|:"<>?~', '1234567890-=[]\\;\',./`'))
+LINUX_SHIFT_FLAG = 1 << 16  # 键码高位：需要同时按下 Shift
+
+
+def linux_keycode(name: str) -> int:
+    """按 Linux 键码表解析按键名称，无法识别时抛出 MappingError"""
+    key = normalize_key_name(name)
+    if key in LINUX_KEY_CODES:
+        return LINUX_KEY_CODES[key]
+    if len(key) == 1 and key.isupper():
+        return LINUX_KEY_CODES[key.lower()] | LINUX_SHIFT_FLAG
+    if key in LINUX_SHIFTED_KEYS:
+        return LINUX_KEY_CODES[LINUX_SHIFTED_KEYS[key]] | LINUX_SHIFT_FLAG
+    raise MappingError(f"无法识别的按键: {name}")
+
+
+class UInputSink(OutputSink):
+    """Linux /dev/uinput 原生输出后端
+
+    创建虚拟键盘+相对鼠标设备；提供屏幕尺寸时再创建一个绝对定位设备用于
+    坐标点击。事件直接写入内核，不经过 X11/xdotool。
+    """
+
+    name = "uinput"
+
+    # linux/input-event-codes.h
+    EV_SYN, EV_KEY, EV_REL, EV_ABS = 0x00, 0x01, 0x02, 0x03
+    SYN_REPORT = 0
+    REL_X, REL_Y, REL_WHEEL = 0x00, 0x01, 0x08
+    ABS_X, ABS_Y = 0x00, 0x01
+    BUTTON_CODES = {"left": 0x110, "right": 0x111, "middle": 0x112}
+    KEY_LEFTSHIFT = 42
+
+    # linux/uinput.h
+    UI_DEV_CREATE = 0x5501
+    UI_DEV_DESTROY = 0x5502
+    UI_SET_EVBIT = 0x40045564
+    UI_SET_KEYBIT = 0x40045565
+    UI_SET_RELBIT = 0x40045566
+    UI_SET_ABSBIT = 0x40045567
+    BUS_USB = 0x03
+    ABS_CNT = 64
+
+    EVENT_FORMAT = "llHHi"  # struct input_event: timeval + type + code + value
+
+    def __init__(self, screen_size: Optional[tuple] = None, device_path: str = "/dev/uinput"):
+        super().__init__()
+        import fcntl
+        self._ioctl = fcntl.ioctl
+        self._event_struct = struct.Struct(self.EVENT_FORMAT)
+        self._syn_report = self._event_struct.pack(0, 0, self.EV_SYN, self.SYN_REPORT, 0)
+        self.screen_size = screen_size
+        self._last_abs = None
+
+        try:
+            self._fd = self._create_device(device_path, "controller-mapper virtual input", absolute=False)
+            self._abs_fd = None
+            if screen_size:
+                self._abs_fd = self._create_device(device_path, "controller-mapper virtual pointer", absolute=True)
+        except OSError as e:
+            raise OutputError(f"无法创建 uinput 设备: {e}")
+
+    def _create_device(self, device_path: str, device_name: str, absolute: bool) -> int:
+        """创建一个 uinput 虚拟设备"""
+        fd = os.open(device_path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            ioctl = self._ioctl
+            ioctl(fd, self.UI_SET_EVBIT, self.EV_KEY)
+            for code in self.BUTTON_CODES.values():
+                ioctl(fd, self.UI_SET_KEYBIT, code)
+
+            absmax = [0] * self.ABS_CNT
+            if absolute:
+                ioctl(fd, self.UI_SET_EVBIT, self.EV_ABS)
+                ioctl(fd, self.UI_SET_ABSBIT, self.ABS_X)
+                ioctl(fd, self.UI_SET_ABSBIT, self.ABS_Y)
+                absmax[self.ABS_X] = self.screen_size[0] - 1
+                absmax[self.ABS_Y] = self.screen_size[1] - 1
+            else:
+                ioctl(fd, self.UI_SET_EVBIT, self.EV_REL)
+                for code in (self.REL_X, self.REL_Y, self.REL_WHEEL):
+                    ioctl(fd, self.UI_SET_RELBIT, code)
+                for code in set(LINUX_KEY_CODES.values()):
+                    ioctl(fd, self.UI_SET_KEYBIT, code)
+
+            # struct uinput_user_dev: name[80] + input_id + ff_effects_max + absmax/absmin/absfuzz/absflat
+            zeros = [0] * self.ABS_CNT
+            user_dev = struct.pack(f"80sHHHHi{self.ABS_CNT * 4}i",
+                                         device_name.encode("utf-8"), self.BUS_USB, 0x045e, 0x7a11, 1, 0,
+                                         *absmax, *zeros, *zeros, *zeros)
+            os.write(fd, user_dev)
+            ioctl(fd, self.UI_DEV_CREATE)
+        except OSError:
+            os.close(fd)
+            raise
+        return fd
+
+    def resolve_key(self, name: str) -> int:
+        return linux_keycode(name)
+
+    def position(self) -> Optional[tuple]:
+        return self._last_abs
+
+    def supports_move_to(self) -> bool:
+        # 绝对定位设备只有提供了屏幕尺寸时才会创建
+        return self._abs_fd is not None
+
+    def _encode(self, op: int, a, b) -> tuple:
+        """将一个输出事件编码为 (设备描述符, input_event 字节)，不含 SYN_REPORT"""
+        pack = self._event_struct.pack
+        if op == OUT_MOVE:
+            dx, dy = int(round(a)), int(round(b))
+            data = b""
+            if dx:
+                data += pack(0, 0, self.EV_REL, self.REL_X, dx)
+            if dy:
+                data += pack(0, 0, self.EV_REL, self.REL_Y, dy)
+            return self._fd, data
+        if op == OUT_MOVE_TO:
+            if self._abs_fd is None:
+                raise OutputError("uinput 后端未配置屏幕尺寸，无法定位坐标")
+            self._last_abs = (a, b)
+            return self._abs_fd, pack(0, 0, self.EV_ABS, self.ABS_X, a) + pack(0, 0, self.EV_ABS, self.ABS_Y, b)
+        if op == OUT_BUTTON:
+            return self._fd, pack(0, 0, self.EV_KEY, self.BUTTON_CODES[a], 1 if b else 0)
+        if op == OUT_KEY:
+            value = 1 if b else 0
+            data = pack(0, 0, self.EV_KEY, a & 0xFFFF, value)
+            if a & LINUX_SHIFT_FLAG:
+                shift_event = pack(0, 0, self.EV_KEY, self.KEY_LEFTSHIFT, value)
+                data = shift_event + data if b else data + shift_event
+            return self._fd, data
+        return self._fd, pack(0, 0, self.EV_REL, self.REL_WHEEL, int(a))
+
+    def _send(self, events):
+        """整批事件按设备合并，每个设备只写一次并以一个 SYN_REPORT 结束
+
+        跨设备的批次分几次写入，中途失败时抛出 PartialSendError（已写入的事件不会重发）。
+        """
+        syn = self._syn_report
+        current_fd = None
+        chunk = []
+        start = 0  # 当前未写入部分的第一个事件
+        for index, (op, a, b) in enumerate(events):
+            try:
+                fd, data = self._encode(op, a, b)
+            except Exception as e:
+                # 先写入失败事件之前的部分，只有失败的事件本身没有注入
+                if chunk:
+                    self._write_chunk(current_fd, chunk, start)
+                raise PartialSendError(index, e) from e
+            if not data:
+                continue
+            if fd != current_fd and chunk:
+                # 切换设备（绝对定位 <-> 键盘/相对鼠标）时先提交已有事件，保证顺序
+                self._write_chunk(current_fd, chunk, start)
+                chunk = []
+                start = index
+            current_fd = fd
+            chunk.append(data)
+        if chunk:
+            self._write_chunk(current_fd, chunk, start)
+
+    def _write_chunk(self, fd: int, chunk: list, start: int):
+        """以一个 SYN_REPORT 结束并一次写入，失败时抛出 PartialSendError"""
+        chunk.append(self._syn_report)
+        try:
+            os.write(fd, b"".join(chunk))
+        except OSError as e:
+            raise PartialSendError(start, e) from e
+
+    def _move(self, dx, dy):
+        self._send(((OUT_MOVE, dx, dy),))
+
+    def _move_to(self, x, y):
+        self._send(((OUT_MOVE_TO, x, y),))
+
+    def _button(self, button, down):
+        self._send(((OUT_BUTTON, button, down),))
+
+    def _key(self, keycode, down):
+        self._send(((OUT_KEY, keycode, down),))
+
+    def _wheel(self, delta, unused=0):
+        self._send(((OUT_WHEEL, delta, 0),))
+
+    def close(self):
+        for fd in (self._fd, self._abs_fd):
+            if fd is None:
+                continue
+            try:
+                self._ioctl(fd, self.UI_DEV_DESTROY)
+            except OSError:
+                pass
+            os.close(fd)
+        self._fd = self._abs_fd = None
+
+
+class RecordingSink(OutputSink):
+    """内存记录后端 - 只记录事件不实际注入，用于测试和基准"""
+
+    name = "recording"
+
+    def __init__(self, start_position: tuple = (0, 0)):
+        super().__init__()
+        self.events = []
+        self.batches = []  # 每次 send() 提交的事件数，用于验证批量提交
+        self._position = list(start_position)
+
+    def _send(self, events):
+        super()._send(events)
+        self.batches.append(len(events))
+
+    def resolve_key(self, name: str) -> int:
+        return linux_keycode(name)
+
+    def position(self) -> Optional[tuple]:
+        return tuple(self._position)
+
+    def clear(self):
+        """清空已记录的事件"""
+        self.events.clear()
+        self.batches.clear()
+
+    def _move(self, dx, dy):
+        self.events.append((OUT_MOVE, dx, dy))
+        self._position[0] += dx
+        self._position[1] += dy
+
+    def _move_to(self, x, y):
+        self.events.append((OUT_MOVE_TO, x, y))
+        self._position[:] = [x, y]
+
+    def _button(self, button, down):
+        self.events.append((OUT_BUTTON, button, down))
+
+    def _key(self, keycode, down):
+        self.events.append((OUT_KEY, keycode, down))
+
+    def _wheel(self, delta, unused=0):
+        self.events.append((OUT_WHEEL, delta, 0))
+
+
+class NullSink(OutputSink):
+    """空输出后端 - 丢弃所有事件，用于基准测试中只测量映射本身的开销"""
+
+    name = "null"
+
+    def resolve_key(self, name: str) -> int:
+        return linux_keycode(name)
+
+    def _send(self, events):
+        pass
+
+    def _move(self, dx, dy):
+        pass
+
+    def _move_to(self, x, y):
+        pass
+
+    def _button(self, button, down):
+        pass
+
+    def _key(self, keycode, down):
+        pass
+
+    def _wheel(self, delta, unused=0):
+        pass
+
+
+OUTPUT_BACKENDS = ("auto", "uinput", "pyautogui", "recording", "null")
+
+
+def create_output_sink(backend: str = "auto", screen_size: Optional[tuple] = None) -> OutputSink:
+    """按名称创建输出后端；auto 在 Linux 上优先使用 uinput，不可用时回退到 pyautogui"""
+    if backend not in OUTPUT_BACKENDS:
+        raise ValueError(f"不支持的输出后端: {backend}，可选 {OUTPUT_BACKENDS}")
+
+    if backend == "recording":
+        return RecordingSink()
+    if backend == "null":
+        return NullSink()
+    if backend == "uinput":
+        return UInputSink(screen_size)
+    if backend == "auto" and sys.platform.startswith("linux") and os.access("/dev/uinput", os.W_OK):
+        try:
+            return UInputSink(screen_size)
+        except OutputError as e:
+            log.warning("%s，改用 pyautogui 输出", e)
+    return PyAutoGUISink()
+
+
+class MouseClickAction:
+    """鼠标点击动作（坐标为空时在当前位置点击）"""
+
+    __slots__ = ("button", "x", "y", "description", "events")
+    kind = "mouse_click"  # 延迟统计使用的动作类别
+    BUTTON_LABELS = {"left": "左", "right": "右", "middle": "中"}
+
+    def __init__(self, button: str = "left", x: Optional[int] = None, y: Optional[int] = None):
+        self.button = button
+        self.x = x
+        self.y = y
+        if x is None:
+            self.description = f"执行鼠标{self.BUTTON_LABELS[button]}键"
+        else:
+            self.description = f"执行鼠标点击: ({x}, {y})"
+        # 预先生成输出事件，触发时直接并入本周期的批次
+        events = [(OUT_BUTTON, button, True), (OUT_BUTTON, button, False)]
+        if x is not None:
+            events.insert(0, (OUT_MOVE_TO, x, y))
+        self.events = tuple(events)
+
+    def __call__(self, sink: OutputSink):
+        sink.send(self.events)
+
+
+class KeyPressAction:
+    """键盘按键动作（键码在编译时按输出后端解析）"""
+
+    __slots__ = ("key", "keycode", "description", "events")
+    kind = "keyboard"
+
+    def __init__(self, key: str, keycode: int):
+        self.key = key
+        self.keycode = keycode
+        self.description = f"执行按键: {key}"
+        self.events = ((OUT_KEY, keycode, True), (OUT_KEY, keycode, False))
+
+    def __call__(self, sink: OutputSink):
+        sink.send(self.events)
+
+
+class WheelAction:
+    """滚轮动作（摇杆滚轮模式使用，不更新界面状态）"""
+
+    __slots__ = ("delta", "description", "events")
+    kind = "wheel"
+
+    def __init__(self, delta: int):
+        self.delta = delta
+        self.description = None
+        self.events = ((OUT_WHEEL, delta, 0),)
+
+    def __call__(self, sink: OutputSink):
+        sink.send(self.events)
+
+
+MOUSE_BUTTONS = ("left", "right", "middle")
+
+
+def parse_macro_steps(steps) -> tuple:
+    """解析配置文件中的宏步骤列表，返回 ((步骤类型, 参数), ...)，配置无效时抛出 MappingError
+
+    每一步是只有一个键的对象：key / key_down / key_up（按键名称）、click（坐标 [x, y]
+    或鼠标按键名称）、button_down / button_up、move_to（[x, y]）、wheel（格数）、wait（毫秒）。
+    """
+    if not isinstance(steps, (list, tuple)):
+        raise MappingError(f"宏步骤必须是列表: {steps!r}")
+    parsed = []
+    for step in steps:
+        if not isinstance(step, dict) or len(step) != 1:
+            raise MappingError(f"宏步骤必须是只有一个键的对象: {step!r}")
+        (op, value), = step.items()
+        if op in ("key", "key_down", "key_up"):
+            value = value.strip() if isinstance(value, str) else ""
+            if not value:
+                raise MappingError(f"宏步骤缺少按键名称: {step!r}")
+        elif op in ("button_down", "button_up") or (op == "click" and isinstance(value, str)):
+            if value not in MOUSE_BUTTONS:
+                raise MappingError(f"未知的鼠标按键: {value!r}")
+        elif op in ("click", "move_to"):
+            try:
+                x, y = value
+                value = (int(x), int(y))
+            except (TypeError, ValueError):
+                raise MappingError(f"无效的鼠标坐标: {value!r}")
+        elif op == "wheel":
+            if type(value) is not int:
+                raise MappingError(f"无效的滚轮格数: {value!r}")
+        elif op == "wait":
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value < math.inf:
+                raise MappingError(f"无效的等待时间: {value!r}")
+        else:
+            raise MappingError(f"未知的宏步骤: {op}")
+        parsed.append((op, value))
+    return tuple(parsed)
+
+
+class MacroAction:
+    """宏动作 - 一串带时间间隔的输入，由 MacroScheduler 在独立线程中按时间点注入
+
+    编译时把步骤折叠为时间线 ((相对开始的秒数, 输出事件, 仍按住的键的松开事件), ...)：
+    两次等待之间的输入合并为一批原子提交；宏结束或被取消时松开仍按住的键。
+    repeat 为执行次数，0 表示一直循环直到被取消。
+    """
+
+    __slots__ = ("steps", "repeat", "timeline", "duration", "description", "events")
+    kind = "macro"
+
+    def __init__(self, steps: tuple, repeat: int, sink: OutputSink):
+        self.steps = steps
+        self.repeat = repeat
+        self.description = f"宏执行完成（{len(steps)}步）"
+        self.events = ()  # 宏不随触发它的周期注入，由调度器按时间线注入
+
+        timeline = []
+        batch = []
+        held = {}  # (事件类型, 键码或鼠标按键) -> 松开事件，按按下的顺序
+        offset = 0.0
+        for op, value in steps:
+            if op == "wait":
+                if batch:
+                    timeline.append((offset, tuple(batch), tuple(reversed(held.values()))))
+                    batch = []
+                offset += value / 1000
+            elif op == "move_to":
+                sink.require_move_to()
+                batch.append((OUT_MOVE_TO, value[0], value[1]))
+            elif op == "wheel":
+                batch.append((OUT_WHEEL, value, 0))
+            else:
+                if op.startswith("key"):
+                    target = (OUT_KEY, sink.resolve_key(value))
+                elif isinstance(value, tuple):
+                    sink.require_move_to()
+                    batch.append((OUT_MOVE_TO, value[0], value[1]))
+                    target = (OUT_BUTTON, "left")
+                else:
+                    target = (OUT_BUTTON, value)
+                release = target + (False,)
+                if op.endswith("_up"):
+                    batch.append(release)
+                    held.pop(target, None)
+                else:
+                    batch.append(target + (True,))
+                    if op.endswith("_down"):
+                        held[target] = release
+                    else:
+                        batch.append(release)
+        if batch:
+            timeline.append((offset, tuple(batch), tuple(reversed(held.values()))))
+        if not timeline:
+            raise MappingError("宏中没有任何输入步骤")
+        if repeat == 0 and offset <= 0:
+            raise MappingError("循环执行的宏至少需要一个大于0的等待")
+        self.timeline = tuple(timeline)
+        self.duration = offset  # 一次执行的总时长（包括末尾的等待）
+
+
+class ButtonMapping:
+    """单个按键的映射 - 类型化、已校验的数据模型，不含任何界面对象
+
+    创建后不再修改（用 replace 得到副本），可以在界面、方案快照和配置文件之间共享。
+    """
+
+    __slots__ = ("action", "x", "y", "key", "steps", "repeat")
+
+    def __init__(self, action: ActionType = ActionType.NONE, x: Optional[int] = None,
+                 y: Optional[int] = None, key: str = "", steps: tuple = (), repeat: int = 1):
+        self.action = action
+        self.x = x  # 鼠标点击的屏幕坐标（未设置时为 None）
+        self.y = y
+        self.key = key  # 键盘按键名称
+        self.steps = steps  # 宏步骤 ((步骤类型, 参数), ...)，见 parse_macro_steps
+        self.repeat = repeat  # 宏执行次数，0 表示循环直到再次按下
+
+    @classmethod
+    def from_dict(cls, data) -> "ButtonMapping":
+        """解析配置文件中的一条映射，配置无效时抛出 MappingError
+
+        同时支持版本2（action / x / y / key）和版本1（action_type / mouse_x / mouse_y /
+        keyboard_key，坐标为字符串）的写法。
+        """
+        if isinstance(data, ButtonMapping):
+            return data
+        if not isinstance(data, dict):
+            raise MappingError(f"映射必须是对象: {data!r}")
+        if "action" in data:
+            action = ActionType.parse(data["action"])
+            x, y, key = data.get("x"), data.get("y"), data.get("key")
+        else:
+            action = ActionType.parse(data.get("action_type"))
+            x, y, key = data.get("mouse_x"), data.get("mouse_y"), data.get("keyboard_key")
+
+        if action is ActionType.KEYBOARD:
+            return cls(action, key=str(key or "").strip())
+        if action is ActionType.MACRO:
+            repeat = data.get("repeat", 1)
+            if type(repeat) is not int or repeat < 0:
+                raise MappingError(f"无效的宏执行次数: {repeat!r}")
+            return cls(action, steps=parse_macro_steps(data.get("steps") or ()), repeat=repeat)
+        if action is not ActionType.MOUSE_CLICK:
+            return cls(action)
+        if type(x) is int and type(y) is int:
+            return cls(action, x, y)
+        x = "" if x is None else str(x).strip()
+        y = "" if y is None else str(y).strip()
+        if not x or not y:
+            return cls(action)
+        try:
+            return cls(action, int(x), int(y))
+        except ValueError:
+            raise MappingError(f"无效的鼠标坐标: ({x}, {y})")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """导出为版本2配置文件的格式（只写出该动作类型用到的字段）"""
+        data = {"action": self.action.value}
+        if self.action is ActionType.MOUSE_CLICK and self.x is not None and self.y is not None:
+            data["x"] = self.x
+            data["y"] = self.y
+        elif self.action is ActionType.KEYBOARD and self.key:
+            data["key"] = self.key
+        elif self.action is ActionType.MACRO and self.steps:
+            data["steps"] = [{op: list(value) if isinstance(value, tuple) else value}
+                             for op, value in self.steps]
+            if self.repeat != 1:
+                data["repeat"] = self.repeat
+        return data
+
+    def replace(self, **changes) -> "ButtonMapping":
+        """复制出修改了部分字段的新映射"""
+        fields = {slot: getattr(self, slot) for slot in self.__slots__}
+        fields.update(changes)
+        return ButtonMapping(**fields)
+
+    def compile(self, sink: OutputSink):
+        """编译为可直接调用的动作对象，无动作或配置不完整时返回 None"""
+        action = self.action
+        if action is ActionType.NONE:
+            return None
+        if action is ActionType.MOUSE_CLICK:
+            if self.x is None or self.y is None:
+                return None
+            sink.require_move_to()
+            return MouseClickAction("left", self.x, self.y)
+        if action is ActionType.MOUSE_LEFT:
+            return MouseClickAction("left")
+        if action is ActionType.MOUSE_RIGHT:
+            return MouseClickAction("right")
+        if action is ActionType.MACRO:
+            return MacroAction(self.steps, self.repeat, sink) if self.steps else None
+        if not self.key:
+            return None
+        return KeyPressAction(normalize_key_name(self.key), sink.resolve_key(self.key))
+
+    def __eq__(self, other):
+        if not isinstance(other, ButtonMapping):
+            return NotImplemented
+        return ((self.action, self.x, self.y, self.key, self.steps, self.repeat) ==
+                (other.action, other.x, other.y, other.key, other.steps, other.repeat))
+
+    def __repr__(self):
+        return f"ButtonMapping({self.to_dict()})"
+
+
+def compile_action(config, sink: OutputSink):
+    """将一条映射配置（字典或 ButtonMapping）编译为可直接调用的动作对象
+
+    未配置或配置不完整时返回 None；配置无效时抛出 MappingError，
+    保证错误在加载配置时就暴露，而不是在按键触发时。
+    """
+    return ButtonMapping.from_dict(config).compile(sink)
+
+
+CONFIG_VERSION = 2  # 配置文件格式版本
+
+
+def migrate_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """将配置文件内容升级到当前版本（返回新字典，不修改参数），版本不受支持时抛出 ValueError
+
+    版本1（没有 version 字段）的按键映射直接放在顶层，动作类型是界面名称、坐标是字符串；
+    版本2的按键映射放在 buttons 中，动作类型是 ActionType 的取值、坐标是整数。
+    无法解析的映射原样保留，编译方案时再报告。
+    """
+    version = config.get("version", 1)
+    if not isinstance(version, int) or version < 1:
+        raise ValueError(f"无效的配置文件版本: {version!r}")
+    if version > CONFIG_VERSION:
+        raise ValueError(f"配置文件版本 {version} 高于程序支持的版本 {CONFIG_VERSION}")
+    if version == CONFIG_VERSION:
+        return dict(config)
+
+    def upgrade(mappings):
+        result = {}
+        for name, data in mappings.items():
+            try:
+                result[name] = ButtonMapping.from_dict(data).to_dict()
+            except MappingError:
+                result[name] = data
+        return result
+
+    migrated = {"version": CONFIG_VERSION}
+    migrated["buttons"] = upgrade({name: data for name, data in config.items() if name in BUTTON_BITS})
+    for key, value in config.items():
+        if key == "players" and isinstance(value, dict):
+            migrated[key] = {player: upgrade(mappings) if isinstance(mappings, dict) else mappings
+                             for player, mappings in value.items()}
+        elif key not in BUTTON_BITS and key != "version":
+            migrated[key] = value
+    return migrated
+
+
+class MappingProfile:
+    """编译好的映射方案快照 - 创建后不再修改，修改映射时复制出新的快照
+
+    引擎每个周期只读取一次当前方案的引用，切换方案就是替换这一个引用，
+    因此任何周期都不会看到只应用了一半的映射。
+    """
+
+    __slots__ = ("name", "actions", "players", "mappings", "player_mappings", "curves")
+
+    PLAYER_SLOTS = 8  # 玩家方案的槽位数（与引擎支持的手柄数一致）
+
+    def __init__(self, name: str, actions=None, players=None, mappings=None,
+                 player_mappings=None, curves=None):
+        self.name = name
+        # 默认动作表：按键位编号 -> 动作对象（None 表示无动作）
+        self.actions = tuple(actions) if actions is not None else (None,) * len(BUTTON_NAMES)
+        # 玩家单独的动作表，按玩家编号索引（None 表示使用默认动作表）
+        self.players = (tuple(None if table is None else tuple(table) for table in players)
+                        if players is not None else (None,) * self.PLAYER_SLOTS)
+        # 映射的数据模型 {按键名: ButtonMapping}，用于保存和界面显示
+        self.mappings = mappings or {}
+        self.player_mappings = player_mappings or {}
+        # 摇杆曲线 {stick: StickCurve}，None 表示切换到此方案时不改变曲线
+        self.curves = curves
+
+    @classmethod
+    def compile(cls, name: str, config: Dict[str, Any], sink: OutputSink,
+                previous: Optional["MappingProfile"] = None) -> tuple:
+        """从配置文件内容编译方案，返回 (方案, 无效映射列表)
+
+        config 可以是任意受支持版本的配置，先升级到当前版本。未出现的按键没有动作；
+        无效的映射按无动作处理。给出 previous 时按增量方式编译：映射没有变化的项
+        直接复用原来的动作对象，无效的项保留原来的映射。
+        """
+        config = migrate_config(config)
+        invalid = []
+
+        def build(label, data, old_mapping, old_action):
+            try:
+                mapping = ButtonMapping.from_dict(data) if data else None
+                if previous is not None and mapping == old_mapping:
+                    return mapping, old_action
+                return mapping, mapping.compile(sink) if mapping is not None else None
+            except MappingError as e:
+                log.warning("%s 映射无效: %s", label, e)
+                invalid.append(label)
+                return old_mapping, old_action
+
+        old_mappings = previous.mappings if previous is not None else {}
+        old_actions = previous.actions if previous is not None else (None,) * len(BUTTON_NAMES)
+        buttons = config.get("buttons", {})
+        actions = [None] * len(BUTTON_NAMES)
+        mappings = {}
+        for bit, button_name in enumerate(BUTTON_NAMES):
+            mapping, actions[bit] = build(button_name, buttons.get(button_name),
+                                          old_mappings.get(button_name), old_actions[bit])
+            if mapping is not None:
+                mappings[button_name] = mapping
+
+        curves = None
+        if "stick_curves" in config:
+            old_curves = (previous.curves if previous is not None else None) or {}
+            curves = {}
+            for stick, profile in config["stick_curves"].items():
+                try:
+                    if stick not in DEFAULT_STICK_CURVES:
+                        raise ValueError(f"未知的摇杆: {stick}")
+                    curve = StickCurve.from_dict(profile)
+                    old_curve = old_curves.get(stick)
+                    curves[stick] = old_curve if old_curve and old_curve.to_dict() == curve.to_dict() else curve
+                except ValueError as e:
+                    log.warning("摇杆曲线配置无效: %s", e)
+                    invalid.append(stick)
+                    if stick in old_curves:
+                        curves[stick] = old_curves[stick]
+
+        players = [None] * cls.PLAYER_SLOTS
+        player_mappings = {}
+        for key, button_mappings in config.get("players", {}).items():
+            try:
+                player = int(key) - 1
+            except ValueError:
+                player = -1
+            if not 0 <= player < cls.PLAYER_SLOTS:
+                invalid.append(f"玩家{key}")
+                continue
+            old_config = previous.player_mappings.get(player, {}) if previous is not None else {}
+            old_table = (previous.players[player] if previous is not None else None) or (None,) * len(BUTTON_NAMES)
+            table = [None] * len(BUTTON_NAMES)
+            player_config = {}
+            for bit, button_name in enumerate(BUTTON_NAMES):
+                mapping, table[bit] = build(f"玩家{key}/{button_name}", button_mappings.get(button_name),
+                                            old_config.get(button_name), old_table[bit])
+                if mapping is not None:
+                    player_config[button_name] = mapping
+            players[player] = table
+            player_mappings[player] = player_config
+
+        return cls(name, actions, players, mappings, player_mappings, curves), invalid
+
+    def changes(self, previous: "MappingProfile") -> list:
+        """返回相对另一个快照有变化的项（按键名、玩家N/按键名、摇杆名）"""
+        changed = [name for name in BUTTON_NAMES if self.mappings.get(name) != previous.mappings.get(name)]
+        for player in sorted(set(self.player_mappings) | set(previous.player_mappings)):
+            new = self.player_mappings.get(player, {})
+            old = previous.player_mappings.get(player, {})
+            changed.extend(f"玩家{player + 1}/{name}" for name in BUTTON_NAMES if new.get(name) != old.get(name))
+        new_curves = self.curves or {}
+        old_curves = previous.curves or {}
+        for stick in sorted(set(new_curves) | set(old_curves)):
+            if stick not in new_curves or stick not in old_curves or \
+                    new_curves[stick].to_dict() != old_curves[stick].to_dict():
+                changed.append(stick)
+        return changed
+
+    def replace(self, **changes) -> "MappingProfile":
+        """复制出修改了部分字段的新快照"""
+        fields = {slot: getattr(self, slot) for slot in self.__slots__}
+        fields.update(changes)
+        return MappingProfile(**fields)
+
+    def with_mapping(self, button_name: str, mapping: Optional[ButtonMapping], action,
+                     player: Optional[int] = None) -> "MappingProfile":
+        """返回设置了单个按键映射的新快照（action 为编译好的动作，mapping 为 None 表示清除）"""
+        bit = BUTTON_NAMES.index(button_name)
+        if player is None:
+            actions = list(self.actions)
+            actions[bit] = action
+            mappings = dict(self.mappings)
+            if mapping is None:
+                mappings.pop(button_name, None)
+            else:
+                mappings[button_name] = mapping
+            return self.replace(actions=actions, mappings=mappings)
+
+        players = list(self.players)
+        table = list(players[player] or (None,) * len(BUTTON_NAMES))
+        table[bit] = action
+        players[player] = table
+        player_config = dict(self.player_mappings.get(player, {}))
+        if mapping is None:
+            player_config.pop(button_name, None)
+        else:
+            player_config[button_name] = mapping
+        player_mappings = dict(self.player_mappings)
+        player_mappings[player] = player_config
+        return self.replace(players=players, player_mappings=player_mappings)
+
+    def without_player(self, player: int) -> "MappingProfile":
+        """返回删除了玩家单独方案的新快照"""
+        players = list(self.players)
+        players[player] = None
+        player_mappings = dict(self.player_mappings)
+        player_mappings.pop(player, None)
+        return self.replace(players=players, player_mappings=player_mappings)
+
+    def with_curve(self, stick: str, curve: StickCurve) -> "MappingProfile":
+        """返回更新了摇杆曲线的新快照"""
+        curves = dict(self.curves or {})
+        curves[stick] = curve
+        return self.replace(curves=curves)
+
+    def to_config(self) -> Dict[str, Any]:
+        """导出为当前版本的配置文件格式"""
+        config = {
+            "version": CONFIG_VERSION,
+            "buttons": {name: mapping.to_dict() for name, mapping in self.mappings.items()},
+        }
+        if self.curves:
+            config["stick_curves"] = {stick: curve.to_dict() for stick, curve in self.curves.items()}
+        if self.player_mappings:
+            config["players"] = {str(player + 1): {name: mapping.to_dict() for name, mapping in mappings.items()}
+                                 for player, mappings in sorted(self.player_mappings.items())}
+        return config
+
+
+class LatencyHistogram:
+    """
+    HDR风格的延迟直方图（单位微秒）
+    按2的幂分段、段内线性细分为64格，记录为 O(1)，相对误差不超过约1.6%
+    """
+
+    SUB_BUCKET_BITS = 7
+    MAX_VALUE_US = 60_000_000  # 超过60秒的记入最后一格
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * (self._index(self.MAX_VALUE_US) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift << (cls.SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+    @classmethod
+    def _highest_value(cls, index: int) -> int:
+        """桶内可表示的最大值"""
+        if index < 1 << cls.SUB_BUCKET_BITS:
+            return index
+        shift = (index >> (cls.SUB_BUCKET_BITS - 1)) - 1
+        sub = index - (shift << (cls.SUB_BUCKET_BITS - 1))
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        """记录一个延迟值（秒）"""
+        value = min(max(int(seconds * 1_000_000), 0), self.MAX_VALUE_US)
+        self.counts[self._index(value)] += 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentiles(self, quantiles) -> list:
+        """一次遍历计算多个分位数（微秒），quantiles 需按升序排列"""
+        results = []
+        if not self.count:
+            return [0] * len(quantiles)
+        targets = [max(1, math.ceil(q * self.count)) for q in quantiles]
+        cumulative = 0
+        position = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count:
+                continue
+            cumulative += bucket_count
+            while position < len(targets) and cumulative >= targets[position]:
+                results.append(min(self._highest_value(index), self.max))
+                position += 1
+            if position == len(targets):
+                break
+        return results
+
+    def summary(self) -> Dict[str, float]:
+        """返回次数、均值、分位数和最值（毫秒）"""
+        p50, p90, p99, p999 = self.percentiles((0.5, 0.9, 0.99, 0.999))
+        return {
+            "count": self.count,
+            "min_ms": self.min / 1000,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            "p50_ms": p50 / 1000,
+            "p90_ms": p90 / 1000,
+            "p99_ms": p99 / 1000,
+            "p999_ms": p999 / 1000,
+            "max_ms": self.max / 1000,
+        }
+
+
+class LatencyRecorder:
+    """
+    端到端延迟统计 - 按动作类别和阶段分别记录直方图
+      map    - 采集到输入 -> 提交给执行器
+      queue  - 提交 -> 开始注入
+      inject - 输出后端调用耗时
+      total  - 采集到输入 -> 注入完成
+    只由执行线程写入；读取方拿到的是近似一致的快照
+    """
+
+    STAGES = ("map", "queue", "inject", "total")
+    CSV_FIELDS = ("action", "stage", "count", "min_ms", "mean_ms",
+                  "p50_ms", "p90_ms", "p99_ms", "p999_ms", "max_ms")
+
+    def __init__(self):
+        self._histograms = {}  # 动作类别 -> (map, queue, inject, total) 直方图
+
+    def record(self, kind: str, input_at: float, submitted_at: float,
+               started_at: float, finished_at: float):
+        """记录一个动作各阶段的时间戳（perf_counter 秒）"""
+        histograms = self._histograms.get(kind)
+        if histograms is None:
+            histograms = tuple(LatencyHistogram() for _ in self.STAGES)
+            self._histograms = dict(self._histograms, **{kind: histograms})
+        histograms[0].record(submitted_at - input_at)
+        histograms[1].record(started_at - submitted_at)
+        histograms[2].record(finished_at - started_at)
+        histograms[3].record(finished_at - input_at)
+
+    def reset(self):
+        """清空全部统计"""
+        self._histograms = {}
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """返回 {动作类别: {阶段: 统计}}"""
+        return {kind: {stage: histogram.summary()
+                       for stage, histogram in zip(self.STAGES, histograms)}
+                for kind, histograms in self._histograms.items()}
+
+    def rows(self) -> list:
+        """展开为表格行（与 CSV_FIELDS 对应）"""
+        rows = []
+        for kind, stages in sorted(self.summary().items()):
+            for stage in self.STAGES:
+                stats = stages[stage]
+                rows.append([kind, stage] + [stats[field] for field in self.CSV_FIELDS[2:]])
+        return rows
+
+    def dump(self, filename: str):
+        """导出统计，按扩展名选择 CSV 或 JSON"""
+        if filename.lower().endswith(".csv"):
+            with open(filename, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.CSV_FIELDS)
+                writer.writerows(self.rows())
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+class ActionExecutor:
+    """动作执行器 - 在独立线程中按顺序注入输入，避免阻塞轮询和界面
+
+    队列有界，满载时的处理方式由 backpressure 决定：
+      drop  - 丢弃新提交的项
+      merge - 相对移动只合并进队尾的移动（不越过其后的点击），队尾不是移动时
+              超出容量追加一项，之后的移动都合并进这一项；其他动作等待队列空出
+      block - 提交方等待队列空出
+    无论哪种策略，相邻的相对移动都会直接合并为一次移动。
+    执行线程每次取出队列中全部待执行项，拼成一个批次交给输出后端一次提交。
+    """
+
+    BACKPRESSURE_POLICIES = ("drop", "merge", "block")
+
+    # 队列项类型
+    _BATCH = 0
+    _MOVE = 1
+
+    def __init__(self, sink: OutputSink, max_queue: int = 256, backpressure: str = "merge",
+                 on_complete=None, on_error=None):
+        if backpressure not in self.BACKPRESSURE_POLICIES:
+            raise ValueError(f"不支持的背压策略: {backpressure}")
+        self.sink = sink
+        self.max_queue = max_queue
+        self.backpressure = backpressure
+        # 回调在执行线程中调用：on_complete(action)、on_error(action, exception)
+        self.on_complete = on_complete
+        self.on_error = on_error
+
+        # 队列项: [类型, (事件列表, 动作列表) 或 [dx, dy], 提交时间, 输入采集时间]
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._alive = False
+        self._thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空统计计数"""
+        self.submitted = 0
+        self.executed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._inject_total = 0.0
+        self._inject_max = 0.0
+        self.latency = LatencyRecorder()
+
+    def start(self):
+        """启动执行线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name="ActionExecutor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """停止执行线程（已排队的动作会先执行完）"""
+        with self._condition:
+            self._alive = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def depth(self) -> int:
+        """当前排队数量"""
+        return len(self._queue)
+
+    def submit(self, action, input_at: Optional[float] = None) -> bool:
+        """提交一个编译好的动作，返回是否成功入队"""
+        return self.submit_batch(action.events, (action,), input_at)
+
+    def submit_batch(self, events, actions=(), input_at: Optional[float] = None) -> bool:
+        """提交一个周期内产生的全部输出事件，它们会在同一次注入中原子提交
+
+        input_at 为触发这些动作的输入被采集的时间（perf_counter），用于端到端延迟统计，
+        缺省时以提交时间为准。
+        """
+        with self._condition:
+            if not self._wait_for_space(self.backpressure != "drop"):
+                self.dropped += 1
+                return False
+            submitted_at = time.perf_counter()
+            self._enqueue([self._BATCH, (events, actions), submitted_at,
+                           submitted_at if input_at is None else input_at])
+        return True
+
+    def move(self, dx: float, dy: float, input_at: Optional[float] = None) -> bool:
+        """提交一次相对鼠标移动，返回是否成功入队或合并"""
+        with self._condition:
+            queue = self._queue
+            if queue and queue[-1][0] == self._MOVE:
+                # 与队尾的移动合并，保持顺序不变
+                delta = queue[-1][1]
+                delta[0] += dx
+                delta[1] += dy
+                self.merged += 1
+                return True
+
+            if self.backpressure != "merge" and not self._wait_for_space(self.backpressure == "block"):
+                self.dropped += 1
+                return False
+
+            submitted_at = time.perf_counter()
+            self._enqueue([self._MOVE, [dx, dy], submitted_at,
+                           submitted_at if input_at is None else input_at])
+        return True
+
+    def _wait_for_space(self, block: bool) -> bool:
+        """等待队列空出（调用方需持有锁）"""
+        while len(self._queue) >= self.max_queue:
+            if not block or not self._alive:
+                return False
+            self._condition.wait(0.1)
+        return True
+
+    def _enqueue(self, item):
+        """入队并唤醒执行线程（调用方需持有锁）"""
+        self._queue.append(item)
+        self.submitted += 1
+        depth = len(self._queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._condition.notify_all()
+
+    def _take_all(self) -> list:
+        """一次取出全部待执行项（调用方需持有锁）"""
+        items = list(self._queue)
+        self._queue.clear()
+        # 唤醒等待队列空间的提交方
+        self._condition.notify_all()
+        return items
+
+    def _run(self):
+        """执行线程主循环"""
+        while True:
+            with self._condition:
+                while not self._queue and self._alive:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                # 一次取出全部待执行项，合并为一个批次
+                items = self._take_all()
+            self._execute(items)
+
+    def flush(self):
+        """在调用方线程中立即执行全部待执行项（执行线程未启动时使用，如回放和基准测试）"""
+        with self._condition:
+            items = self._take_all()
+        if items:
+            self._execute(items)
+
+    def _execute(self, items: list):
+        """将取出的待执行项拼成一个批次注入
+
+        原子后端整批注入失败时逐项重试，一个无效事件不会连带丢掉其他项（包括其中的松开事件）；
+        逐个注入的后端中途失败时，已经注入的项不再重发，只重新提交失败事件之后的项。
+        失败的项补发其中的松开事件，避免按键卡在按下状态。
+        """
+        events = []
+        actions = []
+        for kind, payload, submitted_at, input_at in items:
+            if kind == self._MOVE:
+                events.append((OUT_MOVE, payload[0], payload[1]))
+            else:
+                events.extend(payload[0])
+                actions.extend(payload[1])
+
+        started_at = time.perf_counter()
+        try:
+            self.sink.send(events)
+        except PartialSendError as e:
+            self._resume(items, events, e, started_at)
+            return
+        except Exception as e:
+            if self.sink.atomic and len(items) > 1:
+                log.warning("批量注入失败，逐项重试: %s", e)
+                for item in items:
+                    self._execute([item])
+                return
+            # 不知道已经注入了多少，为避免重复注入不再重试
+            self._fail(items, events, e)
+            return
+        self._complete(items, started_at, time.perf_counter())
+
+    def _resume(self, items: list, events: list, error: PartialSendError, started_at: float):
+        """批次中途注入失败：之前的项已完成，失败事件所在的项记为失败，之后的项重新提交"""
+        delivered = error.delivered
+        start = 0
+        for position, (kind, payload, submitted_at, input_at) in enumerate(items):
+            end = start + (1 if kind == self._MOVE else len(payload[0]))
+            if delivered < end:
+                break
+            start = end
+        if position:
+            self._complete(items[:position], started_at, time.perf_counter())
+        self._fail(items[position:position + 1], events[delivered:end], error)
+        if position + 1 < len(items):
+            self._execute(items[position + 1:])
+
+    def _fail(self, items: list, events: list, error: Exception):
+        """记录失败的项，尽量补发 events 中的松开事件"""
+        self.failed += len(items)
+        log.error("执行动作失败: %s", error)
+        releases = [(op, a, False) for op, a, down in events
+                    if op in (OUT_KEY, OUT_BUTTON) and not down]
+        while releases:
+            try:
+                self.sink.send(releases)
+                break
+            except PartialSendError as release_error:
+                # 跳过注入失败的那个事件，继续补发其余的松开事件
+                log.error("补发松开事件失败: %s", release_error)
+                releases = releases[release_error.delivered + 1:]
+            except Exception as release_error:
+                log.error("补发松开事件失败: %s", release_error)
+                break
+        if self.on_error:
+            for kind, payload, submitted_at, input_at in items:
+                if kind != self._MOVE:
+                    for action in payload[1]:
+                        self.on_error(action, error)
+
+    def _complete(self, items: list, started_at: float, finished_at: float):
+        """记录注入成功的项：计数、排队等待和端到端延迟，并通知完成回调"""
+        inject = finished_at - started_at
+        self.executed += len(items)
+        self.batches += 1
+        self._inject_total += inject
+        if inject > self._inject_max:
+            self._inject_max = inject
+        latency = self.latency
+        for kind, payload, submitted_at, input_at in items:
+            wait = started_at - submitted_at
+            self._wait_total += wait
+            if wait > self._wait_max:
+                self._wait_max = wait
+            if kind == self._MOVE:
+                latency.record("move", input_at, submitted_at, started_at, finished_at)
+            else:
+                for action in payload[1]:
+                    latency.record(action.kind, input_at, submitted_at, started_at, finished_at)
+
+        if self.on_complete:
+            for kind, payload, submitted_at, input_at in items:
+                if kind != self._MOVE:
+                    for action in payload[1]:
+                        if action.description:
+                            self.on_complete(action)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取队列深度和注入延迟统计（时间单位：毫秒，注入耗时按批次统计）"""
+        executed = self.executed or 1
+        batches = self.batches or 1
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "executed": self.executed,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "failed": self.failed,
+            "batches": self.batches,
+            "wait_avg_ms": self._wait_total / executed * 1000,
+            "wait_max_ms": self._wait_max * 1000,
+            "inject_avg_ms": self._inject_total / batches * 1000,
+            "inject_max_ms": self._inject_max * 1000,
+        }
+
+
+class _MacroRun:
+    """一次正在执行的宏（只由 MacroScheduler 在持有锁时修改）"""
+
+    __slots__ = ("macro", "key", "origin", "index", "iteration", "held", "cancelled")
+
+    def __init__(self, macro: MacroAction, key, origin: float):
+        self.macro = macro
+        self.key = key
+        self.origin = origin  # 本次循环开始的时间点（perf_counter）
+        self.index = 0  # 下一批要注入的时间线下标
+        self.iteration = 0
+        self.held = ()  # 已注入部分仍按住的键的松开事件
+        self.cancelled = False
+
+
+class MacroScheduler:
+    """
+    宏调度器 - 在独立线程中按绝对时间点注入宏的每一批输入
+    所有运行中的宏共用一个按截止时间排序的最小堆，每个宏在堆中只占一项（注入一批后
+    放入下一批），同时挂起上千个宏也只是上千个元组；取消时只做标记，出堆时丢弃。
+    已取消的项超过一半时重建堆，避免反复开始/取消长时间等待的宏使堆无限增长。
+    线程先等待到最近截止时间前的一小段，再忙等到截止时间（与 PeriodicScheduler 相同），
+    同一时刻到期的各批合并后交给执行器注入，与普通动作共用同一个输出后端并保持顺序。
+    要注入的批次和取消时的松开事件在锁内按顺序放入待提交队列，释放锁之后再提交给执行器：
+    执行器队列满时提交会阻塞，持锁会连带阻塞 toggle / run / cancel。
+    """
+
+    SPIN_WINDOW = 0.001  # 截止时间前最后 1ms 改为忙等
+
+    def __init__(self, executor: ActionExecutor, spin_window: Optional[float] = None):
+        self.executor = executor
+        self.spin_window = self.SPIN_WINDOW if spin_window is None else spin_window
+        self._heap = []  # (截止时间, 序号, _MacroRun)
+        self._stale = 0  # 堆中已取消、尚未出堆的项数
+        self._sequence = itertools.count()
+        self._runs = {}  # 运行标识 -> _MacroRun
+        self._wake_at = math.inf  # 线程正在忙等的截止时间，加入更早的批次时提前结束忙等
+        self._outbox = deque()  # 待提交给执行器的 (事件, 完成的宏, 计划时间)，按放入顺序提交
+        self._submitting = False  # 是否已有线程在提交待提交队列
+        self._condition = threading.Condition()
+        self._alive = False
+        self._thread = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """清空统计"""
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.batches = 0
+        self.lateness = LatencyHistogram()  # 实际出堆时间 - 计划时间
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._alive = True
+        self._thread = threading.Thread(target=self._run, name="MacroScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0):
+        """取消全部宏（松开仍按住的键）并停止调度线程"""
+        self.cancel_all()
+        with self._condition:
+            self._alive = False
+            self._condition.notify_all()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def running(self) -> int:
+        """正在执行的宏数量"""
+        return len(self._runs)
+
+    def is_running(self, key) -> bool:
+        return key in self._runs
+
+    def toggle(self, macro: MacroAction, key=None) -> bool:
+        """按下触发宏的按键：未在执行时开始，正在执行时取消；返回是否开始了执行
+
+        key 用于区分同一个宏的不同运行，缺省为宏本身。
+        """
+        key = macro if key is None else key
+        with self._condition:
+            if key not in self._runs:
+                self._start(macro, key, time.perf_counter())
+                return True
+            self._queue_release(self._cancel(key))
+        self._submit_pending()
+        return False
+
+    def run(self, macro: MacroAction, key=None, at: Optional[float] = None):
+        """开始执行宏（同一标识的宏正在执行时先取消），at 为开始的时间点，缺省为立即"""
+        key = macro if key is None else key
+        with self._condition:
+            if key in self._runs:
+                # 松开事件先于新运行的第一批放入待提交队列
+                self._queue_release(self._cancel(key))
+            self._start(macro, key, time.perf_counter() if at is None else at)
+        self._submit_pending()
+
+    def cancel(self, key) -> bool:
+        """取消正在执行的宏并松开它仍按住的键，返回是否确实取消了"""
+        with self._condition:
+            if key not in self._runs:
+                return False
+            self._queue_release(self._cancel(key))
+        self._submit_pending()
+        return True
+
+    def cancel_all(self):
+        """取消全部宏"""
+        releases = []
+        with self._condition:
+            for key in list(self._runs):
+                releases.extend(self._cancel(key))
+            self._queue_release(releases)
+            self._heap.clear()
+            self._stale = 0
+        self._submit_pending()
+
+    def _start(self, macro: MacroAction, key, origin: float):
+        """登记一次运行并放入第一批（调用方需持有锁）"""
+        run = _MacroRun(macro, key, origin)
+        self._runs[key] = run
+        self.started += 1
+        self._push(origin + macro.timeline[0][0], run)
+
+    def _cancel(self, key):
+        """取消一次运行（调用方需持有锁），堆中的项在出堆时丢弃
+
+        返回仍按住的键的松开事件，由调用方放入待提交队列。
+        """
+        run = self._runs.pop(key)
+        run.cancelled = True
+        self.cancelled += 1
+        self._stale += 1
+        if self._stale > len(self._heap) // 2:
+            self._heap[:] = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        return run.held
+
+    def _queue_release(self, events):
+        """把取消时需要松开的按键放入待提交队列（调用方需持有锁），释放锁之后调用 _submit_pending 提交"""
+        if events:
+            self._outbox.append((tuple(events), (), None))
+
+    def _submit_pending(self):
+        """按放入顺序把待提交队列交给执行器（不能持有锁）
+
+        同一时刻只有一个线程提交；其他线程放入的项由正在提交的线程接着提交，
+        执行器阻塞时其他调用方不必等待。
+        """
+        outbox = self._outbox
+        with self._condition:
+            if self._submitting:
+                return
+            self._submitting = True
+        try:
+            while True:
+                with self._condition:
+                    if not outbox:
+                        self._submitting = False
+                        return
+                    events, finished, planned = outbox.popleft()
+                self.executor.submit_batch(events, finished, planned)
+        except BaseException:
+            with self._condition:
+                self._submitting = False
+            raise
+
+    def _push(self, deadline: float, run: _MacroRun):
+        """放入一批（调用方需持有锁）"""
+        heapq.heappush(self._heap, (deadline, next(self._sequence), run))
+        if deadline < self._wake_at:
+            self._wake_at = deadline
+            self._condition.notify()
+
+    def _run(self):
+        """调度线程主循环"""
+        heap = self._heap
+        spin_window = self.spin_window
+        clock = time.perf_counter
+        while True:
+            with self._condition:
+                while self._alive and not heap:
+                    self._wake_at = math.inf
+                    self._condition.wait()
+                if not self._alive:
+                    return
+                deadline = self._wake_at = heap[0][0]
+                remaining = deadline - clock()
+                if remaining > spin_window:
+                    self._condition.wait(remaining - spin_window)
+                    continue
+            # 忙等时让出GIL，执行线程可以同时注入上一批
+            while clock() < self._wake_at:
+                time.sleep(0)
+            self._run_due(clock())
+
+    def _run_due(self, now: float):
+        """注入所有已到期的批次（合并为一次提交）"""
+        heap = self._heap
+        events = []
+        finished = []
+        planned = None
+        with self._condition:
+            while heap and heap[0][0] <= now:
+                deadline, _, run = heapq.heappop(heap)
+                if run.cancelled:
+                    self._stale -= 1
+                    continue
+                self.lateness.record(now - deadline)
+                macro = run.macro
+                timeline = macro.timeline
+                events.extend(timeline[run.index][1])
+                run.held = timeline[run.index][2]
+                run.index += 1
+                if run.index == len(timeline):
+                    run.index = 0
+                    run.iteration += 1
+                    if run.iteration == macro.repeat:
+                        # 执行完毕，松开仍按住的键
+                        events.extend(run.held)
+                        del self._runs[run.key]
+                        self.completed += 1
+                        finished.append(macro)
+                        if planned is None:
+                            planned = deadline
+                        continue
+                    run.origin += macro.duration
+                self._push(run.origin + timeline[run.index][0], run)
+            self._wake_at = heap[0][0] if heap else math.inf
+            if events:
+                self.batches += 1
+                self._outbox.append((events, tuple(finished), planned))
+        self._submit_pending()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取宏的执行计数和调度误差（毫秒）"""
+        lateness = self.lateness.summary()
+        return {
+            "running": self.running,
+            "pending": len(self._heap),
+            "started": self.started,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "batches": self.batches,
+            "lateness_p50_ms": lateness["p50_ms"],
+            "lateness_p99_ms": lateness["p99_ms"],
+            "lateness_max_ms": lateness["max_ms"],
+        }
+
+
+class MappingEngine:
+    """映射引擎 - 在独立线程中高频轮询手柄、检测边沿并分发动作
+
+    引擎线程独占所有 ControllerHandler；界面线程只通过 post_command / set_* 下发
+    指令，并从 display_updates 中取回需要显示的状态，两者互不阻塞。
+    可同时连接多个手柄：每个手柄按SDL实例编号占用一个玩家槽位，各自检测轴布局、
+    加载校准并保存边沿状态，可以使用单独的映射方案；controller 始终是玩家1的槽位。
+    手柄插拔由SDL的 JOYDEVICEADDED / JOYDEVICEREMOVED 事件驱动，在引擎线程中立即处理。
+    映射方案是编译好的不可变快照（MappingProfile），可预加载多个，通过组合键、界面或
+    switch_profile 切换：只替换一个引用，在两个周期之间原子地生效。
+    宏动作交给 MacroScheduler 在独立线程中按时间点注入，执行中再次按下同一按键即取消。
+    """
+
+    SUPPORTED_RATES = (125, 250, 500, 1000)
+    DEFAULT_RATE = 250
+    MAX_CONTROLLERS = MappingProfile.PLAYER_SLOTS  # 最多同时使用的手柄数
+    DEFAULT_PROFILE = "default"
+    IDLE_INTERVAL = 0.05  # 未映射时的周期（秒），只处理指令和手柄插拔
+    RESCAN_RETRY_INTERVAL = 1.0  # 手柄失效后重新枚举的最短间隔（秒）
+    CALIBRATION_REST_SECONDS = 1.0  # 校准开始时保持静止的时间（秒）
+
+    def __init__(self, controller: Optional[ControllerHandler] = None,
+                 rate_hz: int = DEFAULT_RATE, input_mode: str = "event",
+                 backpressure: str = "merge", sink: Optional[OutputSink] = None,
+                 output_backend: str = "auto", screen_size: Optional[tuple] = None):
+        self.controller = controller or ControllerHandler(input_mode)
+        self.controller.player = 0
+        self.controller.shared_queue = True
+        # 玩家槽位 -> 手柄处理器（按需增加，处理器对象在设备拔插之间复用）
+        self._players = (self.controller,)
+        # SDL实例编号 -> 已连接的手柄处理器
+        self._by_instance = {}
+        self.rate_hz = self.DEFAULT_RATE
+        self.scheduler = PeriodicScheduler(self.DEFAULT_RATE)
+        self.set_rate(rate_hz)
+        self.motion_rate_hz = MouseMotion.DEFAULT_RATE
+
+        # 所有注入都通过输出后端完成
+        self.sink = sink or create_output_sink(output_backend, screen_size)
+
+        # 输入注入在独立的执行线程中进行，慢速注入不会拖慢轮询
+        self.executor = ActionExecutor(self.sink, backpressure=backpressure,
+                                       on_complete=self._on_action_complete,
+                                       on_error=self._on_action_error)
+
+        # 当前映射方案（引擎每周期只读取一次引用）和预加载的方案 {名称: 快照}
+        self._profile = MappingProfile(self.DEFAULT_PROFILE)
+        self._profile_bank = {self._profile.name: self._profile}
+        # 只用于串行化修改方（界面、后台线程、组合键切换），引擎读取不加锁
+        self._profile_lock = threading.Lock()
+        # 方案切换组合键 {按键位掩码: 方案名}，方案名为 None 表示切换到下一个方案
+        self._profile_chords = {}
+        self.joystick_mouse_enabled = True
+        self.joystick_selection = "右摇杆"
+
+        # 鼠标移动控制器（常驻线程，随映射启停休眠/唤醒）
+        self.mouse_motion = MouseMotion(self.executor, self.motion_rate_hz)
+        # 宏的各个步骤由独立的调度线程按时间点注入
+        self.macros = MacroScheduler(self.executor)
+
+        self.running = False
+        self._tick_actions = []
+        self._calibration = None  # 进行中的校准采样
+        self._last_controller_status = None
+        self._rescan_at = 0.0  # 需要完整重新枚举手柄的时间点（None 表示不需要）
+        self._auto_start = False  # 手柄就绪后自动开始映射
+
+        # 界面 -> 引擎 的指令通道，引擎 -> 界面 的显示状态通道
+        # deque 的 append/popleft 是原子操作，两端都无需加锁
+        self._commands = deque()
+        self._wakeup = threading.Event()  # 投递指令时唤醒空闲中的引擎线程
+        self.display_updates = deque(maxlen=256)
+
+        self._alive = False
+        self._thread = None
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        """启动引擎线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._alive = True
+        self.executor.start()
+        self.macros.start()
+        self._thread = threading.Thread(target=self._run, name="MappingEngine", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout: float = 1.0):
+        """停止引擎线程"""
+        self._alive = False
+        self.running = False
+        self._wakeup.set()
+        self.mouse_motion.shutdown(timeout)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.macros.stop(timeout)
+        self.executor.stop(timeout)
+        for handler in self._players:
+            handler.stop_recording()
+        self.sink.close()
+
+    def set_input_mode(self, input_mode: str):
+        """切换输入模式（poll / event），在引擎线程中生效"""
+        if input_mode not in ControllerHandler.INPUT_MODES:
+            raise ValueError(f"不支持的输入模式: {input_mode}")
+        self.post_command("input_mode", input_mode)
+
+    def set_rate(self, rate_hz: int):
+        """设置轮询频率（Hz）"""
+        rate_hz = int(rate_hz)
+        if rate_hz not in self.SUPPORTED_RATES:
+            raise ValueError(f"不支持的轮询频率: {rate_hz}，可选 {self.SUPPORTED_RATES}")
+        self.rate_hz = rate_hz
+        self.scheduler.set_rate(rate_hz)
+
+    def set_motion_rate(self, rate_hz: float):
+        """设置摇杆鼠标移动线程的更新频率（Hz）"""
+        self.motion_rate_hz = rate_hz
+        self.mouse_motion.scheduler.set_rate(rate_hz)
+
+    def latency_stats(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """返回端到端延迟统计 {动作类别: {阶段: {count, p50_ms, p99_ms, ...}}}"""
+        return self.executor.latency.summary()
+
+    def dump_latency(self, filename: str):
+        """导出延迟统计（.csv 或 .json）"""
+        self.executor.latency.dump(filename)
+
+    def reset_latency(self):
+        """清空延迟统计"""
+        self.executor.latency.reset()
+
+    def macro_stats(self) -> Dict[str, Any]:
+        """返回宏的执行计数和调度误差"""
+        return self.macros.stats()
+
+    def timing_stats(self) -> Dict[str, Dict[str, float]]:
+        """返回引擎轮询循环和鼠标移动循环的调度统计（实际频率、错过次数、抖动）"""
+        return {
+            "engine": self.scheduler.stats(),
+            "motion": self.mouse_motion.scheduler.stats(),
+        }
+
+    def _run(self):
+        """引擎线程主循环（按绝对时间点调度，避免周期漂移）"""
+        # pygame 在引擎线程内初始化，保证SDL调用都在同一线程
+        self.controller.initialize()
+        self.check_controller_status()  # 登记已连接的手柄，之后的插拔由事件处理
+
+        self.scheduler.reset()
+        idle = False
+        while self._alive:
+            self.tick()
+            if self.running or self._calibration is not None:
+                if idle:
+                    self.scheduler.resync()
+                    idle = False
+                self.scheduler.wait()
+            else:
+                # 未映射时不按轮询频率空转，降到低频率，收到指令时立即唤醒
+                idle = True
+                if not self._commands:
+                    self._wakeup.wait(self.IDLE_INTERVAL)
+                self._wakeup.clear()
+
+    def tick(self):
+        """执行一次完整的引擎周期"""
+        self._process_commands()
+
+        if self._rescan_at is not None and self.controller.backend.now() >= self._rescan_at:
+            self.check_controller_status()
+
+        # 插拔事件即使未开始映射也要处理，输入事件分发给各手柄
+        self._collect_input()
+
+        if self._calibration is not None:
+            # 校准期间暂停映射，只采集原始轴值
+            self._calibration_tick()
+        elif self.running:
+            self.check_controller_input()
+
+    # ---- 界面线程调用的接口 ----
+
+    def post_command(self, command: str, *args):
+        """向引擎线程投递指令（start / stop / auto_start）"""
+        self._commands.append((command, args))
+        self._wakeup.set()
+
+    def set_mapping(self, button_name: str, config, player: Optional[int] = None):
+        """编译并更新当前方案中单个按键的映射，配置无效时抛出 MappingError（原映射保持不变）
+
+        config 为 ButtonMapping 或配置文件中的映射字典；player 为 None 时修改默认映射，
+        否则修改该玩家（从 0 开始）单独的映射。
+        """
+        BUTTON_NAMES.index(button_name)
+        if player is not None:
+            self._check_player(player)
+        mapping = ButtonMapping.from_dict(config)
+        action = mapping.compile(self.sink)
+        self._update_profile(lambda profile: profile.with_mapping(button_name, mapping, action, player))
+
+    def clear_mapping(self, button_name: str, player: Optional[int] = None):
+        """清除当前方案中单个按键的映射"""
+        BUTTON_NAMES.index(button_name)
+        if player is not None:
+            self._check_player(player)
+            if self._profile.players[player] is None:
+                return
+        self._update_profile(lambda profile: profile.with_mapping(button_name, None, None, player))
+
+    def clear_player_profile(self, player: int):
+        """删除玩家单独的映射，恢复使用默认映射"""
+        self._check_player(player)
+        self._update_profile(lambda profile: profile.without_player(player))
+
+    def load_player_profiles(self, players: Dict[str, Dict[str, Any]]) -> list:
+        """按配置文件的 players 部分（键为从 1 开始的玩家编号）替换当前方案的所有玩家映射，返回无效映射列表"""
+        compiled, invalid = MappingProfile.compile("", {"players": players}, self.sink)
+        self._update_profile(lambda profile: profile.replace(
+            players=compiled.players, player_mappings=compiled.player_mappings))
+        return invalid
+
+    def player_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """返回当前方案中玩家单独的映射（格式同 load_player_profiles 的参数）"""
+        return self._profile.to_config().get("players", {})
+
+    def _update_profile(self, update):
+        """以写时复制方式修改当前方案，新快照同时替换预加载表中的同名方案"""
+        with self._profile_lock:
+            profile = update(self._profile)
+            self._profile = profile
+            self._profile_bank[profile.name] = profile
+        return profile
+
+    # ---- 映射方案 ----
+
+    @property
+    def active_profile(self) -> str:
+        """当前方案的名称"""
+        return self._profile.name
+
+    def profile(self, name: Optional[str] = None) -> MappingProfile:
+        """返回方案快照（默认为当前方案）"""
+        if name is None:
+            return self._profile
+        try:
+            return self._profile_bank[name]
+        except KeyError:
+            raise ValueError(f"未知的映射方案: {name}")
+
+    def profile_names(self) -> list:
+        """返回预加载的方案名称（按加载顺序）"""
+        return list(self._profile_bank)
+
+    def load_profile(self, name: str, config: Dict[str, Any], activate: bool = False) -> list:
+        """编译并预加载一个映射方案，返回无效映射列表
+
+        编译在调用线程中完成；同名方案被替换，若它正是当前方案则立即生效。
+        """
+        profile, invalid = MappingProfile.compile(name, config, self.sink)
+        with self._profile_lock:
+            self._profile_bank[name] = profile
+            if activate or self._profile.name == name:
+                self._activate_profile(profile)
+        return invalid
+
+    def reload_profile(self, name: str, config: Dict[str, Any]) -> tuple:
+        """用新的配置内容增量更新方案，返回 (有变化的项, 无效映射列表)
+
+        只重新编译有变化的项，其余动作对象原样复用；无效的项保留原来的映射。
+        编译在调用线程中完成，没有变化时不替换快照。编译期间方案被其他修改方
+        替换时（界面编辑、另一次重新加载），以新的快照为基础重新编译，不会覆盖对方的修改。
+        """
+        while True:
+            previous = self._profile_bank.get(name)
+            profile, invalid = MappingProfile.compile(name, config, self.sink, previous)
+            changed = profile.changes(previous) if previous is not None else list(profile.mappings)
+            with self._profile_lock:
+                if self._profile_bank.get(name) is not previous:
+                    continue
+                if previous is not None and not changed:
+                    return changed, invalid
+                self._profile_bank[name] = profile
+                if self._profile.name == name:
+                    self._activate_profile(profile)
+            return changed, invalid
+
+    def remove_profile(self, name: str):
+        """删除预加载的方案（不能删除当前方案）"""
+        with self._profile_lock:
+            if name == self._profile.name:
+                raise ValueError(f"不能删除当前使用的方案: {name}")
+            self._profile_bank.pop(name, None)
+
+    def switch_profile(self, name: str):
+        """切换到预加载的方案（只替换一个引用，下一个周期起生效）"""
+        with self._profile_lock:
+            profile = self._profile_bank.get(name)
+            if profile is None:
+                raise ValueError(f"未知的映射方案: {name}")
+            if profile is not self._profile:
+                self._activate_profile(profile)
+
+    def next_profile(self) -> str:
+        """按加载顺序切换到下一个方案，返回新方案的名称"""
+        with self._profile_lock:
+            names = list(self._profile_bank)
+            name = names[(names.index(self._profile.name) + 1) % len(names)]
+            if self._profile_bank[name] is not self._profile:
+                self._activate_profile(self._profile_bank[name])
+        return name
+
+    def _activate_profile(self, profile: MappingProfile):
+        """替换当前方案（调用方持有 _profile_lock）"""
+        previous, self._profile = self._profile, profile
+        if profile.curves:
+            for stick, curve in profile.curves.items():
+                self.mouse_motion.set_curve(stick, curve)
+        self._publish("profile", profile.name)
+        if profile.name != previous.name:
+            log.info("已切换映射方案: %s", profile.name)
+
+    def set_profile_chord(self, buttons, profile: Optional[str] = None):
+        """设置方案切换组合键：这些按键同时按下时切换到 profile（None 表示下一个方案）
+
+        组合键完成的那个周期内，组合中的按键不会触发各自的动作。
+        """
+        mask = 0
+        for button_name in buttons:
+            if button_name not in BUTTON_BITS:
+                raise ValueError(f"未知的按键: {button_name}")
+            mask |= BUTTON_BITS[button_name]
+        if not mask:
+            raise ValueError("组合键不能为空")
+        chords = dict(self._profile_chords)
+        chords[mask] = profile
+        self._profile_chords = chords
+
+    def profile_chords(self) -> list:
+        """返回方案切换组合键 [(按键名列表, 方案名), ...]"""
+        return [([BUTTON_NAMES[bit] for bit in iter_bits(mask)], target)
+                for mask, target in self._profile_chords.items()]
+
+    def clear_profile_chords(self):
+        """删除所有方案切换组合键"""
+        self._profile_chords = {}
+
+    def _match_profile_chord(self, chords, frame: ControllerFrame) -> int:
+        """检查本帧是否完成了方案切换组合键，返回需要屏蔽动作的按键位掩码"""
+        for mask, target in chords.items():
+            if frame.pressed & mask and frame.buttons & mask == mask:
+                try:
+                    if target is None:
+                        self.next_profile()
+                    else:
+                        self.switch_profile(target)
+                except ValueError as e:
+                    log.warning("切换映射方案失败: %s", e)
+                return mask
+        return 0
+
+    def _check_player(self, player: int):
+        if not 0 <= player < self.MAX_CONTROLLERS:
+            raise ValueError(f"玩家编号超出范围: {player + 1}（最多 {self.MAX_CONTROLLERS} 个）")
+
+    def connected_controllers(self) -> list:
+        """返回已连接的手柄 [(玩家编号, 名称), ...]（玩家编号从 0 开始）"""
+        return [(handler.player, handler.name) for handler in self._players if handler.is_connected]
+
+    def set_joystick_options(self, enabled: bool, selection: str):
+        """更新摇杆映射选项"""
+        self.joystick_mouse_enabled = bool(enabled)
+        self.joystick_selection = selection
+        self.mouse_motion.set_stick("left" if selection == "左摇杆" else "right")
+
+    def set_stick_curve(self, stick: str, profile: Dict[str, Any]):
+        """更新某个摇杆的响应曲线，配置无效时抛出 ValueError（原曲线保持不变）"""
+        if stick not in DEFAULT_STICK_CURVES:
+            raise ValueError(f"未知的摇杆: {stick}")
+        curve = StickCurve.from_dict(profile)
+        self.mouse_motion.set_curve(stick, curve)
+        self._update_profile(lambda current: current.with_curve(stick, curve))
+
+    def stick_curve_profiles(self) -> Dict[str, Dict[str, Any]]:
+        """返回当前左右摇杆的曲线配置"""
+        return {stick: curve.to_dict() for stick, curve in self.mouse_motion.curves.items()}
+
+    def _publish(self, kind: str, value=None):
+        """向界面发布显示状态"""
+        self.display_updates.append((kind, value))
+
+    def _process_commands(self):
+        """处理界面投递的指令"""
+        while self._commands:
+            command, args = self._commands.popleft()
+            if command == "start":
+                self.start_mapping()
+            elif command == "stop":
+                self.stop_mapping()
+            elif command == "input_mode":
+                for handler in self._players:
+                    handler.set_input_mode(args[0])
+            elif command == "record":
+                try:
+                    self.controller.start_recording(args[0])
+                    self._publish("status", f"开始录制输入: {os.path.basename(args[0])}")
+                except (OSError, RuntimeError) as e:
+                    self._publish("error", f"录制失败: {e}")
+            elif command == "stop_record":
+                if self.controller.recorder is not None:
+                    self.controller.stop_recording()
+                    self._publish("status", "输入录制已停止")
+            elif command == "calibrate":
+                self._start_calibration(*args)
+            elif command == "calibration_loaded":
+                handler, instance_id, calibration = args
+                # 读取期间设备可能已被拔出或换成了别的手柄
+                if handler.is_connected and handler.instance_id == instance_id:
+                    handler.set_calibration(calibration)
+                    handler.reset_frame()
+                    log.info("已加载手柄校准数据: %s", handler.guid)
+            elif command == "auto_start":
+                self._auto_start = True
+                if not self._try_auto_start():
+                    log.info("手柄未连接，连接后自动启动映射")
+
+    # ---- 输入录制 ----
+
+    def start_recording(self, filename: str):
+        """开始录制手柄原始输入（在引擎线程中打开文件）"""
+        self.post_command("record", filename)
+
+    def stop_recording(self):
+        """停止录制"""
+        self.post_command("stop_record")
+
+    # ---- 手柄校准 ----
+
+    def calibrate(self, duration: float = 3.0, player: int = 0):
+        """开始手柄校准：先保持静止，再转动摇杆并按下扳机，结果按设备GUID保存"""
+        self._check_player(player)
+        self.post_command("calibrate", max(duration, self.CALIBRATION_REST_SECONDS + 0.5), player)
+
+    def _start_calibration(self, duration: float, player: int = 0):
+        """在引擎线程中开始校准采样"""
+        handler = self._players[player] if player < len(self._players) else None
+        if handler is None or not handler.is_connected:
+            self._publish("error", "手柄未连接，无法校准")
+            return
+        now = handler.backend.now()
+        self._calibration = {
+            "handler": handler,
+            "rest_until": now + self.CALIBRATION_REST_SECONDS,
+            "deadline": now + duration,
+            "rest": [],
+            "motion": [],
+        }
+        self.mouse_motion.set_velocity(0, 0)
+        self._publish("status", "校准中：请保持摇杆和扳机静止")
+
+    def _calibration_tick(self):
+        """采集一次校准样本，采样结束后计算并应用校准"""
+        calibration = self._calibration
+        handler = calibration["handler"]
+        if handler.poll(handler.pending_events) is None:
+            self._calibration = None
+            self._reset_frames()
+            self._publish("error", "校准期间手柄连接丢失")
+            return
+
+        now = handler.backend.now()
+        sample = tuple(handler.raw_axes)
+        if now < calibration["rest_until"]:
+            calibration["rest"].append(sample)
+        else:
+            if not calibration["motion"]:
+                self._publish("status", "校准中：请将两个摇杆转动到底，并完全按下两个扳机")
+            calibration["motion"].append(sample)
+
+        if now >= calibration["deadline"]:
+            self._calibration = None
+            self._finish_calibration(calibration["rest"], calibration["motion"], handler)
+
+    def _finish_calibration(self, rest, motion, handler: Optional[ControllerHandler] = None):
+        """计算校准结果并保存"""
+        handler = handler or self.controller
+        # 校准期间其他手柄的事件已被丢弃，以当前状态重新开始
+        self._reset_frames()
+        try:
+            result = AxisCalibration.from_samples(rest, motion)
+        except CalibrationError as e:
+            self._publish("error", f"手柄校准失败: {e}")
+            return
+        handler.set_calibration(result)
+        handler.reset_frame()
+        if handler.calibration_store.save(handler.guid, result):
+            self._publish("status", "手柄校准完成")
+        else:
+            self._publish("status", "手柄校准完成（保存失败）")
+
+    # ---- 映射控制 ----
+
+    @property
+    def any_connected(self) -> bool:
+        """是否至少有一个手柄已连接"""
+        return any(handler.is_connected for handler in self._players)
+
+    def start_mapping(self):
+        """启动映射"""
+        self._auto_start = False
+        if not self.any_connected:
+            # 尝试重新初始化手柄
+            self.controller.backend.reinit()
+            self.check_controller_status()
+            if not self.any_connected:
+                self._publish("error", "手柄未连接，请检查手柄连接")
+                return
+
+        self.running = True
+        self._reset_frames()
+        self.mouse_motion.start()
+
+        self._publish("mapping", True)
+
+    def _reset_frames(self):
+        """以当前实际状态重置所有已连接手柄的帧"""
+        for handler in self._players:
+            if handler.is_connected:
+                handler.reset_frame()
+
+    def _try_auto_start(self) -> bool:
+        """手柄已就绪时执行挂起的自动启动"""
+        if not (self._auto_start and self.any_connected):
+            return False
+        self._auto_start = False
+        if not self.running:
+            log.info("自动启动映射功能")
+            self.start_mapping()
+        return True
+
+    def stop_mapping(self):
+        """停止映射（正在执行的宏一并取消）"""
+        self.running = False
+        self.mouse_motion.stop()
+        self.macros.cancel_all()
+        self._publish("mapping", False)
+
+    def _rescan(self):
+        """重新枚举手柄：仍然存在的设备按实例编号保留原槽位，新设备占用编号最小的空闲槽位"""
+        backend = self.controller.backend
+        devices = []
+        for index in range(min(backend.count(), self.MAX_CONTROLLERS)):
+            joystick = backend.open(index)
+            devices.append((joystick.get_instance_id(), joystick))
+        present = {instance_id for instance_id, _ in devices}
+
+        previous = {handler.instance_id: handler for handler in self._players if handler.joystick is not None}
+        for instance_id, handler in previous.items():
+            if instance_id not in present:
+                handler.detach()
+                log.info("玩家%d 手柄断开连接", handler.player + 1)
+
+        seen = {}
+        for instance_id, joystick in devices:
+            handler = previous.get(instance_id)
+            if handler is not None and handler.is_connected and handler.joystick.get_init():
+                seen[instance_id] = handler
+                continue
+            # 新设备，或已失效需要重新初始化（重新检测轴布局并加载校准）
+            handler = handler or self._free_slot()
+            if handler is None:
+                log.warning("已达到手柄数上限 %d，忽略: %s", self.MAX_CONTROLLERS, joystick.get_name())
+                continue
+            if handler.attach(joystick):
+                seen[instance_id] = handler
+        self._by_instance.clear()
+        self._by_instance.update(seen)
+
+    def _free_slot(self) -> Optional[ControllerHandler]:
+        """返回编号最小的空闲玩家槽位，需要时创建新的手柄处理器"""
+        for handler in self._players:
+            if handler.joystick is None:
+                return handler
+        if len(self._players) >= self.MAX_CONTROLLERS:
+            return None
+        primary = self.controller
+        handler = ControllerHandler(primary.input_mode, calibration_store=primary.calibration_store,
+                                    backend=primary.backend)
+        handler.player = len(self._players)
+        handler.shared_queue = True
+        self._players += (handler,)
+        return handler
+
+    def check_controller_status(self):
+        """重新枚举全部手柄并发布连接状态（启动时和手柄失效后调用，插拔由事件处理）"""
+        self._rescan_at = None
+        try:
+            self._rescan()
+        except Exception as e:
+            log.error("手柄状态检测失败: %s", e)
+            self._publish_controller_status((False, "检测失败"))
+            return
+        self._publish_controller_status()
+
+    def _publish_controller_status(self, status: Optional[tuple] = None):
+        """连接状态变化时通知界面，并执行挂起的自动启动"""
+        if status is None:
+            connected = [handler for handler in self._players if handler.is_connected]
+            if connected:
+                name = connected[0].name
+                status = (True, name if len(connected) == 1 else f"{name} 等{len(connected)}个手柄")
+            else:
+                status = (False, None)
+        if status != self._last_controller_status:
+            self._last_controller_status = status
+            self._publish("controller", status)
+        if self._auto_start:
+            self._try_auto_start()
+
+    def _collect_input(self):
+        """每周期只取出一次SDL事件：立即处理插拔，输入事件按实例编号分发给各手柄（单次遍历）
+
+        轮询模式下只取插拔事件（同时刷新SDL状态），各手柄随后直接读取当前状态。
+        """
+        by_instance = self._by_instance
+        for handler in by_instance.values():
+            handler.pending_events.clear()
+        backend = self.controller.backend
+        if self.controller.input_mode == "event":
+            events = backend.get_events()
+        else:
+            events = backend.get_device_events()
+
+        device_added = pygame.JOYDEVICEADDED
+        device_removed = pygame.JOYDEVICEREMOVED
+        fresh = None  # 本批事件中新接入的手柄：帧已按取出后的实际状态采样，其余旧事件丢弃
+        for event in events:
+            event_type = event.type
+            if event_type == device_added:
+                handler = self._device_added(event.device_index)
+                if handler is not None:
+                    fresh = fresh or set()
+                    fresh.add(handler.instance_id)
+            elif event_type == device_removed:
+                self._device_removed(event.instance_id)
+            else:
+                handler = by_instance.get(getattr(event, "instance_id", None))
+                if handler is not None and (fresh is None or handler.instance_id not in fresh):
+                    handler.pending_events.append(event)
+
+    def _device_added(self, device_index: int) -> Optional[ControllerHandler]:
+        """手柄接入：打开设备、检测轴布局并重新采样扳机基准，校准数据在后台读取"""
+        try:
+            joystick = self.controller.backend.open(device_index)
+            instance_id = joystick.get_instance_id()
+        except Exception as e:
+            log.error("打开新接入的手柄失败: %s", e)
+            return None
+        handler = self._by_instance.get(instance_id)
+        if handler is not None and handler.is_connected:
+            return None  # 已在使用（SDL初始化时会为已连接的设备补发接入事件）
+        handler = handler or self._free_slot()
+        if handler is None:
+            log.warning("已达到手柄数上限 %d，忽略: %s", self.MAX_CONTROLLERS, joystick.get_name())
+            return None
+        if not handler.attach(joystick, load_calibration=False):
+            return None
+        self._by_instance[instance_id] = handler
+        self._load_calibration_async(handler)
+        self._publish_controller_status()
+        return handler
+
+    def _device_removed(self, instance_id: int):
+        """手柄拔出：释放槽位，停止该手柄控制的鼠标移动"""
+        handler = self._by_instance.pop(instance_id, None)
+        if handler is None:
+            return
+        handler.detach()
+        log.info("玩家%d 手柄断开连接", handler.player + 1)
+        self.mouse_motion.set_velocity(0, 0)
+        self._publish_controller_status()
+
+    def _load_calibration_async(self, handler: ControllerHandler):
+        """在后台线程中读取保存的校准数据，读到后交回引擎线程应用"""
+        instance_id, guid, store = handler.instance_id, handler.guid, handler.calibration_store
+
+        def load():
+            calibration = store.load(guid)
+            if calibration is not None:
+                self.post_command("calibration_loaded", handler, instance_id, calibration)
+
+        threading.Thread(target=load, name="CalibrationLoader", daemon=True).start()
+
+    def check_controller_input(self):
+        """检查所有手柄的输入（每周期只采集一次快照，所有处理都读取同一帧）
 
-            print(f"手柄已连接: {self.joystick.get_name()}")
-            return True
-        except Exception as e:
-            print(f"手柄初始化失败: {e}")
-            return False
+        事件已由 _collect_input 统一取出并分发，这里逐个手柄采集，
+        每周期的开销随手柄数线性增长。
+        """
+        players = self._players
+        shared = len(players) > 1
+        # 整个周期使用同一个方案快照，周期内的切换从下一个周期起生效
+        profile = self._profile
+        default_table = profile.actions
+        player_tables = profile.players
+        chords = self._profile_chords
 
-    def _detect_axis_layout(self):
-        """自动检测手柄轴布局"""
-        if not self.joystick:
-            return
+        # 本周期触发的所有动作合并为一个批次，组合键会被原子地注入
+        actions = self._tick_actions
+        input_at = None
+        mouse_frame = None
+        mouse_magnitude = -1.0
+        stick_slot = ControllerFrame.LEFT_X if self.joystick_selection == "左摇杆" else ControllerFrame.RIGHT_X
+        for handler in players:
+            if not handler.is_connected:
+                continue
+            frame = handler.poll(handler.pending_events)
+            if frame is None:
+                # 手柄失效但没有收到拔出事件，稍后重新枚举
+                self._publish("status", "手柄连接丢失")
+                log.warning("玩家%d 手柄连接丢失", handler.player + 1)
+                if self._rescan_at is None:
+                    self._rescan_at = handler.backend.now() + self.RESCAN_RETRY_INTERVAL
+                continue
 
-        num_axes = self.joystick.get_numaxes()
-        name = self.joystick.get_name().lower()
+            table = player_tables[handler.player] or default_table
+            suppressed = 0
+            if chords and frame.pressed:
+                suppressed = self._match_profile_chord(chords, frame)
+            count = len(actions)
+            if frame.transitions:
+                # 事件模式：按顺序分发本周期内的每一次按下
+                for timestamp, bit, is_down in frame.transitions:
+                    if is_down and not (suppressed >> bit) & 1:
+                        if log.debug_enabled:
+                            log.debug("玩家%d 按键触发: %s", handler.player + 1, BUTTON_NAMES[bit])
+                        action = table[bit]
+                        if action is not None:
+                            actions.append(action)
+                            if input_at is None:
+                                input_at = timestamp  # 以触发事件本身的时间计算延迟
+            else:
+                # 轮询模式：按下边沿已由帧异或得到
+                for bit in iter_bits(frame.pressed & ~suppressed):
+                    if log.debug_enabled:
+                        log.debug("玩家%d 按键触发: %s", handler.player + 1, BUTTON_NAMES[bit])
+                    action = table[bit]
+                    if action is not None:
+                        actions.append(action)
+            if input_at is None and len(actions) > count:
+                input_at = frame.timestamp
 
-        # 先按轴数匹配预设
-        if num_axes in self.AXIS_LAYOUTS:
-            layout = self.AXIS_LAYOUTS[num_axes]
-        else:
-            # 轴数不在预设中，用通用方案：前两个是左摇杆，后面的按位置推断
-            if num_axes >= 6:
-                layout = (0, 1, 2, 3, 4, 5)
-            elif num_axes >= 4:
-                layout = (0, 1, None, 2, 3, None)
+            # 多个手柄同时推摇杆时，由偏移最大的手柄控制鼠标
+            if shared:
+                axes = frame.axes
+                magnitude = axes[stick_slot] * axes[stick_slot] + axes[stick_slot + 1] * axes[stick_slot + 1]
+                if magnitude > mouse_magnitude:
+                    mouse_frame, mouse_magnitude = frame, magnitude
             else:
-                layout = (0, 1, None, None, None, None)
+                mouse_frame = frame
 
-        self._axis_layout = {
-            "left_x": layout[0],
-            "left_y": layout[1],
-            "lt": layout[2],
-            "right_x": layout[3],
-            "right_y": layout[4],
-            "rt": layout[5],
-        }
+        if actions:
+            events = []
+            immediate = []
+            for action in actions:
+                if action.__class__ is MacroAction:
+                    # 宏交给调度线程按时间点注入，执行中再次按下则取消
+                    self.macros.toggle(action)
+                else:
+                    events.extend(action.events)
+                    immediate.append(action)
+            if immediate:
+                self.executor.submit_batch(events, tuple(immediate), input_at)
+            actions.clear()
 
-        # 采样静止状态基准值（用于扳机键零点校准）
-        pygame.event.pump()
-        self._trigger_baseline = {}
-        for key in ("lt", "rt"):
-            idx = self._axis_layout.get(key)
-            if idx is not None and idx < num_axes:
-                self._trigger_baseline[key] = self.joystick.get_axis(idx)
+        # 处理摇杆映射鼠标
+        if self.joystick_mouse_enabled and mouse_frame is not None:
+            self.handle_joystick_mouse(mouse_frame)
 
-        print(f"轴布局检测: 共{num_axes}轴, 布局={self._axis_layout}")
-        if self._trigger_baseline:
-            print(f"扳机基准值: {self._trigger_baseline}")
+    def execute_action(self, bit: int):
+        """提交按键动作（按键位编号直接索引编译好的动作表，注入由执行器异步完成）"""
+        action = self._profile.actions[bit]
+        if action.__class__ is MacroAction:
+            self.macros.toggle(action)
+        elif action is not None:
+            self.executor.submit(action)
 
-    def get_button_states(self) -> Dict[str, bool]:
-        """获取当前按键状态"""
-        if not self.is_connected or not self.joystick:
-            return {}
+    def _on_action_complete(self, action):
+        """动作执行完成（执行线程回调）"""
+        self._publish("status", action.description)
 
-        try:
-            pygame.event.pump()
+    def _on_action_error(self, action, error):
+        """动作执行失败（执行线程回调）"""
+        self._publish("status", f"动作执行失败: {error}")
 
-            if not self.joystick.get_init():
-                self.is_connected = False
-                return {}
+    def handle_joystick_mouse(self, frame: ControllerFrame):
+        """处理摇杆映射鼠标移动 - 使用连续移动模式"""
+        # 如果禁用了摇杆鼠标，停止移动
+        if not self.joystick_mouse_enabled:
+            self.mouse_motion.set_velocity(0, 0)
+            return
 
-            states = {
-                "A": bool(self.joystick.get_button(0)),
-                "B": bool(self.joystick.get_button(1)),
-                "X": bool(self.joystick.get_button(2)),
-                "Y": bool(self.joystick.get_button(3)),
-                "LB": bool(self.joystick.get_button(4)),
-                "RB": bool(self.joystick.get_button(5)),
-            }
+        # 根据选择的摇杆获取轴值
+        if self.joystick_selection == "左摇杆":
+            x_axis, y_axis = frame.stick("left")
+        else:
+            x_axis, y_axis = frame.stick("right")
 
-            # 扳机键检测（使用自动检测的轴布局）
-            try:
-                num_axes = self.joystick.get_numaxes()
-                for trigger_name in ("LT", "RT"):
-                    key = trigger_name.lower()
-                    idx = self._axis_layout.get(key) if self._axis_layout else None
-                    if idx is not None and idx < num_axes:
-                        raw = self.joystick.get_axis(idx)
-                        # 如果有基准值，做零点偏移校准
-                        baseline = self._trigger_baseline.get(key, -1.0)
-                        if baseline > 0.5:
-                            # 基准值在正半轴（如SDL布局，静止=-1），标准化: (raw - baseline) 归零
-                            # 正常情况基准约 -1.0，按下去趋向 +1.0
-                            pass
-                        # 标准化: 将 -1~+1 映射为 0~1
-                        normalized = (raw + 1) / 2
-                        # 扣除基准偏移（防止静止时漂移触发）
-                        baseline_norm = (baseline + 1) / 2
-                        effective = max(0, normalized - baseline_norm)
-                        # 保留小量余量防止误触
-                        states[trigger_name] = effective > 0.08
-                    else:
-                        states[trigger_name] = False
-            except Exception as e:
-                print(f"扳机键检测异常: {e}")
-                states["LT"] = False
-                states["RT"] = False
+        # 调试输出摇杆状态（零点和漂移已在采集时校准）
+        if log.debug_enabled and (abs(x_axis) > 0.05 or abs(y_axis) > 0.05):
+            log.debug("摇杆状态 - %s: X=%.3f, Y=%.3f", self.joystick_selection, x_axis, y_axis)
 
-            pressed_buttons = [name for name, pressed in states.items() if pressed]
-            if pressed_buttons:
-                print(f"检测到按键: {pressed_buttons}")
+        # 获取扳机状态用于速度倍率控制
+        trigger_multiplier = 0
+        if frame.buttons & BUTTON_BITS['LT']:  # 左扳机加速
+            trigger_multiplier = 1.0
 
-            return states
-        except Exception as e:
-            print(f"获取按键状态失败: {e}")
-            self.is_connected = False
-            return {}
+        # 设置鼠标移动速度和倍率
+        self.mouse_motion.set_velocity(x_axis, y_axis)
+        self.mouse_motion.set_multiplier(trigger_multiplier)
 
-    def get_joystick_axes(self) -> Dict[str, tuple]:
-        """获取摇杆轴状态"""
-        if not self.is_connected or not self.joystick:
-            return {}
+        # 调试输出（仅在有明显移动时）
+        if log.debug_enabled and (abs(x_axis) > 0.1 or abs(y_axis) > 0.1):
+            log.debug("鼠标速度设置: X=%.3f, Y=%.3f (倍率: %.1fx)", x_axis, y_axis, trigger_multiplier)
 
-        try:
-            pygame.event.pump()
 
-            if not self.joystick.get_init():
-                self.is_connected = False
-                return {}
+def run_replay(engine: MappingEngine, backend: ReplayBackend, clock: VirtualClock):
+    """按虚拟时钟尽可能快地回放录制
 
-            num_axes = self.joystick.get_numaxes()
-            layout = self._axis_layout or {}
+    不启动任何线程：按引擎频率推进时钟，依次执行引擎周期、鼠标移动和注入，
+    因此同一份录制、同样的映射和频率每次都会产生完全相同的输出。
+    """
+    engine.mouse_motion.threaded = False
+    engine.controller.initialize()
+    engine.start_mapping()
+    step = 1.0 / engine.rate_hz
+    # 最后一条记录之后再多跑一个周期，保证最后的输入被处理
+    while True:
+        finished = backend.finished
+        engine.tick()
+        engine.mouse_motion.main_loop_iteration(clock())
+        engine.executor.flush()
+        if finished:
+            break
+        clock.advance(step)
+    engine.stop_mapping()
 
-            def safe_axis(key):
-                idx = layout.get(key)
-                if idx is not None and idx < num_axes:
-                    return self.joystick.get_axis(idx)
-                return 0.0
 
-            left_x = safe_axis("left_x")
-            left_y = safe_axis("left_y")
-            right_x = safe_axis("right_x")
-            right_y = safe_axis("right_y")
+def replay_recording(filename: str, config: Optional[Dict[str, Any]] = None, input_mode: str = "event",
+                     rate_hz: int = MappingEngine.DEFAULT_RATE) -> RecordingSink:
+    """用录制文件代替手柄运行一次映射，返回记录了全部输出的 RecordingSink
 
-            return {
-                "left": (left_x, left_y),
-                "right": (right_x, right_y)
-            }
-        except Exception as e:
-            print(f"获取摇杆状态失败: {e}")
-            self.is_connected = False
-            return {}
+    config 为映射配置（缺省时只有摇杆控制鼠标）；不读取保存的校准数据，
+    同一份录制、配置、输入模式和频率每次都产生相同的输出。
+    """
+    sink = RecordingSink()
+    with InputRecording(filename) as recording:
+        clock = VirtualClock()
+        backend = ReplayBackend(recording, clock)
+        controller = ControllerHandler(input_mode, calibration_store=CalibrationStore(None), backend=backend)
+        engine = MappingEngine(controller, rate_hz=rate_hz, sink=sink)
+        if config is not None:
+            apply_config(engine, config)
+        run_replay(engine, backend, clock)
+    return sink
 
-    def reconnect(self) -> bool:
-        """重新连接手柄"""
-        self.is_connected = False
-        return self.initialize()
 
 class XboxControllerMapperGUI:
     """Xbox手柄映射工具主界面"""
     
-    def __init__(self, master):
+    # 输入模式 -> 界面显示名称
+    INPUT_MODE_LABELS = {"event": "事件驱动", "poll": "轮询"}
+    
+    def __init__(self, master, watch_config: bool = False):
         self.master = master
         self.setup_window()
         
         # 初始化管理器
         self.style_manager = StyleManager(ttk.Style())
         self.config_manager = ConfigManager()
-        self.controller = ControllerHandler()
         
-        # 创建GPad风格的state字典
-        self.state = {'alive': True, 'sleep': False}
-        self.mouse_motion = MouseMotion(self.state)
+        # 映射引擎（独立线程负责手柄轮询和动作执行）
+        screen_size = (self.master.winfo_screenwidth(), self.master.winfo_screenheight())
+        self.engine = MappingEngine(screen_size=screen_size)
         
         # 应用样式
         self.style_manager.apply_modern_theme()
@@ -603,41 +4953,53 @@ class XboxControllerMapperGUI:
         # 设置窗口背景色
         self.master.configure(bg=self.style_manager.colors['bg_primary'])
         
-        # 尝试初始化手柄（允许失败）
-        self.controller.initialize()
-        
-        # 按键映射配置
-        self.button_mappings = self.create_default_mappings()
+        # 按键映射：界面编辑的数据模型（可能包含引擎拒绝的无效映射）和对应的控件
+        self.mappings = self.create_default_mappings()
+        self.button_widgets = {}
         
         # 摇杆映射配置
         self.joystick_mouse_enabled = tk.BooleanVar(value=True)  # 默认开启
         self.joystick_selection = tk.StringVar(value="右摇杆")  # 默认右摇杆
+        self.poll_rate_var = tk.StringVar(value=f"{self.engine.rate_hz} Hz")
+        self.input_mode_var = tk.StringVar(
+            value=self.INPUT_MODE_LABELS[self.engine.controller.input_mode])
         
         # 界面变量
         self.mouse_coords_var = tk.StringVar(value="鼠标位置: X=0, Y=0")
         self.status_var = tk.StringVar(value="就绪")
+        self.profile_var = tk.StringVar(value=self.engine.active_profile)
+        self.shown_profile = None  # 界面上显示的方案快照
+        self.profile_files = {}  # 方案名 -> 配置文件（未列出的使用默认配置文件）
+        self.config_files = {}  # 当前目录下的配置文件 {方案名: 文件名}，由后台扫描得到
+        self.autosaved = None  # 最近一次自动保存的 (文件名, 配置)
+        # 后台线程（保存、扫描）-> 界面 的结果通道
+        self.ui_updates = deque()
         self.running = False
         
-        # 按键防抖动状态
-        self.last_button_states = {}
-        
         # 创建界面
         self.create_widgets()
         
+        # 配置文件监视（可选）：外部修改加载过的配置文件后自动增量更新对应的方案
+        self.config_watcher = ConfigWatcher(self.on_config_file_changed) if watch_config else None
+        self.watched_profiles = {}  # 配置文件绝对路径 -> 方案名
+        
         # 加载配置
         self.load_configuration()
+        if self.config_watcher:
+            self.config_watcher.start()
+        self.refresh_config_files()
         
         # 绑定事件
         self.bind_events()
         
-        # 启动手柄状态检测
-        self.start_controller_detection()
+        # 启动映射引擎线程（手柄初始化和状态检测都在引擎线程中进行）
+        self.engine.start()
         
         # 启动主循环
         self.start_main_loop()
         
-        # 延迟自动启动映射功能，确保UI完全初始化
-        self.master.after(500, self.auto_start_mapping)
+        # 手柄就绪后立即自动启动映射（引擎线程按顺序处理指令，界面此时已创建完毕）
+        self.auto_start_mapping()
     
     def setup_window(self):
         """设置窗口属性"""
@@ -663,21 +5025,10 @@ class XboxControllerMapperGUI:
         y = (self.master.winfo_screenheight() // 2) - (height // 2)
         self.master.geometry(f"{width}x{height}+{x}+{y}")
     
-    def create_default_mappings(self) -> Dict[str, Dict[str, Any]]:
-        """创建默认按键映射配置"""
+    def create_default_mappings(self) -> Dict[str, ButtonMapping]:
+        """创建界面可编辑按键的默认映射（数据模型，控件在 create_button_config_widgets 中创建）"""
         buttons = ["Y", "X", "B", "A", "RT", "LT", "RB", "LB"]
-        mappings = {}
-        
-        for button in buttons:
-            mappings[button] = {
-                "action_type": "无动作",
-                "mouse_x": "",
-                "mouse_y": "",
-                "keyboard_key": "",
-                "action_type_var": tk.StringVar(value="无动作")
-            }
-        
-        return mappings
+        return {button: ButtonMapping() for button in buttons}
     
     def create_widgets(self):
         """创建界面组件"""
@@ -774,15 +5125,18 @@ class XboxControllerMapperGUI:
     
     def create_button_config_widgets(self, parent, button_name):
         """创建单个按键的配置组件 - 现代卡片风格"""
-        mapping = self.button_mappings[button_name]
+        widgets = self.button_widgets[button_name] = {
+            "action_type_var": tk.StringVar(value=self.mappings[button_name].action.label)
+        }
         
         # 动作类型选择
         ttk.Label(parent, text="动作类型", style='Primary.TLabel').grid(
             row=0, column=0, sticky='w', padx=10, pady=6)
         
         action_combo = ttk.Combobox(parent,
-                                  textvariable=mapping["action_type_var"],
-                                  values=["无动作", "鼠标点击", "键盘按键"],
+                                  textvariable=widgets["action_type_var"],
+                                  values=[ACTION_NONE, ACTION_MOUSE_LEFT, ACTION_MOUSE_RIGHT,
+                                          ACTION_MOUSE_CLICK, ACTION_KEYBOARD],
                                   style='Modern.TCombobox',
                                   state='readonly')
         action_combo.grid(row=0, column=1, sticky='ew', padx=10, pady=6)
@@ -802,8 +5156,8 @@ class XboxControllerMapperGUI:
         mouse_entry.bind('<FocusOut>', 
                         lambda e, btn=button_name: self.update_mouse_config(btn))
         
-        mapping["mouse_frame"] = mouse_frame
-        mapping["mouse_entry"] = mouse_entry
+        widgets["mouse_frame"] = mouse_frame
+        widgets["mouse_entry"] = mouse_entry
         mouse_frame.grid_remove()
         
         # 键盘按键输入（初始隐藏）
@@ -819,8 +5173,8 @@ class XboxControllerMapperGUI:
         keyboard_entry.bind('<FocusOut>', 
                            lambda e, btn=button_name: self.update_keyboard_config(btn))
         
-        mapping["keyboard_frame"] = keyboard_frame
-        mapping["keyboard_entry"] = keyboard_entry
+        widgets["keyboard_frame"] = keyboard_frame
+        widgets["keyboard_entry"] = keyboard_entry
         keyboard_frame.grid_remove()
     
     def create_joystick_config(self, parent, side='top'):
@@ -858,6 +5212,38 @@ class XboxControllerMapperGUI:
                                      state='readonly',
                                      width=15)
         joystick_combo.pack(anchor='w')
+
+        # 轮询频率选择
+        ttk.Label(joystick_select_frame,
+                 text="轮询频率：",
+                 style='Primary.TLabel').pack(anchor='w', pady=(12, 5))
+
+        rate_combo = ttk.Combobox(joystick_select_frame,
+                                 textvariable=self.poll_rate_var,
+                                 values=[f"{rate} Hz" for rate in MappingEngine.SUPPORTED_RATES],
+                                 style='Modern.TCombobox',
+                                 state='readonly',
+                                 width=15)
+        rate_combo.pack(anchor='w')
+        rate_combo.bind('<<ComboboxSelected>>', self.on_poll_rate_changed)
+
+        # 输入模式选择
+        ttk.Label(joystick_select_frame,
+                 text="输入模式：",
+                 style='Primary.TLabel').pack(anchor='w', pady=(12, 5))
+
+        mode_combo = ttk.Combobox(joystick_select_frame,
+                                 textvariable=self.input_mode_var,
+                                 values=list(self.INPUT_MODE_LABELS.values()),
+                                 style='Modern.TCombobox',
+                                 state='readonly',
+                                 width=15)
+        mode_combo.pack(anchor='w')
+        mode_combo.bind('<<ComboboxSelected>>', self.on_input_mode_changed)
+
+        # 摇杆选项变化时同步到引擎
+        self.joystick_mouse_enabled.trace_add('write', self.on_joystick_options_changed)
+        self.joystick_selection.trace_add('write', self.on_joystick_options_changed)
     
     def create_mouse_display(self, parent, side='top'):
         """创建鼠标坐标显示和操作提示"""
@@ -979,7 +5365,17 @@ class XboxControllerMapperGUI:
         
         ttk.Button(file_buttons_frame, text="另存为", 
                   command=self.save_config_as,
-                  style='Small.TButton').pack(side='left')
+                  style='Small.TButton').pack(side='left', padx=(0, 8))
+        
+        # 已加载的映射方案，选择后立即切换
+        self.profile_combobox = ttk.Combobox(file_buttons_frame,
+                                             textvariable=self.profile_var,
+                                             values=self.engine.profile_names(),
+                                             state='readonly',
+                                             width=12,
+                                             postcommand=self.refresh_config_files)
+        self.profile_combobox.pack(side='left')
+        self.profile_combobox.bind('<<ComboboxSelected>>', self.on_profile_selected)
         
         # 映射控制按钮组 - 右侧
         mapping_frame = ttk.Frame(control_content, style='Card.TFrame')
@@ -994,6 +5390,14 @@ class XboxControllerMapperGUI:
         mapping_buttons_frame = ttk.Frame(mapping_frame, style='Card.TFrame')
         mapping_buttons_frame.pack(anchor='e')
         
+        ttk.Button(mapping_buttons_frame, text="性能统计",
+                  command=self.open_stats_panel,
+                  style='Small.TButton').pack(side='left', padx=(0, 10))
+        
+        ttk.Button(mapping_buttons_frame, text="校准手柄",
+                  command=self.calibrate_controller,
+                  style='Small.TButton').pack(side='left', padx=(0, 10))
+        
         self.start_button = ttk.Button(mapping_buttons_frame, text="启动映射", 
                                       command=self.start_mapping,
                                       style='Success.TButton')
@@ -1011,11 +5415,80 @@ class XboxControllerMapperGUI:
         self.master.bind('<Control_R>', self.on_ctrl_pressed)
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
     
-    def start_controller_detection(self):
-        """启动手柄状态检测"""
-        self.check_controller_status()
-        # 每2秒检测一次手柄状态
-        self.master.after(2000, self.start_controller_detection)
+    def on_joystick_options_changed(self, *args):
+        """摇杆映射选项改变事件"""
+        self.engine.set_joystick_options(self.joystick_mouse_enabled.get(),
+                                         self.joystick_selection.get())
+    
+    def on_poll_rate_changed(self, event=None):
+        """轮询频率改变事件"""
+        rate_hz = int(self.poll_rate_var.get().split()[0])
+        self.engine.set_rate(rate_hz)
+        self.status_var.set(f"轮询频率: {rate_hz} Hz")
+    
+    def on_input_mode_changed(self, event=None):
+        """输入模式改变事件"""
+        label = self.input_mode_var.get()
+        for input_mode, mode_label in self.INPUT_MODE_LABELS.items():
+            if mode_label == label:
+                self.engine.set_input_mode(input_mode)
+                self.status_var.set(f"输入模式: {label}")
+                return
+    
+    def process_engine_updates(self):
+        """处理引擎发布的显示状态"""
+        updates = self.engine.display_updates
+        # 一次刷新周期内只显示最后一条状态，避免频繁按键时反复刷新界面
+        pending_status = None
+        while updates:
+            kind, value = updates.popleft()
+            if kind == "controller":
+                is_connected, controller_name = value
+                if is_connected:
+                    self.controller_status_var.set(f"手柄状态：已连接 - {controller_name}")
+                elif controller_name == "检测失败":
+                    self.controller_status_var.set("手柄状态：检测失败")
+                else:
+                    self.controller_status_var.set("手柄状态：未连接")
+                self.draw_status_dot(is_connected)
+            elif kind == "mapping":
+                self.running = value
+                if value:
+                    self.start_button.config(state='disabled')
+                    self.stop_button.config(state='normal')
+                    self.status_var.set("映射已启动")
+                else:
+                    self.start_button.config(state='normal')
+                    self.stop_button.config(state='disabled')
+                    self.status_var.set("映射已停止")
+                pending_status = None
+            elif kind == "profile":
+                # 方案可能由组合键切换，引擎中早已生效，这里只刷新显示
+                profile = self.engine.profile(value)
+                if profile is not self.shown_profile:
+                    reloaded = self.shown_profile is not None and self.shown_profile.name == value
+                    self.show_profile(profile)
+                    pending_status = f"映射方案已更新: {value}" if reloaded else f"已切换映射方案: {value}"
+            elif kind == "status":
+                pending_status = value
+            elif kind == "error":
+                messagebox.showerror("错误", value)
+        
+        ui_updates = self.ui_updates
+        while ui_updates:
+            kind, value = ui_updates.popleft()
+            if kind == "saved":
+                self.on_config_saved(*value)
+                pending_status = None
+            elif kind == "config_files":
+                default = os.path.basename(self.config_manager.default_filename)
+                self.config_files = {profile_name(f): f for f in value if f != default}
+                self.update_profile_choices()
+        
+        if pending_status is not None:
+            self.status_var.set(pending_status)
+        
+        self.master.after(50, self.process_engine_updates)
     
     def draw_status_dot(self, is_connected):
         """绘制状态指示圆点"""
@@ -1023,110 +5496,83 @@ class XboxControllerMapperGUI:
         color = "#007AFF" if is_connected else "#FF3B30"  # 蓝色或红色
         self.controller_dot_canvas.create_oval(2, 2, 10, 10, fill=color, outline=color)
     
-    def check_controller_status(self):
-        """检查手柄连接状态"""
-        try:
-            # 检查当前手柄状态，不重新初始化pygame
-            import pygame
-            
-            if pygame.joystick.get_count() > 0:
-                # 有手柄连接
-                if not self.controller.is_connected:
-                    # 只有在未连接时才重新初始化
-                    joystick = pygame.joystick.Joystick(0)
-                    joystick.init()
-                    controller_name = joystick.get_name()
-                    self.controller_status_var.set(f"手柄状态：已连接 - {controller_name}")
-                    self.draw_status_dot(True)  # 蓝色圆点表示已连接
-                    
-                    # 更新控制器状态
-                    self.controller.is_connected = True
-                    self.controller.joystick = joystick
-                    print(f"手柄重新连接: {controller_name}")
-                else:
-                    # 手柄已连接，检查是否仍然有效
-                    if self.controller.joystick and self.controller.joystick.get_init():
-                        # 手柄仍然有效，确保状态显示正确
-                        controller_name = self.controller.joystick.get_name()
-                        self.controller_status_var.set(f"手柄状态：已连接 - {controller_name}")
-                        self.draw_status_dot(True)  # 蓝色圆点表示已连接
-                    else:
-                        # 手柄失效，重新初始化
-                        joystick = pygame.joystick.Joystick(0)
-                        joystick.init()
-                        controller_name = joystick.get_name()
-                        self.controller.joystick = joystick
-                        self.controller_status_var.set(f"手柄状态：已连接 - {controller_name}")
-                        self.draw_status_dot(True)  # 蓝色圆点表示已连接
-                        print("手柄重新初始化")
-            else:
-                # 没有手柄连接
-                if self.controller.is_connected:
-                    self.controller_status_var.set("手柄状态：未连接")
-                    self.draw_status_dot(False)  # 红色圆点表示未连接
-                    self.controller.is_connected = False
-                    self.controller.joystick = None
-                    print("手柄断开连接")
-                    
-        except Exception as e:
-            self.controller_status_var.set("手柄状态：检测失败")
-            self.draw_status_dot(False)  # 红色圆点表示检测失败
-            print(f"手柄状态检测失败: {e}")
-    
     def on_action_type_changed(self, button_name):
         """动作类型改变事件"""
-        mapping = self.button_mappings[button_name]
-        action_type = mapping["action_type_var"].get()
-        mapping["action_type"] = action_type
-        
-        # 显示/隐藏相应的配置区域
-        if action_type == "鼠标点击":
-            mapping["mouse_frame"].grid()
-            mapping["keyboard_frame"].grid_remove()
-        elif action_type == "键盘按键":
-            mapping["mouse_frame"].grid_remove()
-            mapping["keyboard_frame"].grid()
+        action = ActionType.parse(self.button_widgets[button_name]["action_type_var"].get())
+        self.mappings[button_name] = self.mappings[button_name].replace(action=action)
+        self.update_action_display(button_name)
+        return self.sync_mapping(button_name)
+    
+    def update_action_display(self, button_name):
+        """按动作类型显示/隐藏相应的配置区域"""
+        widgets = self.button_widgets[button_name]
+        action = self.mappings[button_name].action
+        if action is ActionType.MOUSE_CLICK:
+            widgets["mouse_frame"].grid()
+            widgets["keyboard_frame"].grid_remove()
+        elif action is ActionType.KEYBOARD:
+            widgets["mouse_frame"].grid_remove()
+            widgets["keyboard_frame"].grid()
         else:
-            mapping["mouse_frame"].grid_remove()
-            mapping["keyboard_frame"].grid_remove()
+            widgets["mouse_frame"].grid_remove()
+            widgets["keyboard_frame"].grid_remove()
+    
+    def show_mapping(self, button_name):
+        """将数据模型中的映射显示到控件上"""
+        mapping = self.mappings[button_name]
+        widgets = self.button_widgets[button_name]
+        widgets["action_type_var"].set(mapping.action.label)
+        widgets["mouse_entry"].delete(0, tk.END)
+        if mapping.x is not None and mapping.y is not None:
+            widgets["mouse_entry"].insert(0, f"{mapping.x},{mapping.y}")
+        widgets["keyboard_entry"].delete(0, tk.END)
+        widgets["keyboard_entry"].insert(0, mapping.key)
+        self.update_action_display(button_name)
+    
+    def sync_mapping(self, button_name) -> bool:
+        """将按键映射编译并同步到引擎，映射无效时清除引擎中该按键的映射"""
+        try:
+            self.engine.set_mapping(button_name, self.mappings[button_name])
+            return True
+        except MappingError as e:
+            self.engine.clear_mapping(button_name)
+            self.status_var.set(f"按键 {button_name} 映射无效: {e}")
+            return False
+        finally:
+            self.schedule_autosave()
     
     def update_mouse_config(self, button_name):
         """更新鼠标配置"""
-        mapping = self.button_mappings[button_name]
-        coord_text = mapping["mouse_entry"].get().strip()
+        coord_text = self.button_widgets[button_name]["mouse_entry"].get().strip()
         
         try:
-            if ',' in coord_text:
-                x, y = map(int, coord_text.split(','))
-                mapping["mouse_x"] = str(x)
-                mapping["mouse_y"] = str(y)
-            else:
-                mapping["mouse_x"] = ""
-                mapping["mouse_y"] = ""
+            x, y = map(int, coord_text.split(','))
         except ValueError:
-            mapping["mouse_x"] = ""
-            mapping["mouse_y"] = ""
+            x = y = None
+        
+        self.mappings[button_name] = self.mappings[button_name].replace(x=x, y=y)
+        self.sync_mapping(button_name)
     
     def update_keyboard_config(self, button_name):
         """更新键盘配置"""
-        mapping = self.button_mappings[button_name]
-        mapping["keyboard_key"] = mapping["keyboard_entry"].get().strip()
+        key = self.button_widgets[button_name]["keyboard_entry"].get().strip()
+        self.mappings[button_name] = self.mappings[button_name].replace(key=key)
+        self.sync_mapping(button_name)
     
     def on_ctrl_pressed(self, event):
         """Ctrl键按下事件 - 快速获取鼠标坐标"""
-        x, y = pyautogui.position()
+        x, y = self.master.winfo_pointerxy()
         
         # 获取当前焦点的组件
         focused_widget = self.master.focus_get()
         
         # 只为当前焦点的鼠标坐标输入框填入坐标
         if focused_widget:
-            for button_name, mapping in self.button_mappings.items():
-                if (mapping["action_type"] == "鼠标点击" and 
-                    "mouse_entry" in mapping and 
-                    mapping["mouse_entry"] == focused_widget):
-                    mapping["mouse_entry"].delete(0, tk.END)
-                    mapping["mouse_entry"].insert(0, f"{x},{y}")
+            for button_name, widgets in self.button_widgets.items():
+                if (self.mappings[button_name].action is ActionType.MOUSE_CLICK and 
+                    widgets["mouse_entry"] == focused_widget):
+                    widgets["mouse_entry"].delete(0, tk.END)
+                    widgets["mouse_entry"].insert(0, f"{x},{y}")
                     self.update_mouse_config(button_name)
                     self.status_var.set(f"已为 {button_name} 设置坐标: ({x}, {y})")
                     self.master.after(3000, lambda: self.status_var.set("就绪"))
@@ -1136,22 +5582,26 @@ class XboxControllerMapperGUI:
         self.status_var.set(f"请先点击要设置坐标的输入框，当前坐标: ({x}, {y})")
         self.master.after(3000, lambda: self.status_var.set("就绪"))
     
+    def build_config(self) -> Dict[str, Any]:
+        """生成当前方案的配置（界面未显示的按键和玩家映射取自引擎中的方案）"""
+        config = self.engine.profile().to_config()
+        for button_name, mapping in self.mappings.items():
+            config["buttons"][button_name] = mapping.to_dict()
+        config["stick_curves"] = self.engine.stick_curve_profiles()
+        for buttons, target in self.engine.profile_chords():
+            if target is None:
+                config["profile_switch"] = buttons
+        return config
+    
+    def profile_file(self) -> str:
+        """当前方案对应的配置文件"""
+        return self.profile_files.get(self.engine.active_profile, self.config_manager.default_filename)
+    
     def save_config(self):
-        """保存配置"""
-        config = {}
-        for button_name, mapping in self.button_mappings.items():
-            config[button_name] = {
-                "action_type": mapping["action_type"],
-                "mouse_x": mapping["mouse_x"],
-                "mouse_y": mapping["mouse_y"],
-                "keyboard_key": mapping["keyboard_key"]
-            }
-        
-        if self.config_manager.save_config(config):
-            messagebox.showinfo("成功", "配置已保存")
-            self.status_var.set("配置已保存")
-        else:
-            messagebox.showerror("错误", "保存配置失败")
+        """保存配置（后台写入当前方案的配置文件，完成后显示结果）"""
+        self.config_manager.save_config_async(
+            self.build_config(), self.profile_file(), delay=0,
+            callback=lambda ok, filename: self.ui_updates.append(("saved", (ok, filename, True))))
     
     def save_config_as(self):
         """另存为配置"""
@@ -1162,20 +5612,40 @@ class XboxControllerMapperGUI:
         )
         
         if filename:
-            config = {}
-            for button_name, mapping in self.button_mappings.items():
-                config[button_name] = {
-                    "action_type": mapping["action_type"],
-                    "mouse_x": mapping["mouse_x"],
-                    "mouse_y": mapping["mouse_y"],
-                    "keyboard_key": mapping["keyboard_key"]
-                }
-            
-            if self.config_manager.save_config(config, filename):
+            self.config_manager.save_config_async(
+                self.build_config(), filename, delay=0,
+                callback=lambda ok, filename: self.ui_updates.append(("saved", (ok, filename, True))))
+    
+    def schedule_autosave(self):
+        """映射修改后自动保存（连续修改合并为一次写入，内容没有变化时不写入）"""
+        config = self.build_config()
+        filename = self.profile_file()
+        if self.autosaved == (filename, config):
+            return
+        self.autosaved = (filename, config)
+        self.config_manager.save_config_async(
+            config, filename,
+            callback=lambda ok, filename: self.ui_updates.append(("saved", (ok, filename, False))))
+    
+    def on_config_saved(self, ok, filename, notify):
+        """后台保存完成（在界面线程中处理）"""
+        if ok:
+            self.status_var.set(f"配置已保存到 {os.path.basename(filename)}")
+            if notify:
                 messagebox.showinfo("成功", f"配置已保存到 {os.path.basename(filename)}")
-                self.status_var.set(f"配置已保存到 {os.path.basename(filename)}")
-            else:
-                messagebox.showerror("错误", "保存配置失败")
+        else:
+            messagebox.showerror("错误", "保存配置失败")
+    
+    def refresh_config_files(self):
+        """在后台扫描当前目录下的配置文件，结果用于方案下拉框"""
+        self.config_manager.get_config_files_async(
+            lambda files: self.ui_updates.append(("config_files", files)))
+    
+    def update_profile_choices(self):
+        """方案下拉框：已加载的方案和当前目录下尚未加载的配置文件"""
+        names = self.engine.profile_names()
+        names += [name for name in sorted(self.config_files) if name not in names]
+        self.profile_combobox.config(values=names)
     
     def load_config_dialog(self):
         """加载配置对话框"""
@@ -1188,221 +5658,366 @@ class XboxControllerMapperGUI:
             self.load_configuration(filename)
     
     def load_configuration(self, filename=None):
-        """加载配置"""
+        """加载配置（编译为映射方案并切换过去，未指定文件时替换当前方案）"""
         config = self.config_manager.load_config(filename)
         
         if config:
-            for button_name, button_config in config.items():
-                if button_name in self.button_mappings:
-                    mapping = self.button_mappings[button_name]
-                    
-                    # 更新配置
-                    mapping["action_type"] = button_config.get("action_type", "无动作")
-                    mapping["mouse_x"] = button_config.get("mouse_x", "")
-                    mapping["mouse_y"] = button_config.get("mouse_y", "")
-                    mapping["keyboard_key"] = button_config.get("keyboard_key", "")
-                    
-                    # 更新界面
-                    mapping["action_type_var"].set(mapping["action_type"])
-                    
-                    if mapping["action_type"] == "鼠标点击" and mapping["mouse_x"] and mapping["mouse_y"]:
-                        mapping["mouse_entry"].delete(0, tk.END)
-                        mapping["mouse_entry"].insert(0, f"{mapping['mouse_x']},{mapping['mouse_y']}")
-                    elif mapping["action_type"] == "键盘按键" and mapping["keyboard_key"]:
-                        mapping["keyboard_entry"].delete(0, tk.END)
-                        mapping["keyboard_entry"].insert(0, mapping["keyboard_key"])
-                    
-                    # 更新显示
-                    self.on_action_type_changed(button_name)
+            name = profile_name(filename) if filename else None
+            invalid_buttons = apply_config(self.engine, config, name)
+            if filename:
+                self.profile_files[name] = filename
+            self.show_profile(self.engine.profile(name))
             
             filename_display = os.path.basename(filename) if filename else "默认配置"
-            self.status_var.set(f"已加载配置: {filename_display}")
+            if invalid_buttons:
+                self.status_var.set(f"已加载配置: {filename_display}（无效映射: {', '.join(invalid_buttons)}）")
+            else:
+                self.status_var.set(f"已加载配置: {filename_display}")
+        
+        # 默认配置文件不存在时也监视，之后创建时自动加载
+        if self.config_watcher and (config or filename is None):
+            path = os.path.abspath(filename or self.config_manager.default_filename)
+            self.watched_profiles[path] = self.engine.active_profile
+            self.config_watcher.add(path)
     
-    def start_mapping(self):
-        """启动映射"""
-        if not self.controller.is_connected:
-            # 尝试重新初始化手柄
-            pygame.joystick.quit()
-            pygame.joystick.init()
-            if not self.controller.reconnect():
-                messagebox.showerror("错误", "手柄未连接，请检查手柄连接")
+    def show_profile(self, profile):
+        """在界面上显示方案中的映射（只更新数据模型和控件，映射已由引擎编译好）"""
+        for button_name in self.mappings:
+            self.mappings[button_name] = profile.mappings.get(button_name, ButtonMapping())
+            self.show_mapping(button_name)
+        
+        self.shown_profile = profile
+        self.update_profile_choices()
+        self.profile_var.set(profile.name)
+    
+    def on_config_file_changed(self, path):
+        """配置文件被外部修改（监视线程回调，界面由引擎发布的方案更新刷新）"""
+        reload_config_file(self.engine, self.config_manager, path, self.watched_profiles.get(path))
+    
+    def on_profile_selected(self, event=None):
+        """在界面上切换映射方案（尚未加载的配置文件先加载）"""
+        name = self.profile_var.get()
+        if name not in self.engine.profile_names() and name in self.config_files:
+            self.load_configuration(self.config_files[name])
+            return
+        try:
+            self.engine.switch_profile(name)
+        except ValueError as e:
+            self.status_var.set(str(e))
+    
+    def open_stats_panel(self):
+        """打开性能统计面板（延迟直方图摘要和调度统计，每秒刷新）"""
+        if getattr(self, "stats_window", None) and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        
+        window = tk.Toplevel(self.master)
+        window.title("性能统计")
+        window.configure(bg=self.style_manager.colors['bg_primary'])
+        self.stats_window = window
+        
+        columns = LatencyRecorder.CSV_FIELDS
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=16)
+        headings = {"action": "动作", "stage": "阶段", "count": "次数"}
+        for column in columns:
+            tree.heading(column, text=headings.get(column, column.replace("_ms", " (ms)")))
+            tree.column(column, width=90 if column in headings else 80, anchor='e')
+        tree.pack(fill='both', expand=True, padx=10, pady=(10, 5))
+        
+        timing_var = tk.StringVar()
+        ttk.Label(window, textvariable=timing_var).pack(anchor='w', padx=10)
+        
+        buttons = ttk.Frame(window)
+        buttons.pack(anchor='e', padx=10, pady=10)
+        ttk.Button(buttons, text="导出", command=self.export_latency_stats,
+                  style='Small.TButton').pack(side='left', padx=(0, 8))
+        ttk.Button(buttons, text="重置", command=self.engine.reset_latency,
+                  style='Small.TButton').pack(side='left')
+        
+        def refresh():
+            if not window.winfo_exists():
                 return
-
-        self.running = True
-
-        # 重新创建鼠标移动控制器（因为stop后线程已终止）
-        self.state = {'alive': True, 'sleep': False}
-        self.mouse_motion = MouseMotion(self.state)
-
-        self.start_button.config(state='disabled')
-        self.stop_button.config(state='normal')
-        self.status_var.set("映射已启动")
+            tree.delete(*tree.get_children())
+            for row in self.engine.executor.latency.rows():
+                tree.insert('', 'end', values=[f"{v:.3f}" if isinstance(v, float) else v for v in row])
+            timing = self.engine.timing_stats()
+            timing_var.set("  ".join(
+                f"{name}: {stats['achieved_hz']:.0f}/{stats['rate_hz']} Hz, "
+                f"错过 {stats['missed']}, 抖动p99 {stats['jitter_p99_ms']:.2f} ms"
+                for name, stats in timing.items()))
+            window.after(1000, refresh)
+        
+        refresh()
+    
+    def export_latency_stats(self):
+        """导出延迟统计到 CSV 或 JSON 文件"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("JSON files", "*.json")],
+            title="导出延迟统计"
+        )
+        if filename:
+            try:
+                self.engine.dump_latency(filename)
+                self.status_var.set(f"延迟统计已导出到 {os.path.basename(filename)}")
+            except OSError as e:
+                messagebox.showerror("错误", f"导出失败: {e}")
+    
+    def calibrate_controller(self):
+        """校准手柄（采样在引擎线程中进行，进度通过状态栏显示）"""
+        self.engine.calibrate()
+    
+    def start_mapping(self):
+        """启动映射（由引擎线程执行，结果通过显示状态返回）"""
+        self.engine.post_command("start")
     
     def stop_mapping(self):
         """停止映射"""
-        self.running = False
-        self.state['alive'] = False
-
-        self.start_button.config(state='normal')
-        self.stop_button.config(state='disabled')
-        self.status_var.set("映射已停止")
+        self.engine.post_command("stop")
     
     def start_main_loop(self):
         """启动主循环"""
         self.update_mouse_position()
-        self.check_controller_input()
+        self.process_engine_updates()
     
     def update_mouse_position(self):
         """更新鼠标位置显示"""
         try:
-            x, y = pyautogui.position()
+            x, y = self.master.winfo_pointerxy()
             self.mouse_coords_var.set(f"鼠标位置: X={x}, Y={y}")
         except:
             pass
         
         self.master.after(100, self.update_mouse_position)
     
-    def check_controller_input(self):
-        """检查手柄输入"""
-        if self.running:
-            button_states = self.controller.get_button_states()
-
-            if not button_states and self.controller.is_connected:
-                # 手柄可能断开连接
-                self.controller.is_connected = False
-                self.status_var.set("手柄连接丢失")
-                print("手柄连接丢失")
-            
-            # 处理按键输入 - 添加防抖动逻辑
-            for button_name, pressed in button_states.items():
-                # 获取上一次的按键状态
-                last_pressed = self.last_button_states.get(button_name, False)
-
-                # 只在按键从未按下变为按下时触发动作（防抖动）
-                if pressed and not last_pressed:
-                    print(f"按键触发: {button_name}")
-                    self.execute_action(button_name)
-
-                # 更新按键状态
-                self.last_button_states[button_name] = pressed
-
-            # 处理摇杆映射鼠标
-            if self.joystick_mouse_enabled.get():
-                self.handle_joystick_mouse()
-        else:
-            pass
-        
-        self.master.after(50, self.check_controller_input)
-    
-    def execute_action(self, button_name):
-        """执行按键动作"""
-        if button_name not in self.button_mappings:
-            return
-
-        mapping = self.button_mappings[button_name]
-        action_type = mapping["action_type"]
-
-        try:
-            if action_type == "鼠标点击":
-                if mapping["mouse_x"] and mapping["mouse_y"]:
-                    x, y = int(mapping["mouse_x"]), int(mapping["mouse_y"])
-                    pyautogui.click(x, y)
-                    self.status_var.set(f"执行鼠标点击: ({x}, {y})")
-
-            elif action_type == "键盘按键":
-                if mapping["keyboard_key"]:
-                    pyautogui.press(mapping["keyboard_key"])
-                    self.status_var.set(f"执行按键: {mapping['keyboard_key']}")
-
-        except Exception as e:
-            print(f"执行动作失败: {e}")
-            self.status_var.set(f"动作执行失败: {button_name}")
-    
-    def handle_joystick_mouse(self):
-        """处理摇杆映射鼠标移动 - 使用连续移动模式"""
-        if not self.controller.is_connected:
-            return
-        
-        joystick_axes = self.controller.get_joystick_axes()
-        if not joystick_axes:
-            # 如果获取摇杆状态失败，尝试重新连接
-            if not self.controller.reconnect():
-                return
-            joystick_axes = self.controller.get_joystick_axes()
-            if not joystick_axes:
-                return
-        
-        # 如果禁用了摇杆鼠标，停止移动
-        if not self.joystick_mouse_enabled.get():
-            self.mouse_motion.set_velocity(0, 0)
-            return
-        
-        # 根据选择的摇杆获取轴值
-        if self.joystick_selection.get() == "左摇杆":
-            x_axis, y_axis = joystick_axes.get("left", (0, 0))
-        else:
-            x_axis, y_axis = joystick_axes.get("right", (0, 0))
-        
-        # 检测并修复右摇杆Y轴漂移问题（仅在静止状态）
-        drift_corrected = False
-        if self.joystick_selection.get() == "右摇杆":
-            # 检测Y轴漂移：Y轴精确为-1.0且X轴接近0，且持续时间超过阈值
-            if abs(y_axis + 1.0) < 0.001 and abs(x_axis) < 0.01:  # 更严格的条件
-                # 初始化漂移计数器
-                if not hasattr(self, '_drift_counter'):
-                    self._drift_counter = 0
-                self._drift_counter += 1
-                
-                # 连续检测到漂移超过10次才修正，避免误判
-                if self._drift_counter > 10:
-                    y_axis = 0
-                    drift_corrected = True
-                    if not hasattr(self, '_drift_warning_shown'):
-                        print("检测到右摇杆Y轴持续漂移，已自动修正")
-                        self._drift_warning_shown = True
-            else:
-                # 重置漂移计数器
-                if hasattr(self, '_drift_counter'):
-                    self._drift_counter = 0
-        
-        # 调试输出摇杆状态（排除漂移修正的情况）
-        if not drift_corrected and (abs(x_axis) > 0.05 or abs(y_axis) > 0.05):
-            print(f"摇杆状态 - {self.joystick_selection.get()}: X={x_axis:.3f}, Y={y_axis:.3f}")
-        
-        # 获取扳机状态用于速度倍率控制
-        button_states = self.controller.get_button_states()
-        trigger_multiplier = 0
-        if button_states and button_states.get('LT', False):  # 左扳机加速
-            trigger_multiplier = 1.0
-        
-        # 设置鼠标移动速度和倍率
-        self.mouse_motion.set_velocity(x_axis, y_axis)
-        self.mouse_motion.set_multiplier(trigger_multiplier)
-        
-        # 调试输出（仅在有明显移动时）
-        if abs(x_axis) > 0.1 or abs(y_axis) > 0.1:
-            multiplier_text = f" (倍率: {trigger_multiplier:.1f}x)" if trigger_multiplier > 0 else ""
-            print(f"鼠标速度设置: X={x_axis:.3f}, Y={y_axis:.3f}{multiplier_text}")
-
     def auto_start_mapping(self):
         """自动启动映射功能"""
-        if self.controller.is_connected:
-            print("自动启动映射功能")  # 调试输出
-            self.start_mapping()
-        else:
-            print("手柄未连接，无法自动启动映射")
+        self.engine.post_command("auto_start")
     
     def on_closing(self):
         """窗口关闭事件"""
         self.running = False
-        self.state['alive'] = False
-        self.mouse_motion.stop()
+        if self.config_watcher:
+            self.config_watcher.stop()
+        self.config_manager.flush()
+        self.engine.shutdown()
         self.master.destroy()
 
-def main():
+def apply_config(engine: MappingEngine, config: Dict[str, Any], name: Optional[str] = None,
+                 activate: bool = True) -> list:
+    """将配置文件内容编译为映射方案并加载到引擎（未出现的按键没有动作），返回无效的按键/摇杆列表
+
+    name 为 None 时替换当前方案；activate 为 False 时只预加载，不切换当前方案。
+    配置中的 profile_switch（按键列表）设置切换到下一个方案的组合键。
+    """
+    invalid = engine.load_profile(name or engine.active_profile, config, activate)
+    chord = config.get("profile_switch")
+    if chord:
+        try:
+            engine.set_profile_chord(chord)
+        except ValueError as e:
+            log.warning("方案切换组合键无效: %s", e)
+            invalid.append("profile_switch")
+    return invalid
+
+
+def reload_config_file(engine: MappingEngine, config_manager: ConfigManager, filename: str,
+                       name: Optional[str] = None) -> bool:
+    """配置文件被修改后增量更新对应的方案（在监视线程中调用）
+
+    文件无法解析时记录警告并保持原有映射，正在运行的映射不受影响。
+    """
+    try:
+        config = config_manager.read_config(filename)
+    except (OSError, ValueError) as e:
+        log.warning("配置文件无效，保持原有映射: %s（%s）", filename, e)
+        return False
+    changed, invalid = engine.reload_profile(name or profile_name(filename), config)
+    chord = config.get("profile_switch")
+    if chord:
+        try:
+            engine.set_profile_chord(chord)
+        except ValueError as e:
+            log.warning("方案切换组合键无效: %s", e)
+            invalid.append("profile_switch")
+    if changed:
+        log.info("配置文件已更新: %s，变化: %s%s", os.path.basename(filename), ", ".join(changed),
+                 f"（无效映射: {', '.join(invalid)}）" if invalid else "")
+    return True
+
+
+def profile_name(filename: str) -> str:
+    """由配置文件名得到方案名称"""
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def run_headless(config_file: str, output_backend: str = "auto", rate_hz: int = MappingEngine.DEFAULT_RATE,
+                 profile_files=(), watch: bool = False, screen_size: Optional[tuple] = None,
+                 record_file: Optional[str] = None) -> int:
+    """后台模式：只运行手柄和映射引擎，不加载界面
+
+    SIGTERM / SIGINT 停止，SIGHUP 重新加载配置；手柄连接后自动开始映射。
+    config_file 作为默认方案，profile_files 中的配置预加载为以文件名命名的方案；
+    watch 为 True 时监视这些文件，修改后自动增量更新对应的方案。
+    uinput 输出需要 screen_size 才能执行坐标点击，未提供时这类映射在加载时报告为无效。
+    record_file 不为 None 时在手柄第一次连接后把原始输入录制到该文件（--replay 回放）。
+    """
+    import signal
+
+    config_manager = ConfigManager(config_file)
+    for filename in (config_file,) + tuple(profile_files):
+        if not os.path.exists(filename):
+            log.error("配置文件不存在: %s", filename)
+            return 1
+
+    engine = MappingEngine(rate_hz=rate_hz, output_backend=output_backend, screen_size=screen_size)
+
+    def load_profiles():
+        # 重新加载时不切换当前方案，当前方案的新快照会立即生效；
+        # 文件无法读取或格式错误时保持该方案原有的映射（写到一半的文件不会清空映射）
+        for filename in (config_file,) + tuple(profile_files):
+            name = MappingEngine.DEFAULT_PROFILE if filename == config_file else profile_name(filename)
+            try:
+                config = config_manager.read_config(filename)
+            except (OSError, ValueError) as e:
+                log.error("配置文件无效，保持原有映射: %s（%s）", filename, e)
+                continue
+            invalid = apply_config(engine, config, name, activate=False)
+            log.info("已加载配置: %s%s", filename, f"（无效映射: {', '.join(invalid)}）" if invalid else "")
+
+    load_profiles()
+
+    watcher = None
+    if watch:
+        names = {os.path.abspath(filename): profile_name(filename) for filename in profile_files}
+        names[os.path.abspath(config_file)] = MappingEngine.DEFAULT_PROFILE
+        watcher = ConfigWatcher(lambda path: reload_config_file(engine, config_manager, path, names[path]))
+        for path in names:
+            watcher.add(path)
+        watcher.start()
+        log.info("正在监视配置文件（%s）", watcher.backend)
+
+    stop_event = threading.Event()
+    reload_event = threading.Event()
+
+    def on_stop(signum, frame):
+        stop_event.set()
+
+    def on_reload(signum, frame):
+        reload_event.set()
+        stop_event.set()  # 唤醒主循环
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, on_reload)
+
+    engine.start()
+    mapping = False
+    try:
+        while True:
+            stop_event.wait(0.5)
+            if reload_event.is_set():
+                reload_event.clear()
+                stop_event.clear()
+                load_profiles()
+            elif stop_event.is_set():
+                break
+
+            updates = engine.display_updates
+            while updates:
+                kind, value = updates.popleft()
+                if kind == "controller":
+                    if value[0] and not mapping:
+                        engine.post_command("start")
+                    if value[0] and record_file:
+                        engine.start_recording(record_file)
+                        record_file = None
+                elif kind == "mapping":
+                    mapping = value
+                    log.info("映射已启动" if value else "映射已停止")
+                elif kind == "error":
+                    log.error("错误: %s", value)
+                elif kind == "status":
+                    log.info("%s", value)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        engine.shutdown()
+        log.info("映射引擎已停止")
+    return 0
+
+
+def parse_screen_size(text: str) -> tuple:
+    """解析 宽x高 形式的屏幕尺寸（命令行参数）"""
+    try:
+        width, height = (int(value) for value in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"无效的屏幕尺寸: {text}")
+    if width <= 0 or height <= 0:
+        raise ValueError(f"无效的屏幕尺寸: {text}")
+    return width, height
+
+
+def run_replay_file(filename: str, config_file: str, input_mode: str = "event",
+                    rate_hz: int = MappingEngine.DEFAULT_RATE) -> int:
+    """回放录制文件，把映射产生的输出事件逐行打印到标准输出（同样的参数每次输出相同）"""
+    config = None
+    if os.path.exists(config_file):
+        try:
+            config = ConfigManager(config_file).read_config(config_file)
+        except (OSError, ValueError) as e:
+            log.error("配置文件无效: %s（%s）", config_file, e)
+            return 1
+    try:
+        sink = replay_recording(filename, config, input_mode, rate_hz)
+    except (OSError, ValueError) as e:
+        log.error("回放失败: %s", e)
+        return 1
+    for op, a, b in sink.events:
+        print(OUTPUT_EVENT_NAMES[op], a, b)
+    log.info("回放完成: %s（%d 个输出事件）", filename, len(sink.events))
+    return 0
+
+
+def main(argv=None):
     """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Xbox 手柄映射工具")
+    parser.add_argument("--headless", action="store_true", help="后台运行，不显示界面")
+    parser.add_argument("--config", default=ConfigManager().default_filename,
+                        help="配置文件（后台模式使用，格式与界面保存的配置相同）")
+    parser.add_argument("--output", default="auto", choices=OUTPUT_BACKENDS, help="输出后端（后台模式）")
+    parser.add_argument("--rate", type=int, default=MappingEngine.DEFAULT_RATE,
+                        choices=MappingEngine.SUPPORTED_RATES, help="轮询频率（Hz，后台模式）")
+    parser.add_argument("--profile", action="append", default=[], metavar="FILE",
+                        help="预加载的其他映射方案（可重复，后台模式，以文件名作为方案名）")
+    parser.add_argument("--watch", action="store_true", help="监视配置文件，修改后自动重新加载")
+    parser.add_argument("--screen-size", type=parse_screen_size, metavar="WxH",
+                        help="屏幕尺寸（后台模式使用 uinput 输出时，坐标点击需要）")
+    parser.add_argument("--record", metavar="FILE", help="手柄连接后把原始输入录制到文件（后台模式）")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="用录制文件代替手柄运行映射，把输出事件打印到标准输出后退出（不注入输入）")
+    parser.add_argument("--input-mode", default="event", choices=ControllerHandler.INPUT_MODES,
+                        help="回放时的输入模式")
+    parser.add_argument("--log-level", default="info", choices=tuple(LOG_LEVELS), help="日志级别")
+    parser.add_argument("--log-json", action="store_true", help="日志按 JSON 行输出")
+    args = parser.parse_args(argv)
+
+    log.set_level(args.log_level)
+    log.json_format = args.log_json
+
+    if args.replay:
+        log.set_stream(sys.stderr)  # 标准输出只留给回放产生的输出事件
+        sys.exit(run_replay_file(args.replay, args.config, args.input_mode, args.rate))
+
+    if args.headless:
+        sys.exit(run_headless(args.config, args.output, args.rate, args.profile, args.watch, args.screen_size,
+                              args.record))
+
     root = tk.Tk()
-    app = XboxControllerMapperGUI(root)
+    app = XboxControllerMapperGUI(root, watch_config=args.watch)
     root.mainloop()
 
 if __name__ == '__main__':
@@ -0,0 +1,174 @@
+"""
+虚拟手柄设备 - 测试和性能基准共用
+
+FakeJoystick 的接口与 pygame.joystick.Joystick 一致；ScriptedBackend 的事件和插拔由调用方
+按顺序排入，FakeJoystickBackend 在此基础上每次取事件时自动推进合成输入。
+"""
+
+import math
+import time
+
+import controller_mapper as cm
+
+
+class FakeJoystick:
+    """虚拟手柄 - 接口与 pygame.joystick.Joystick 一致，状态由调用方直接设置"""
+
+    def __init__(self, instance_id: int = 0, num_axes: int = 6, num_buttons: int = 10):
+        self.instance_id = instance_id
+        self.axes = [0.0] * num_axes
+        self.axes[2] = self.axes[5] = -1.0  # 扳机静止值
+        self.buttons = [False] * num_buttons
+        self.hats = [(0, 0)]
+        self._init = False
+
+    def init(self):
+        self._init = True
+
+    def quit(self):
+        self._init = False
+
+    def get_init(self):
+        return self._init
+
+    def get_name(self):
+        return f"Fake Pad {self.instance_id}"
+
+    def get_guid(self):
+        return f"fake{self.instance_id:04d}"
+
+    def get_instance_id(self):
+        return self.instance_id
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_numhats(self):
+        return len(self.hats)
+
+    def get_axis(self, index):
+        return self.axes[index]
+
+    def get_button(self, index):
+        return self.buttons[index]
+
+    def get_hat(self, index):
+        return self.hats[index]
+
+
+class FakeEvent:
+    """虚拟手柄事件（字段与 pygame 手柄事件一致，可以另带时间戳）"""
+
+    __slots__ = ("type", "instance_id", "timestamp", "axis", "button", "hat", "value", "device_index")
+
+    def __init__(self, event_type: int, instance_id=None, **fields):
+        self.type = event_type
+        self.instance_id = instance_id
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+class ScriptedBackend(cm.JoystickBackend):
+    """脚本化输入后端 - 事件和插拔由调用方按顺序排入 queue，时间默认由 VirtualClock 推进"""
+
+    name = "scripted"
+
+    def __init__(self, joysticks=(), clock=None):
+        self.joysticks = list(joysticks)
+        self.clock = clock or cm.VirtualClock(1.0)
+        self.queue = []
+        self._next_instance_id = max((joystick.instance_id for joystick in self.joysticks), default=-1) + 1
+
+    def plug(self) -> FakeJoystick:
+        """插入一个新手柄（与SDL一致：分配新的实例编号，产生 JOYDEVICEADDED 事件）"""
+        joystick = FakeJoystick(self._next_instance_id)
+        self._next_instance_id += 1
+        self.joysticks.append(joystick)
+        self.queue.append(FakeEvent(cm.pygame.JOYDEVICEADDED, device_index=len(self.joysticks) - 1))
+        return joystick
+
+    def unplug(self, instance_id: int):
+        """拔出手柄，产生 JOYDEVICEREMOVED 事件"""
+        for joystick in self.joysticks:
+            if joystick.instance_id == instance_id:
+                joystick.quit()
+        self.joysticks = [joystick for joystick in self.joysticks if joystick.instance_id != instance_id]
+        self.queue.append(FakeEvent(cm.pygame.JOYDEVICEREMOVED, instance_id))
+
+    def init(self):
+        pass
+
+    def reinit(self):
+        pass
+
+    def count(self) -> int:
+        return len(self.joysticks)
+
+    def open(self, index: int):
+        joystick = self.joysticks[index]
+        joystick.init()
+        return joystick
+
+    def pump(self):
+        pass
+
+    def get_events(self) -> list:
+        events, self.queue = self.queue, []
+        return events
+
+    def get_device_events(self) -> list:
+        device_types = (cm.pygame.JOYDEVICEADDED, cm.pygame.JOYDEVICEREMOVED)
+        events = [event for event in self.queue if event.type in device_types]
+        self.queue = []
+        return events
+
+    def now(self) -> float:
+        return self.clock()
+
+
+class FakeJoystickBackend(ScriptedBackend):
+    """合成输入后端 - 每次取事件时推进一步：每个手柄的右摇杆画圆，每隔 press_every 步切换一个按键"""
+
+    name = "fake"
+
+    def __init__(self, press_every: int = 8, clock=None, controllers: int = 1):
+        super().__init__([FakeJoystick(instance_id) for instance_id in range(controllers)],
+                         clock or time.perf_counter)
+        self.joystick = self.joysticks[0]
+        self.press_every = press_every
+        self._step = 0
+
+    def _advance(self) -> list:
+        self._step += 1
+        step = self._step
+        events = []
+        for joystick in self.joysticks:
+            instance_id = joystick.instance_id
+            angle = step * 0.01 + instance_id
+            joystick.axes[3] = 0.6 * math.cos(angle)
+            joystick.axes[4] = 0.6 * math.sin(angle)
+            events.append(FakeEvent(cm.pygame.JOYAXISMOTION, instance_id, axis=3, value=joystick.axes[3]))
+            events.append(FakeEvent(cm.pygame.JOYAXISMOTION, instance_id, axis=4, value=joystick.axes[4]))
+            if step % self.press_every == 0:
+                button = (step // self.press_every) % 4
+                down = not joystick.buttons[button]
+                joystick.buttons[button] = down
+                events.append(FakeEvent(cm.pygame.JOYBUTTONDOWN if down else cm.pygame.JOYBUTTONUP,
+                                        instance_id, button=button))
+        return events
+
+    def pump(self):
+        self._advance()
+
+    def get_events(self) -> list:
+        events = self._advance()
+        if self.queue:
+            events = super().get_events() + events
+        return events
+
+    def get_device_events(self) -> list:
+        self._advance()
+        return super().get_device_events()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def pygame():
+    """手柄事件类型取自 pygame，未安装时跳过相关测试"""
+    return pytest.importorskip("pygame")
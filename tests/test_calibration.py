@@ -0,0 +1,67 @@
+import json
+import os
+
+import controller_mapper as cm
+
+
+def test_save_replaces_file_atomically(tmp_path):
+    filename = tmp_path / "calibration.json"
+    store = cm.CalibrationStore(str(filename))
+    calibration = cm.AxisCalibration.default({"lt": -1.0, "rt": -1.0})
+    assert store.save("pad1", calibration)
+    assert store.save("pad2", calibration)
+    assert sorted(json.loads(filename.read_text(encoding="utf-8"))) == ["pad1", "pad2"]
+    assert os.listdir(tmp_path) == ["calibration.json"]
+    assert store.load("pad1").to_dict() == calibration.to_dict()
+
+
+def test_failed_save_keeps_previous_file(tmp_path, monkeypatch):
+    filename = tmp_path / "calibration.json"
+    store = cm.CalibrationStore(str(filename))
+    calibration = cm.AxisCalibration.default({})
+    assert store.save("pad1", calibration)
+    before = filename.read_bytes()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    assert not store.save("pad2", calibration)
+    assert filename.read_bytes() == before
+    assert os.listdir(tmp_path) == ["calibration.json"]
+
+
+def calibrated(noise=0.002):
+    return cm.AxisCalibration([0.0] * 6, [1.0] * 6, noise=[noise] * 6)
+
+
+def run_drift(calibration, values, dt=0.001):
+    raw = cm.array("d", bytes(6 * 8))
+    for value in values:
+        raw[cm.ControllerFrame.RIGHT_X] = value
+        calibration.track_drift(raw, dt)
+    return calibration.offset[cm.ControllerFrame.RIGHT_X]
+
+
+def test_resting_drift_is_tracked_up_to_the_limit():
+    calibration = calibrated()
+    offset = run_drift(calibration, [0.02] * 6000, dt=0.01)
+    assert 0.0 < offset <= 0.02
+
+    calibration = calibrated()
+    offset = run_drift(calibration, [0.09] * 6000, dt=0.01)
+    assert offset == cm.AxisCalibration.DRIFT_LIMIT
+
+
+def test_slow_deflection_is_not_learned():
+    calibration = calibrated()
+    # 两秒内缓慢推到漂移窗口边缘再回中
+    ramp = [0.095 * step / 2000 for step in range(2000)]
+    offset = run_drift(calibration, (ramp + ramp[::-1]) * 5)
+    assert offset == 0.0
+
+
+def test_short_rest_is_not_learned():
+    calibration = calibrated()
+    offset = run_drift(calibration, [0.03] * 400 + [0.0] * 400)
+    assert offset == 0.0
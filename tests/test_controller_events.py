@@ -0,0 +1,110 @@
+import controller_mapper as cm
+import pytest
+
+from fake_devices import FakeEvent, FakeJoystick, ScriptedBackend
+
+A, B = cm.BUTTON_BITS["A"], cm.BUTTON_BITS["B"]
+BIT_A, BIT_B = A.bit_length() - 1, B.bit_length() - 1
+
+
+@pytest.fixture
+def scripted(pygame):
+    """事件模式的手柄处理器，事件来源为脚本化队列"""
+    joystick = FakeJoystick(instance_id=3)
+    backend = ScriptedBackend([joystick])
+    handler = cm.ControllerHandler("event", event_source=backend.get_events,
+                                   calibration_store=cm.CalibrationStore(None), backend=backend)
+    assert handler.attach(backend.open(0))
+    return handler, backend
+
+
+def button(pygame, index, down, instance_id=3, **fields):
+    event_type = pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP
+    return FakeEvent(event_type, instance_id, button=index, **fields)
+
+
+def tick(handler, backend, events, dt=0.01):
+    backend.clock.advance(dt)
+    backend.queue.extend(events)
+    frame = handler.poll()
+    assert frame is not None
+    return frame
+
+
+def test_press_and_release_in_one_tick_are_both_kept(scripted, pygame):
+    handler, backend = scripted
+    frame = tick(handler, backend, [button(pygame, 0, True), button(pygame, 0, False)])
+    assert frame.pressed == A
+    assert frame.released == A
+    assert frame.buttons == 0
+    assert [(bit, down) for _, bit, down in frame.transitions] == [(BIT_A, True), (BIT_A, False)]
+
+
+def test_transitions_follow_event_order(scripted, pygame):
+    handler, backend = scripted
+    events = [button(pygame, 1, True), button(pygame, 0, True), button(pygame, 1, False)]
+    frame = tick(handler, backend, events)
+    assert [(bit, down) for _, bit, down in frame.transitions] == [
+        (BIT_B, True), (BIT_A, True), (BIT_B, False)]
+    assert frame.buttons == A
+
+
+def test_event_timestamps_are_kept(scripted, pygame):
+    handler, backend = scripted
+    start = backend.now()
+    events = [button(pygame, 0, True, timestamp=start + 0.002),
+              button(pygame, 0, False, timestamp=start + 0.006)]
+    frame = tick(handler, backend, events)
+    assert [timestamp for timestamp, _, _ in frame.transitions] == [start + 0.002, start + 0.006]
+    assert frame.timestamp == start + 0.01
+
+
+def test_events_without_timestamp_use_dequeue_time(scripted, pygame):
+    handler, backend = scripted
+    frame = tick(handler, backend, [button(pygame, 0, True)])
+    assert frame.transitions == [(frame.timestamp, BIT_A, True)]
+
+
+def test_held_button_has_no_new_edge(scripted, pygame):
+    handler, backend = scripted
+    assert tick(handler, backend, [button(pygame, 0, True)]).pressed == A
+
+    frame = tick(handler, backend, [])
+    assert frame.buttons == A
+    assert frame.pressed == frame.released == 0
+    assert frame.transitions == []
+
+    # 重复的按下事件不产生边沿
+    frame = tick(handler, backend, [button(pygame, 0, True)])
+    assert frame.pressed == 0
+    assert frame.transitions == []
+
+    frame = tick(handler, backend, [button(pygame, 0, False)])
+    assert frame.released == A
+    assert frame.buttons == 0
+
+
+def test_other_devices_and_unmapped_inputs_are_ignored(scripted, pygame):
+    handler, backend = scripted
+    events = [button(pygame, 0, True, instance_id=7),
+              button(pygame, 15, True),
+              FakeEvent(pygame.JOYHATMOTION, 3, hat=1, value=(0, 1))]
+    frame = tick(handler, backend, events)
+    assert frame.buttons == frame.pressed == 0
+    assert frame.transitions == []
+
+
+def test_hat_and_trigger_edges(scripted, pygame):
+    handler, backend = scripted
+    up = cm.BUTTON_BITS["DPadUp"]
+    lt = cm.BUTTON_BITS["LT"]
+    events = [FakeEvent(pygame.JOYHATMOTION, 3, hat=0, value=(0, 1)),
+              FakeEvent(pygame.JOYAXISMOTION, 3, axis=2, value=1.0)]
+    frame = tick(handler, backend, events)
+    assert frame.pressed == up | lt
+    assert [bit for _, bit, _ in frame.transitions] == [up.bit_length() - 1, lt.bit_length() - 1]
+
+    events = [FakeEvent(pygame.JOYAXISMOTION, 3, axis=2, value=-1.0)]
+    frame = tick(handler, backend, events)
+    assert frame.released == lt
+    assert frame.buttons == up
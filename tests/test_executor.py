@@ -0,0 +1,101 @@
+import controller_mapper as cm
+import pytest
+
+CLICK = ((cm.OUT_BUTTON, "left", True), (cm.OUT_BUTTON, "left", False))
+
+
+def full_queue(backpressure):
+    """执行线程未启动、容量为 2 的执行器，队列中依次是一次移动和一次点击"""
+    sink = cm.RecordingSink()
+    executor = cm.ActionExecutor(sink, max_queue=2, backpressure=backpressure)
+    assert executor.move(1, 0)
+    assert executor.submit_batch(CLICK)
+    assert executor.depth == 2
+    return executor, sink
+
+
+def test_merge_never_moves_input_ahead_of_a_click():
+    executor, sink = full_queue("merge")
+    assert executor.move(5, 0)
+    assert executor.move(0, 7)
+    assert executor.depth == 3
+    executor.flush()
+    assert sink.events == [(cm.OUT_MOVE, 1, 0), *CLICK, (cm.OUT_MOVE, 5, 7)]
+    assert executor.merged == 1
+    assert executor.dropped == 0
+
+
+@pytest.mark.parametrize("backpressure", ["drop", "merge"])
+def test_full_queue_rejects_other_actions(backpressure):
+    executor, sink = full_queue(backpressure)
+    assert not executor.submit_batch(CLICK)
+    assert executor.dropped == 1
+
+
+def test_drop_discards_moves_that_cannot_merge():
+    executor, sink = full_queue("drop")
+    assert not executor.move(5, 0)
+    executor.flush()
+    assert sink.events == [(cm.OUT_MOVE, 1, 0), *CLICK]
+
+
+@pytest.mark.parametrize("button, label", [("left", "左"), ("right", "右"), ("middle", "中")])
+def test_click_description_names_the_button(button, label):
+    assert cm.MouseClickAction(button).description == f"执行鼠标{label}键"
+
+
+BAD_KEY = 999
+
+
+class FailingSink(cm.RecordingSink):
+    """逐个注入的记录后端，注入 BAD_KEY 时失败"""
+
+    def _key(self, keycode, down):
+        if keycode == BAD_KEY:
+            raise OSError("invalid keycode")
+        super()._key(keycode, down)
+
+
+class AtomicFailingSink(FailingSink):
+    """整批原子注入的记录后端：批内有 BAD_KEY 时整批都不注入"""
+
+    atomic = True
+
+    def _send(self, events):
+        if any(op == cm.OUT_KEY and a == BAD_KEY for op, a, _ in events):
+            raise OSError("invalid keycode")
+        super()._send(events)
+
+
+def tap(keycode):
+    return ((cm.OUT_KEY, keycode, True), (cm.OUT_KEY, keycode, False))
+
+
+@pytest.mark.parametrize("sink_type", [FailingSink, AtomicFailingSink])
+def test_failed_batch_does_not_inject_twice(sink_type):
+    sink = sink_type()
+    errors = []
+    executor = cm.ActionExecutor(sink, on_error=lambda action, error: errors.append(action))
+    bad_action = cm.KeyPressAction("bad", BAD_KEY)
+    assert executor.submit_batch(CLICK)
+    assert executor.submit_batch(tap(30))
+    assert executor.submit_batch(bad_action.events, (bad_action,))
+    assert executor.submit_batch(tap(31))
+    executor.flush()
+    assert sink.events == [*CLICK, *tap(30), *tap(31)]
+    assert executor.executed == 3
+    assert executor.failed == 1
+    assert errors == [bad_action]
+
+
+def test_partial_failure_releases_keys_of_the_failed_item():
+    sink = FailingSink()
+    executor = cm.ActionExecutor(sink)
+    chord = ((cm.OUT_KEY, 29, True), (cm.OUT_KEY, BAD_KEY, True),
+             (cm.OUT_KEY, BAD_KEY, False), (cm.OUT_KEY, 29, False))
+    assert executor.move(3, 4)
+    assert executor.submit_batch(chord)
+    executor.flush()
+    assert sink.events == [(cm.OUT_MOVE, 3, 4), (cm.OUT_KEY, 29, True), (cm.OUT_KEY, 29, False)]
+    assert executor.executed == 1
+    assert executor.failed == 1
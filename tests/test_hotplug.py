@@ -0,0 +1,96 @@
+import controller_mapper as cm
+import pytest
+
+from fake_devices import FakeEvent, ScriptedBackend
+
+A = cm.BUTTON_BITS["A"]
+
+
+@pytest.fixture
+def engine(pygame):
+    """没有手柄的事件模式引擎，插拔和输入由脚本化后端产生，周期由测试调用 tick() 推进"""
+    backend = ScriptedBackend()
+    controller = cm.ControllerHandler("event", calibration_store=cm.CalibrationStore(None), backend=backend)
+    engine = cm.MappingEngine(controller, sink=cm.RecordingSink())
+    engine.check_controller_status()
+    yield engine
+    engine.mouse_motion.shutdown()
+
+
+def tick(engine):
+    engine.controller.backend.clock.advance(0.01)
+    engine.tick()
+
+
+def controller_updates(engine):
+    return [value for kind, value in engine.display_updates if kind == "controller"]
+
+
+def players(engine):
+    return {handler.player: handler.instance_id for handler in engine._players if handler.is_connected}
+
+
+def test_plug_and_unplug_update_status(engine):
+    backend = engine.controller.backend
+    assert controller_updates(engine) == [(False, None)]
+
+    joystick = backend.plug()
+    tick(engine)
+    assert engine.controller.is_connected
+    assert engine.controller.instance_id == joystick.instance_id
+    assert controller_updates(engine)[-1] == (True, joystick.get_name())
+
+    backend.unplug(joystick.instance_id)
+    tick(engine)
+    assert not engine.any_connected
+    assert engine.controller.joystick is None
+    assert controller_updates(engine)[-1] == (False, None)
+
+
+def test_replug_resets_state_and_redetects_device(engine, pygame):
+    backend = engine.controller.backend
+    handler = engine.controller
+    old = backend.plug()
+    tick(engine)
+    old.buttons[0] = True
+    backend.queue.append(FakeEvent(pygame.JOYBUTTONDOWN, old.instance_id, button=0))
+    engine.running = True
+    tick(engine)
+    assert handler.frame.buttons == A
+
+    # 按住时拔出，积压的旧事件不能带到新设备上
+    backend.unplug(old.instance_id)
+    backend.queue.append(FakeEvent(pygame.JOYBUTTONUP, old.instance_id, button=0))
+    new = backend.plug()
+    new.axes[2] = new.axes[5] = 0.0  # 扳机静止值与旧设备不同
+    tick(engine)
+
+    assert handler.instance_id == new.instance_id != old.instance_id
+    assert handler.frame.buttons == 0
+    assert handler.frame.pressed == handler.frame.released == 0
+    assert not handler.calibrated
+    assert handler.calibration.offset[cm.ControllerFrame.LT] == 0.0
+    assert handler.calibration.offset[cm.ControllerFrame.RT] == 0.0
+
+    tick(engine)
+    assert handler.frame.buttons == 0
+
+
+def test_slots_are_reused_and_rescan_keeps_them(engine):
+    backend = engine.controller.backend
+    first, second = backend.plug(), backend.plug()
+    tick(engine)
+    assert players(engine) == {0: first.instance_id, 1: second.instance_id}
+
+    backend.unplug(first.instance_id)
+    tick(engine)
+    assert players(engine) == {1: second.instance_id}
+
+    third = backend.plug()
+    tick(engine)
+    assert players(engine) == {0: third.instance_id, 1: second.instance_id}
+
+    # 完整重新枚举时仍在的设备保留原槽位
+    engine.check_controller_status()
+    assert players(engine) == {0: third.instance_id, 1: second.instance_id}
+    assert len(engine._players) == 2
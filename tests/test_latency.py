@@ -0,0 +1,73 @@
+import csv
+import json
+import time
+
+import controller_mapper as cm
+import pytest
+
+from fake_devices import FakeEvent, FakeJoystick, ScriptedBackend
+
+
+@pytest.fixture
+def engine(pygame):
+    """映射了 A、X 的事件模式引擎；时钟用 perf_counter，与执行器记录的时间戳一致"""
+    joystick = FakeJoystick()
+    backend = ScriptedBackend([joystick], clock=time.perf_counter)
+    controller = cm.ControllerHandler("event", calibration_store=cm.CalibrationStore(None), backend=backend)
+    engine = cm.MappingEngine(controller, sink=cm.RecordingSink())
+    engine.set_mapping("A", {"action": "mouse_left"})
+    engine.set_mapping("X", {"action": "keyboard", "key": "space"})
+    engine.check_controller_status()
+    engine.start_mapping()
+    yield engine
+    engine.mouse_motion.shutdown()
+
+
+def press(engine, pygame, index):
+    """按下并松开一个按键，每个边沿各运行一个周期，然后在当前线程执行排队的动作"""
+    backend = engine.controller.backend
+    joystick = backend.joysticks[0]
+    for down in (True, False):
+        joystick.buttons[index] = down
+        backend.queue.append(FakeEvent(pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP,
+                                       joystick.instance_id, button=index))
+        engine.tick()
+    engine.executor.flush()
+
+
+def test_latency_is_recorded_per_action_and_stage(engine, pygame):
+    press(engine, pygame, 0)
+    press(engine, pygame, 0)
+    press(engine, pygame, 2)
+    assert engine.sink.events[-2:] == [(cm.OUT_KEY, cm.linux_keycode("space"), True),
+                                       (cm.OUT_KEY, cm.linux_keycode("space"), False)]
+
+    stats = engine.latency_stats()
+    assert sorted(stats) == ["keyboard", "mouse_click"]
+    for kind, count in (("mouse_click", 2), ("keyboard", 1)):
+        assert [stats[kind][stage]["count"] for stage in cm.LatencyRecorder.STAGES] == [count] * 4
+        assert 0 <= stats[kind]["total"]["min_ms"] <= stats[kind]["total"]["max_ms"]
+
+    rows = engine.executor.latency.rows()
+    expected = (("keyboard", 1), ("mouse_click", 2))
+    assert [row[:3] for row in rows] == [[kind, stage, count] for kind, count in expected
+                                         for stage in cm.LatencyRecorder.STAGES]
+
+
+def test_dump_latency_round_trips(engine, pygame, tmp_path):
+    press(engine, pygame, 0)
+    press(engine, pygame, 2)
+    rows = engine.executor.latency.rows()
+
+    csv_file = tmp_path / "latency.csv"
+    engine.dump_latency(str(csv_file))
+    with open(csv_file, encoding="utf-8", newline="") as f:
+        table = list(csv.reader(f))
+    assert tuple(table[0]) == cm.LatencyRecorder.CSV_FIELDS
+    assert [row[:3] for row in table[1:]] == [[kind, stage, str(count)] for kind, stage, count, *_ in rows]
+    assert [[float(value) for value in row[3:]] for row in table[1:]] == [row[3:] for row in rows]
+
+    json_file = tmp_path / "latency.json"
+    engine.dump_latency(str(json_file))
+    with open(json_file, encoding="utf-8") as f:
+        assert json.load(f) == engine.latency_stats()
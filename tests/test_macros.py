@@ -0,0 +1,109 @@
+import threading
+import time
+
+import controller_mapper as cm
+import pytest
+
+KEY_A = cm.linux_keycode("a")
+PRESS = (cm.OUT_KEY, KEY_A, True)
+RELEASE = (cm.OUT_KEY, KEY_A, False)
+
+
+class LockCheckingExecutor:
+    """记录提交的批次；提交时不能持有调度器的锁"""
+
+    def __init__(self):
+        self.scheduler = None
+        self.batches = []
+
+    def submit_batch(self, events, actions=(), input_at=None):
+        assert not self.scheduler._condition._is_owned(), "持有调度器的锁时提交"
+        self.batches.append(tuple(events))
+        return True
+
+
+class BlockingExecutor(LockCheckingExecutor):
+    """第一次提交阻塞到 unblock 被设置（模拟队列已满的执行器）"""
+
+    def __init__(self):
+        super().__init__()
+        self.blocked = threading.Event()
+        self.unblock = threading.Event()
+
+    def submit_batch(self, events, actions=(), input_at=None):
+        if not self.blocked.is_set():
+            self.blocked.set()
+            assert self.unblock.wait(5)
+        return super().submit_batch(events, actions, input_at)
+
+
+@pytest.fixture
+def scheduler():
+    executor = LockCheckingExecutor()
+    scheduler = cm.MacroScheduler(executor)
+    executor.scheduler = scheduler
+    return scheduler
+
+
+@pytest.fixture
+def macro():
+    steps = (("key_down", "a"), ("wait", 1000), ("key_up", "a"))
+    return cm.MacroAction(steps, 1, cm.RecordingSink())
+
+
+def started(scheduler, macro, key=None):
+    """开始执行宏并注入第一批（按下 a）"""
+    scheduler.run(macro, key)
+    scheduler._run_due(time.perf_counter())
+    assert scheduler.executor.batches[-1] == (PRESS,)
+
+
+def test_cancel_releases_held_keys_outside_the_lock(scheduler, macro):
+    started(scheduler, macro)
+    assert scheduler.cancel(macro)
+    assert scheduler.executor.batches[-1] == (RELEASE,)
+    assert not scheduler.cancel(macro)
+
+
+def test_toggle_and_cancel_all_release_outside_the_lock(scheduler, macro):
+    started(scheduler, macro, "first")
+    assert not scheduler.toggle(macro, "first")
+    assert scheduler.executor.batches[-1] == (RELEASE,)
+
+    started(scheduler, macro, "first")
+    started(scheduler, macro, "second")
+    scheduler.cancel_all()
+    assert scheduler.executor.batches[-1] == (RELEASE, RELEASE)
+    assert scheduler.running == 0
+
+
+def test_restart_releases_before_the_new_run(scheduler, macro):
+    started(scheduler, macro)
+    scheduler.run(macro)
+    scheduler._run_due(time.perf_counter())
+    assert scheduler.executor.batches == [(PRESS,), (RELEASE,), (PRESS,)]
+    assert scheduler.running == 1
+
+
+def test_blocked_executor_does_not_block_callers(macro):
+    executor = BlockingExecutor()
+    scheduler = cm.MacroScheduler(executor)
+    executor.scheduler = scheduler
+    other = cm.MacroAction((("key_down", "b"), ("wait", 1000), ("key_up", "b")), 1, cm.RecordingSink())
+
+    scheduler.run(macro)
+    due = threading.Thread(target=scheduler._run_due, args=(time.perf_counter(),))
+    due.start()
+    try:
+        assert executor.blocked.wait(5)
+        # 调度线程阻塞在提交上时，其他线程的调用立即返回
+        started_at = time.perf_counter()
+        assert scheduler.toggle(other)
+        assert scheduler.cancel(macro)
+        assert time.perf_counter() - started_at < 0.1
+        assert executor.batches == []
+    finally:
+        executor.unblock.set()
+        due.join(5)
+    # 取消时的松开由正在提交的线程接着提交，仍排在按下之后
+    assert executor.batches == [(PRESS,), (RELEASE,)]
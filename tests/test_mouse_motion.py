@@ -0,0 +1,66 @@
+import threading
+import tracemalloc
+
+import controller_mapper as cm
+import pytest
+
+from fake_devices import FakeJoystick, ScriptedBackend
+
+
+def total_displacement(rate_hz, x_axis, y_axis, seconds=1.0):
+    """以虚拟时钟按固定频率推进 seconds 秒，返回光标的总位移"""
+    sink = cm.RecordingSink()
+    executor = cm.ActionExecutor(sink)
+    motion = cm.MouseMotion(executor, rate_hz, threaded=False)
+    motion.set_velocity(x_axis, y_axis)
+    for step in range(int(round(seconds * rate_hz)) + 1):
+        motion.main_loop_iteration(step / rate_hz)
+        executor.flush()
+    return sink.position()
+
+
+@pytest.mark.parametrize("x_axis, y_axis", [(0.5, -0.25), (1.0, 0.0), (-0.3, 0.8)])
+def test_displacement_does_not_depend_on_rate(x_axis, y_axis):
+    slow = total_displacement(60, x_axis, y_axis)
+    fast = total_displacement(1000, x_axis, y_axis)
+    assert slow != (0, 0)
+    # 亚像素余量最多相差一个像素
+    assert abs(slow[0] - fast[0]) <= 1
+    assert abs(slow[1] - fast[1]) <= 1
+
+
+def motion_workers():
+    return sum(1 for thread in threading.enumerate() if thread.name == "MouseMotion")
+
+
+def test_start_stop_soak_keeps_threads_and_memory_flat():
+    backend = ScriptedBackend([FakeJoystick()])
+    controller = cm.ControllerHandler("event", calibration_store=cm.CalibrationStore(None), backend=backend)
+    engine = cm.MappingEngine(controller, sink=cm.RecordingSink())
+    assert controller.attach(backend.open(0))
+    engine.executor.start()
+    try:
+        engine.start_mapping()
+        engine.stop_mapping()
+        threads = threading.active_count()
+        assert motion_workers() == 1
+
+        tracemalloc.start()
+        try:
+            for cycle in range(2000):
+                engine.start_mapping()
+                engine.mouse_motion.set_velocity(0.5, -0.5)
+                engine.stop_mapping()
+                if cycle == 100:
+                    baseline = tracemalloc.get_traced_memory()[0]
+            grown = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+
+        assert threading.active_count() == threads
+        assert motion_workers() == 1
+        assert grown < 64 * 1024
+    finally:
+        engine.mouse_motion.shutdown()
+        engine.executor.stop()
+    assert motion_workers() == 0
@@ -0,0 +1,61 @@
+import controller_mapper as cm
+import pytest
+
+from fake_devices import FakeEvent, FakeJoystick, ScriptedBackend
+
+CONFIG = {
+    "A": {"action": "mouse_left"},
+    "X": {"action": "keyboard", "key": "space"},
+}
+
+
+def record_session(pygame, filename, input_mode):
+    """用脚本化手柄录制一段输入：按住 LT 推右摇杆（移动鼠标）、按 A、按住 X、松开摇杆"""
+    joystick = FakeJoystick()
+    backend = ScriptedBackend([joystick])
+    handler = cm.ControllerHandler(input_mode, event_source=backend.get_events,
+                                   calibration_store=cm.CalibrationStore(None), backend=backend)
+    assert handler.attach(backend.open(0))
+    handler.start_recording(filename)
+
+    def axis(index, value):
+        joystick.axes[index] = value
+        return FakeEvent(pygame.JOYAXISMOTION, joystick.instance_id, axis=index, value=value)
+
+    def button(index, down):
+        joystick.buttons[index] = down
+        return FakeEvent(pygame.JOYBUTTONDOWN if down else pygame.JOYBUTTONUP,
+                         joystick.instance_id, button=index)
+
+    # 每一步在执行时才修改手柄状态，轮询模式读取的是当时的实际状态
+    script = [
+        lambda: [axis(2, 1.0), axis(3, 0.8), axis(4, -0.4)],
+        lambda: [],
+        lambda: [button(0, True)],
+        lambda: [button(0, False), button(2, True)],
+        lambda: [axis(3, 0.0)],
+        lambda: [button(2, False)],
+        lambda: [axis(4, 0.0), axis(2, -1.0)],
+        lambda: [],
+    ]
+    for step in script:
+        backend.queue.extend(step())
+        for _ in range(5):
+            backend.clock.advance(0.004)
+            assert handler.poll() is not None
+    handler.stop_recording()
+
+
+@pytest.mark.parametrize("input_mode", cm.ControllerHandler.INPUT_MODES)
+def test_replay_is_deterministic(pygame, tmp_path, input_mode):
+    filename = str(tmp_path / "session.rec")
+    record_session(pygame, filename, input_mode)
+    with cm.InputRecording(filename) as recording:
+        assert len(recording) > 0
+
+    first = cm.replay_recording(filename, CONFIG, input_mode).events
+    second = cm.replay_recording(filename, CONFIG, input_mode).events
+    assert first == second
+    assert (cm.OUT_BUTTON, "left", True) in first
+    assert (cm.OUT_KEY, cm.linux_keycode("space"), True) in first
+    assert any(op == cm.OUT_MOVE for op, _, _ in first)
@@ -0,0 +1,87 @@
+import controller_mapper as cm
+import pytest
+
+RATE = 100
+PERIOD = 1.0 / RATE
+
+
+class FakeTime:
+    """代替 time 模块的虚拟时钟：sleep 准确推进时间，每次读取 perf_counter 推进 1µs（让忙等能结束）"""
+
+    STEP = 1e-6
+
+    def __init__(self, start=100.0):
+        self.now = start
+
+    def perf_counter(self):
+        self.now += self.STEP
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(cm, "time", fake)
+    return fake
+
+
+def test_on_time_waits_keep_the_rate(clock):
+    scheduler = cm.PeriodicScheduler(RATE)
+    start = clock.now
+    for _ in range(50):
+        assert scheduler.wait()
+    assert clock.now == pytest.approx(start + 50 * PERIOD, abs=1e-5)
+
+    stats = scheduler.stats()
+    assert stats["ticks"] == 50
+    assert stats["missed"] == 0
+    assert stats["achieved_hz"] == pytest.approx(RATE, rel=1e-3)
+    assert stats["jitter_max_ms"] < 0.01
+
+
+def test_late_wait_counts_a_miss_and_catches_up(clock):
+    scheduler = cm.PeriodicScheduler(RATE)
+    assert scheduler.wait()
+    deadline = clock.now
+    clock.now += PERIOD + 0.003  # 处理耗时超过一个周期，错过下一个截止时间 3ms
+    assert not scheduler.wait()
+    assert scheduler.missed == 1
+    # 落后不到一个周期时不重新对齐，下一个截止时间仍在原来的节拍上
+    assert scheduler.wait()
+    assert clock.now == pytest.approx(deadline + 2 * PERIOD, abs=1e-5)
+    assert scheduler.missed == 1
+
+
+def test_stall_of_several_periods_realigns(clock):
+    scheduler = cm.PeriodicScheduler(RATE)
+    assert scheduler.wait()
+    clock.now += 3.5 * PERIOD  # 卡顿了好几个周期
+    stalled_until = clock.now
+    assert not scheduler.wait()
+    assert scheduler.missed == 1
+    # 重新对齐到当前时间：之后按时唤醒，不连续补帧
+    for tick in range(1, 4):
+        assert scheduler.wait()
+        assert clock.now == pytest.approx(stalled_until + tick * PERIOD, abs=1e-5)
+    assert scheduler.missed == 1
+    assert scheduler.ticks == 5
+
+
+def test_stats_report_jitter_percentiles(clock):
+    scheduler = cm.PeriodicScheduler(RATE)
+    for tick in range(101):
+        if tick == 50:
+            clock.now += PERIOD + 0.003  # 唤醒晚 3ms，前后两个周期分别长、短 3ms
+        scheduler.wait()
+
+    stats = scheduler.stats()
+    assert stats["ticks"] == 101
+    assert stats["missed"] == 1
+    assert stats["jitter_p50_ms"] == pytest.approx(0, abs=0.01)
+    assert stats["jitter_p90_ms"] == pytest.approx(0, abs=0.01)
+    assert stats["jitter_p99_ms"] == pytest.approx(3, abs=0.01)
+    assert stats["jitter_max_ms"] == pytest.approx(3, abs=0.01)
+    assert stats["achieved_hz"] == pytest.approx(RATE, rel=1e-3)